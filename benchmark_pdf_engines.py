@@ -0,0 +1,77 @@
+"""
+Benchmark de los motores del layout profesional: 'platypus' (Tables) vs 'grid' (pdf_grid)
+Maqueta el mismo catálogo sintético con ambos y compara tiempos, páginas y texto.
+Uso: python benchmark_pdf_engines.py [productos ...]
+"""
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from reportlab.platypus import SimpleDocTemplate
+from reportlab.lib.pagesizes import A4
+
+from image_placeholder import PlaceholderImage
+from pdf_render import HAS_PYPDF, LAYOUT_ENGINES, PRO_MARGINS, draw_footer, pro_image, product_story
+
+LINES = ['ELECTRO', 'HOGAR', 'MODA', 'DEPORTES', 'JUGUETES', 'AUTOMOTRIZ', 'BELLEZA', 'SALUD']
+FAMILIES = ['GENERAL', 'PREMIUM', 'BASICO', 'OFERTAS']
+
+
+def make_catalog(n, seed=7):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Línea': rng.choice(LINES, n),
+        'Familia': rng.choice(FAMILIES, n),
+        'Grupo': 'GENERAL',
+        'Producto': [f"Producto {i} Gran Calidad" + " Edición Especial" * int(rng.integers(0, 3)) for i in range(n)],
+        'Descripción': [f"Descripción detallada del producto {i} con características premium y alto rendimiento." for i in range(n)],
+        'Unidad': rng.choice(['UND', 'CAJA x 12', 'KG'], n),
+        'Precio': rng.uniform(10, 2000, n).round(2),
+        'ImagenURL': None
+    })
+
+
+def render(df, engine, get_image):
+    """Returns (PDF bytes, segundos de maquetación + render)"""
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, **PRO_MARGINS)
+    footer = lambda canv, _doc: draw_footer(canv, 'Benchmark')
+    doc.build(product_story(engine, df, 'S/', get_image), onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue(), time.perf_counter() - start
+
+
+def page_texts(pdf):
+    if not HAS_PYPDF:
+        return None
+    from pypdf import PdfReader
+    # Words per page: the extractor's line breaks depend on how each engine groups text objects
+    return [page.extract_text().split() for page in PdfReader(io.BytesIO(pdf)).pages]
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [200, 1000, 2000]
+
+    def encode(img):
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=85)
+        return buffer.getvalue()
+
+    placeholder = PlaceholderImage().encoded('pdf', encode, (400, 400))
+    get_image = lambda url: pro_image(*placeholder, key='placeholder')
+
+    print(f"{'Productos':>10} | " + " | ".join(f"{engine:>10}" for engine in LAYOUT_ENGINES) + " | Aceleración | Páginas | Texto igual")
+    for n in sizes:
+        df = make_catalog(n)
+        results = {engine: render(df, engine, get_image) for engine in LAYOUT_ENGINES}
+        (pdf_a, time_a), (pdf_b, time_b) = results['platypus'], results['grid']
+        texts_a, texts_b = page_texts(pdf_a), page_texts(pdf_b)
+        pages = f"{len(texts_a)}/{len(texts_b)}" if texts_a is not None else "-"
+        same = ("sí" if texts_a == texts_b else "NO") if texts_a is not None else "-"
+        print(f"{n:>10} | {time_a:>9.2f}s | {time_b:>9.2f}s | {time_a / time_b:>10.1f}x | {pages:>7} | {same}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Image Bundle for CatalogPro
+Imágenes de producto desde un ZIP subido junto al Excel, o pegadas en el propio
+.xlsx (que también es un ZIP): sin red y sin extraer a disco
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+BUNDLE_SCHEME = 'zip://'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+_BUNDLE_ID = re.compile(r'[0-9a-f]{16}')
+
+
+def is_bundle_url(url):
+    return isinstance(url, str) and url.startswith(BUNDLE_SCHEME)
+
+
+def bundle_url(bundle_id, member):
+    """zip://<bundle_id>/<miembro>: la clave de caché queda ligada al contenido del ZIP"""
+    return f"{BUNDLE_SCHEME}{bundle_id}/{member}"
+
+
+def parse_bundle_url(url):
+    """Returns (bundle_id, member)"""
+    bundle_id, _, member = url[len(BUNDLE_SCHEME):].partition('/')
+    return bundle_id, member
+
+
+_NS = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'r': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'rel': 'http://schemas.openxmlformats.org/package/2006/relationships',
+    'xdr': 'http://schemas.openxmlformats.org/drawingml/2006/spreadsheetDrawing',
+    'a': 'http://schemas.openxmlformats.org/drawingml/2006/main',
+}
+_ANCHORS = {f"{{{_NS['xdr']}}}twoCellAnchor", f"{{{_NS['xdr']}}}oneCellAnchor"}
+
+
+def _part_rels(zf, part):
+    """Relaciones de una parte OOXML: {rId: (tipo, ruta absoluta en el paquete)}"""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, '_rels', f"{name}.rels")
+    if rels_path not in zf.NameToInfo:
+        return {}
+    rels = {}
+    with zf.open(rels_path) as f:
+        for rel in ET.parse(f).getroot().iter(f"{{{_NS['rel']}}}Relationship"):
+            target = rel.get('Target', '')
+            path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join(folder, target))
+            rels[rel.get('Id')] = (rel.get('Type', '').rsplit('/', 1)[-1], path)
+    return rels
+
+
+def sheet_image_anchors(zf):
+    """
+    Imágenes pegadas (ancladas) en la primera hoja de un .xlsx abierto como ZipFile,
+    la que lee pd.read_excel. Returns {fila (0 = encabezado): miembro en xl/media}.
+    Con varias imágenes en una fila gana la de la columna más a la izquierda.
+    Los dibujos se recorren con iterparse: la memoria no crece con el tamaño del libro.
+    """
+    workbook = 'xl/workbook.xml'
+    if workbook not in zf.NameToInfo:
+        return {}
+    with zf.open(workbook) as f:
+        sheet = ET.parse(f).getroot().find('main:sheets/main:sheet', _NS)
+    if sheet is None:
+        return {}
+    sheet_part = _part_rels(zf, workbook).get(sheet.get(f"{{{_NS['r']}}}id"), (None, None))[1]
+    if sheet_part not in zf.NameToInfo:
+        return {}
+
+    anchors = {}
+    for rel_type, drawing in _part_rels(zf, sheet_part).values():
+        if rel_type != 'drawing' or drawing not in zf.NameToInfo:
+            continue
+        media = _part_rels(zf, drawing)
+        with zf.open(drawing) as f:
+            for _, elem in ET.iterparse(f):
+                if elem.tag not in _ANCHORS:
+                    continue
+                row = elem.findtext('xdr:from/xdr:row', namespaces=_NS)
+                col = elem.findtext('xdr:from/xdr:col', namespaces=_NS)
+                blip = elem.find('.//a:blip', _NS)
+                elem.clear()
+                if row is None or blip is None:
+                    continue
+                target = media.get(blip.get(f"{{{_NS['r']}}}embed"), (None, None))[1]
+                if target is None or not target.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                row, col = int(row), int(col or 0)
+                if row not in anchors or col < anchors[row][0]:
+                    anchors[row] = (col, target)
+    return {row: member for row, (_, member) in anchors.items()}
+
+
+def _normalize(name):
+    return name.replace('\\', '/').strip().strip('/').lower()
+
+
+class ImageBundle:
+    """
+    ZIP de imágenes abierto en modo lectura. Resuelve valores de ImagenURL
+    (ruta, nombre de archivo o nombre sin extensión, sin distinguir mayúsculas)
+    a miembros del ZIP y los lee bajo demanda.
+    """
+
+    def __init__(self, path, bundle_id):
+        self.path = path
+        self.bundle_id = bundle_id
+        self._zip = zipfile.ZipFile(path)
+        self._names = {}
+        paths, basenames, stems = {}, {}, {}
+        for info in self._zip.infolist():
+            name = info.filename
+            base = posixpath.basename(name.replace('\\', '/'))
+            if info.is_dir() or name.startswith('__MACOSX/') or base.startswith('.'):
+                continue
+            if not base.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            paths.setdefault(_normalize(name), name)
+            basenames.setdefault(base.lower(), name)
+            stems.setdefault(os.path.splitext(base)[0].lower(), name)
+        # Full path wins over file name, file name over bare stem
+        for names in (stems, basenames, paths):
+            self._names.update(names)
+        self._members = set(paths.values())
+
+    def __len__(self):
+        return len(self._members)
+
+    def resolve(self, value):
+        """Miembro del ZIP para un valor de ImagenURL, o None. Las URLs http(s) y zip:// no se tocan"""
+        if not isinstance(value, str) or not value.strip():
+            return None
+        key = _normalize(value)
+        if key.startswith(('http:', 'https:', BUNDLE_SCHEME)):
+            return None
+        return self._names.get(key) or self._names.get(posixpath.basename(key))
+
+    def url_for(self, value):
+        """zip:// del valor si está en el ZIP, o None"""
+        member = self.resolve(value)
+        return bundle_url(self.bundle_id, member) if member is not None else None
+
+    def read(self, member, max_bytes=None):
+        """
+        Bytes del miembro, leídos en streaming con tope (el tamaño declarado en el ZIP no es de fiar).
+        Raises: KeyError si no existe, ValueError si supera max_bytes
+        """
+        if member not in self._members:
+            raise KeyError(f"{member} no está en el ZIP")
+        with self._zip.open(member) as f:
+            data = f.read(-1 if max_bytes is None else max_bytes + 1)
+        if max_bytes is not None and len(data) > max_bytes:
+            raise ValueError(f"Imagen demasiado grande (> {max_bytes} bytes)")
+        return data
+
+    def embedded_images(self, anchors=None):
+        """
+        Para un .xlsx guardado como bundle: {fila: URL zip://} de sus imágenes ancladas.
+        anchors: resultado de sheet_image_anchors si ya se calculó (evita recorrer los dibujos otra vez)
+        """
+        if anchors is None:
+            anchors = sheet_image_anchors(self._zip)
+        return {row: bundle_url(self.bundle_id, member) for row, member in anchors.items()
+                if member in self._members}
+
+    def close(self):
+        self._zip.close()
+
+
+class BundleRegistry:
+    """
+    ZIPs subidos, guardados en disco con el hash de su contenido como id y
+    abiertos una sola vez por proceso. Conserva los max_bundles más recientes.
+    """
+
+    def __init__(self, directory, max_bundles=20):
+        self.directory = directory
+        self.max_bundles = max_bundles
+        self._bundles = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, bundle_id):
+        return os.path.join(self.directory, f"{bundle_id}.zip")
+
+    def add(self, fileobj):
+        """
+        Guarda un ZIP (file-like) y lo abre. Returns ImageBundle
+        Raises: zipfile.BadZipFile si no es un ZIP válido
+        """
+        digest = hashlib.sha1()
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: fileobj.read(1024 * 1024), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            bundle_id = digest.hexdigest()[:16]
+            path = self._path(bundle_id)
+            with zipfile.ZipFile(tmp_path):
+                pass
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                os.utime(path)
+            else:
+                os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._prune(keep=bundle_id)
+        return self.get(bundle_id)
+
+    def get(self, bundle_id):
+        """ImageBundle por id, o None si no existe"""
+        if not _BUNDLE_ID.fullmatch(bundle_id or ''):
+            return None
+        with self._lock:
+            bundle = self._bundles.get(bundle_id)
+            if bundle is None and os.path.exists(self._path(bundle_id)):
+                bundle = self._bundles[bundle_id] = ImageBundle(self._path(bundle_id), bundle_id)
+            return bundle
+
+    def read(self, url, max_bytes=None):
+        """
+        Bytes de una URL zip://
+        Raises: FileNotFoundError si el ZIP ya no existe, KeyError / ValueError como ImageBundle.read
+        """
+        bundle_id, member = parse_bundle_url(url)
+        bundle = self.get(bundle_id)
+        if bundle is None:
+            raise FileNotFoundError(f"ZIP de imágenes {bundle_id} no disponible")
+        return bundle.read(member, max_bytes)
+
+    def _prune(self, keep):
+        """Borra los ZIPs más antiguos por encima de max_bundles (sus imágenes siguen en el caché)"""
+        paths = [os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith('.zip')]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_bundles:]:
+            bundle_id = os.path.basename(path)[:-len('.zip')]
+            if bundle_id == keep:
+                continue
+            with self._lock:
+                bundle = self._bundles.pop(bundle_id, None)
+            if bundle is not None:
+                bundle.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,337 @@
+"""
+Image Cache for CatalogPro
+Capas de caché de imágenes acotadas por bytes
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+def estimate_size(value):
+    """Bytes aproximados que ocupa un valor cacheado"""
+    if hasattr(value, 'getbands') and hasattr(value, 'size'):
+        # PIL Image: bitmap decodificado (ancho x alto x bandas)
+        width, height = value.size
+        return width * height * len(value.getbands())
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class ByteLRUCache:
+    """
+    Caché LRU thread-safe acotada por bytes, no por número de entradas.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.RLock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes=None):
+        """Inserta y expulsa LRU hasta cumplir ambos límites. Returns False si no cabe"""
+        nbytes = estimate_size(value) if nbytes is None else nbytes
+        with self._lock:
+            self._remove(key)
+            if nbytes > self.max_bytes:
+                self.rejected += 1
+                return False
+            while self._data and self.current_bytes + nbytes > self.max_bytes:
+                self._evict_oldest()
+            self._data[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            self._remove(key)
+            return entry[0] if entry else default
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._data):
+                self._remove(key)
+
+    def _evict_oldest(self):
+        key = next(iter(self._data))
+        self._remove(key)
+        self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        self.current_bytes -= entry[1]
+
+    def stats(self):
+        """Contadores de la caché para el reporte de exportación"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'rejected': self.rejected,
+            }
+
+
+class SharedImageCache(ByteLRUCache):
+    """
+    Caché única por proceso compartida por todas las sesiones de Streamlit.
+    Cada entrada se atribuye a la sesión que la insertó (contabilidad por sesión)
+    y cada sesión tiene su propio tope de bytes dentro del límite global.
+    La contabilidad de una sesión sin entradas y sin uso durante session_ttl segundos se descarta.
+    """
+
+    def __init__(self, max_bytes, per_session_bytes, session_ttl=3600):
+        super().__init__(max_bytes)
+        self.per_session_bytes = per_session_bytes
+        self.session_ttl = session_ttl
+        self._owner_of = {}  # key -> session_id
+        self._sessions = {}  # session_id -> accounting
+        self._next_expiry = 0.0
+
+    def _session(self, session_id):
+        now = time.monotonic()
+        if now >= self._next_expiry:
+            self._expire_sessions(now)
+        info = self._sessions.get(session_id)
+        if info is None:
+            info = {'label': session_id, 'keys': OrderedDict(), 'bytes': 0,
+                    'hits': 0, 'misses': 0, 'evictions': 0}
+            self._sessions[session_id] = info
+        info['last_used'] = now
+        return info
+
+    def _expire_sessions(self, now):
+        # Sessions end without telling us: drop idle ones once eviction has emptied them
+        for session_id in [sid for sid, info in self._sessions.items()
+                           if not info['keys'] and now - info['last_used'] >= self.session_ttl]:
+            del self._sessions[session_id]
+        self._next_expiry = now + min(60, self.session_ttl)
+
+    def set_session_label(self, session_id, label):
+        with self._lock:
+            self._session(session_id)['label'] = label
+
+    def get(self, key, default=None, session_id=None):
+        with self._lock:
+            value = super().get(key, default)
+            if session_id is not None:
+                info = self._session(session_id)
+                if key in self._data:
+                    info['hits'] += 1
+                    owner = self._owner_of.get(key)
+                    if owner is not None:
+                        self._sessions[owner]['keys'].move_to_end(key)
+                else:
+                    info['misses'] += 1
+            return value
+
+    def put(self, key, value, nbytes=None, session_id=None):
+        nbytes = estimate_size(value) if nbytes is None else nbytes
+        with self._lock:
+            self._remove(key)
+            if session_id is not None:
+                if nbytes > self.per_session_bytes:
+                    self.rejected += 1
+                    return False
+                info = self._session(session_id)
+                # Per-session cap: a session only evicts its own entries
+                while info['keys'] and info['bytes'] + nbytes > self.per_session_bytes:
+                    self._remove(next(iter(info['keys'])))
+                    info['evictions'] += 1
+                    self.evictions += 1
+            if not super().put(key, value, nbytes):
+                return False
+            if session_id is not None:
+                self._owner_of[key] = session_id
+                info['keys'][key] = nbytes
+                info['bytes'] += nbytes
+            return True
+
+    def _remove(self, key):
+        super()._remove(key)
+        owner = self._owner_of.pop(key, None)
+        if owner is not None:
+            info = self._sessions[owner]
+            info['bytes'] -= info['keys'].pop(key, 0)
+
+    def discard_prefix(self, prefix):
+        """Quita las entradas cuya clave empieza por prefix, de cualquier sesión. Returns quitadas"""
+        with self._lock:
+            keys = [key for key in self._data if isinstance(key, str) and key.startswith(prefix)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear_session(self, session_id):
+        """Libera solo las entradas atribuidas a una sesión"""
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info:
+                for key in list(info['keys']):
+                    self._remove(key)
+
+    def session_stats(self, session_id):
+        with self._lock:
+            info = self._session(session_id)
+            lookups = info['hits'] + info['misses']
+            return {
+                'entries': len(info['keys']),
+                'bytes': info['bytes'],
+                'max_bytes': self.per_session_bytes,
+                'hits': info['hits'],
+                'misses': info['misses'],
+                'hit_ratio': round(info['hits'] / lookups, 3) if lookups else 0.0,
+                'evictions': info['evictions'],
+                'process_bytes': self.current_bytes,
+                'process_max_bytes': self.max_bytes,
+            }
+
+    def usage_by_session(self):
+        """Uso de memoria por sesión (panel de administración)"""
+        with self._lock:
+            self._expire_sessions(time.monotonic())
+            return [
+                {'session_id': session_id, 'label': info['label'], 'entries': len(info['keys']),
+                 'bytes': info['bytes'], 'hits': info['hits'], 'misses': info['misses'],
+                 'evictions': info['evictions']}
+                for session_id, info in self._sessions.items()
+            ]
+
+
+class SessionCacheView:
+    """Vista de SharedImageCache ligada a una sesión (misma interfaz que ByteLRUCache)"""
+
+    def __init__(self, shared_cache, session_id, label=None):
+        self.shared = shared_cache
+        self.session_id = session_id
+        if label:
+            shared_cache.set_session_label(session_id, label)
+
+    def __contains__(self, key):
+        return key in self.shared
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.put(key, value)
+
+    def get(self, key, default=None):
+        return self.shared.get(key, default, session_id=self.session_id)
+
+    def put(self, key, value, nbytes=None):
+        return self.shared.put(key, value, nbytes, session_id=self.session_id)
+
+    def clear(self):
+        self.shared.clear_session(self.session_id)
+
+    def discard_prefix(self, prefix):
+        return self.shared.discard_prefix(prefix)
+
+    @property
+    def current_bytes(self):
+        return self.shared.session_stats(self.session_id)['bytes']
+
+    def stats(self):
+        return self.shared.session_stats(self.session_id)
+
+
+class SingleFlight:
+    """
+    Coalescencia de peticiones concurrentes: para cada clave solo una llamada
+    (el líder) hace el trabajo; las demás esperan el mismo Future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future
+        self.leaders = 0
+        self.coalesced = 0
+
+    def begin(self, key):
+        """Returns (future, is_leader). El líder debe llamar a finish()"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def finish(self, key, future, result=None, error=None):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        Ejecuta fn una sola vez por clave en vuelo. Returns (result, shared)
+        timeout: espera máxima de los seguidores (concurrent.futures.TimeoutError)
+        """
+        future, is_leader = self.begin(key)
+        if not is_leader:
+            return future.result(timeout), True
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self.finish(key, future, error=e)
+            raise
+        self.finish(key, future, result=result)
+        return result, False
+
+    def stats(self):
+        with self._lock:
+            return {'leaders': self.leaders, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
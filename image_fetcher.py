@@ -0,0 +1,758 @@
+"""
+Image Fetcher for CatalogPro
+Motor HTTP compartido para la descarga de imágenes de productos
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Modo asyncio opcional: si aiohttp no está instalado se usa el pool de hilos
+try:
+    import aiohttp
+    HAS_AIOHTTP = True
+except ImportError:
+    HAS_AIOHTTP = False
+
+DEFAULT_MAX_BYTES = 15 * 1024 * 1024 # Tope por imagen descargada
+CHUNK_SIZE = 64 * 1024
+CONNECT_TIMEOUT = 3.05 # Un host que no acepta la conexión falla rápido
+READ_TIMEOUT = 10 # Máximo sin recibir bytes una vez conectado
+DEFAULT_RETRIES = 2 # Reintentos para errores transitorios (429, 5xx, timeouts, conexión)
+RETRY_BASE_DELAY = 0.25
+RETRY_MAX_DELAY = 8.0
+
+
+class ImageTooLargeError(ValueError):
+    """La imagen supera el tope de bytes configurado"""
+
+
+class ImageSkippedError(Exception):
+    """URL omitida sin red: caché negativa o circuito del host abierto"""
+
+
+class ImageDeadlineError(ImageSkippedError):
+    """Se agotó el tiempo de la fase de imágenes de la exportación"""
+
+    def __init__(self, message='deadline'):
+        super().__init__(message)
+
+
+class ImageNotModified(Exception):
+    """Respuesta 304 a una petición condicional: la copia en caché sigue vigente"""
+
+    def __init__(self, validators=None):
+        super().__init__("304 Not Modified")
+        self.validators = validators or {}
+
+
+# FIX: User-Agent to avoid 403 blocks
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class PooledImageFetcher:
+    """
+    Sesión HTTP compartida y thread-safe con keep-alive por host.
+    Reutiliza conexiones TCP/TLS entre hilos en lugar de abrir una por imagen.
+    """
+
+    def __init__(self, pool_size=20, max_hosts=32, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), limiter=None, retries=DEFAULT_RETRIES):
+        self.timeout = timeout
+        self.retries = retries
+        self.max_hosts = max_hosts
+        # In-flight requests per host are tuned at runtime (AIMD) instead of fixed per customer
+        self.limiter = limiter or AdaptiveLimiter()
+        self.pool_size = 0
+        self._lock = threading.Lock()
+        # Contadores de pools ya descartados (host expulsado o pool redimensionado)
+        self._retired = {'requests': 0, 'new_connections': 0}
+        self._retried = 0
+        self._session = requests.Session()
+        self._session.headers.update(DEFAULT_HEADERS)
+        self.ensure_pool_size(pool_size)
+
+    def ensure_pool_size(self, pool_size):
+        """Amplía el pool por host para que coincida con el número de workers"""
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+            old_adapter = getattr(self, '_adapter', None)
+            adapter = HTTPAdapter(pool_connections=self.max_hosts, pool_maxsize=pool_size, max_retries=0)
+            # Keep stats of pools evicted from the LRU container
+            adapter.poolmanager.pools.dispose_func = self._retire_pool
+            self._session.mount('http://', adapter)
+            self._session.mount('https://', adapter)
+            self._adapter = adapter
+            self.pool_size = pool_size
+        if old_adapter is not None:
+            # In-flight requests keep their own connection; idle ones are released here
+            for pool in self._live_pools(old_adapter):
+                self._retire_pool(pool)
+
+    def _retire_pool(self, pool):
+        with self._lock:
+            self._retired['requests'] += pool.num_requests
+            self._retired['new_connections'] += pool.num_connections
+        pool.close()
+
+    @staticmethod
+    def _live_pools(adapter):
+        pools = adapter.poolmanager.pools
+        result = []
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                result.append(pool)
+        return result
+
+    def get(self, url, **kwargs):
+        """GET compartido; mismos argumentos que requests.get"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self._session.get(str(url), **kwargs)
+
+    def get_bytes(self, url, max_bytes=DEFAULT_MAX_BYTES, **kwargs):
+        """
+        Descarga el cuerpo en streaming, sin pasar de max_bytes.
+        Raises: requests.HTTPError, ImageTooLargeError
+        """
+        return self.fetch(url, max_bytes, **kwargs)[0]
+
+    def fetch(self, url, max_bytes=DEFAULT_MAX_BYTES, validators=None, retries=None, deadline=None, **kwargs):
+        """
+        Como get_bytes, pero condicional si se pasan validators (ETag / Last-Modified).
+        Reintenta errores transitorios con backoff exponencial + jitter (respeta Retry-After).
+        deadline: instante time.monotonic() tras el cual no se espera más (fase de imágenes).
+        Returns: (content, validators de la respuesta)
+        Raises: ImageNotModified (304), ImageDeadlineError, requests.HTTPError, ImageTooLargeError
+        """
+        headers = dict(kwargs.pop('headers', None) or {})
+        headers.update(conditional_headers(validators))
+        retries = self.retries if retries is None else retries
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_once(url, max_bytes, validators, headers, deadline, **kwargs)
+            except (ImageNotModified, ImageSkippedError):
+                raise
+            except Exception as e:
+                delay = retry_delay(e, attempt, retries, deadline)
+                if delay is None:
+                    raise
+            with self._lock:
+                self._retried += 1
+            time.sleep(delay)
+            attempt += 1
+
+    def _fetch_once(self, url, max_bytes, validators, headers, deadline, **kwargs):
+        host = get_host(url)
+        if not self.limiter.acquire(host, timeout=_remaining(deadline)):
+            raise ImageDeadlineError()
+        latency, error = None, None
+        started = time.monotonic()
+        try:
+            timeout = kwargs.pop('timeout', self.timeout)
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            remaining = _remaining(deadline)
+            if remaining is not None:
+                if remaining <= 0:
+                    raise ImageDeadlineError()
+                connect, read = min(connect, remaining), min(read, remaining)
+            result = self._fetch(url, max_bytes, validators, headers, deadline, timeout=(connect, read), **kwargs)
+            latency = time.monotonic() - started
+            return result
+        except ImageSkippedError:
+            raise
+        except ImageNotModified:
+            latency = time.monotonic() - started
+            raise
+        except Exception as e:
+            if deadline is not None and time.monotonic() >= deadline:
+                # Timeout clipped to the deadline: not the URL's fault, never negative-cached
+                raise ImageDeadlineError() from e
+            latency, error = time.monotonic() - started, e
+            raise
+        finally:
+            self.limiter.release(host, latency, error)
+
+    def _fetch(self, url, max_bytes, validators, headers, deadline=None, **kwargs):
+        with self.get(url, stream=True, headers=headers, **kwargs) as response:
+            if response.status_code == 304:
+                raise ImageNotModified(dict(validators or {}, **response_validators(response.headers)))
+            response.raise_for_status()
+            _check_content_length(response.headers.get('Content-Length'), max_bytes)
+            body = bytearray()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                body += chunk
+                if max_bytes and len(body) > max_bytes:
+                    raise ImageTooLargeError(f"{url} supera {max_bytes} bytes")
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise ImageDeadlineError() # Slow drip: the read timeout alone never fires
+            return bytes(body), response_validators(response.headers)
+
+    def get_stats(self):
+        """Estadísticas acumuladas de reutilización de conexiones"""
+        with self._lock:
+            total_requests = self._retired['requests']
+            new_connections = self._retired['new_connections']
+            retried = self._retried
+            adapter = self._adapter
+        hosts = set()
+        for pool in self._live_pools(adapter):
+            total_requests += pool.num_requests
+            new_connections += pool.num_connections
+            hosts.add(pool.host)
+        reused = max(0, total_requests - new_connections)
+        return {
+            'requests': total_requests,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': round(reused / total_requests, 3) if total_requests else 0.0,
+            'active_hosts': len(hosts),
+            'pool_size': self.pool_size,
+            'retries': retried,
+        }
+
+    @staticmethod
+    def diff_stats(before, after):
+        """Estadísticas de un intervalo (p. ej. una exportación) a partir de dos snapshots"""
+        requests_made = after['requests'] - before['requests']
+        new_connections = after['new_connections'] - before['new_connections']
+        reused = max(0, requests_made - new_connections)
+        return {
+            'requests': requests_made,
+            'new_connections': new_connections,
+            'reused_connections': reused,
+            'reuse_ratio': round(reused / requests_made, 3) if requests_made else 0.0,
+            'active_hosts': after['active_hosts'],
+            'pool_size': after['pool_size'],
+            'retries': after.get('retries', 0) - before.get('retries', 0),
+        }
+
+
+def response_validators(headers):
+    """Validadores HTTP de una respuesta: {'etag', 'last_modified'} (solo los presentes)"""
+    validators = {'etag': headers.get('ETag'), 'last_modified': headers.get('Last-Modified')}
+    return {name: value for name, value in validators.items() if value}
+
+
+def conditional_headers(validators):
+    """Cabeceras If-None-Match / If-Modified-Since para revalidar una copia en caché"""
+    headers = {}
+    if validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+    return headers
+
+
+def _check_content_length(content_length, max_bytes):
+    """Rechaza antes de leer el cuerpo si el servidor ya declara un tamaño excesivo"""
+    try:
+        declared = int(content_length)
+    except (TypeError, ValueError):
+        return
+    if max_bytes and declared > max_bytes:
+        raise ImageTooLargeError(f"Content-Length {declared} supera {max_bytes} bytes")
+
+
+class AdaptiveLimiter:
+    """
+    Límite de peticiones en vuelo por host, ajustado en caliente (AIMD).
+    - Aumento: arranque lento (x2) hasta la primera señal de congestión; después +1
+      por cada ventana de `limit` respuestas correctas con latencia normal.
+    - Reducción multiplicativa (x backoff) ante 429, 5xx, timeouts o errores de conexión,
+      como mucho una vez por RTT para que una ráfaga de fallos no hunda el límite.
+    - Latencia muy por encima de la mínima observada: el límite se mantiene.
+    """
+
+    def __init__(self, initial=4, min_limit=1, max_limit=64, backoff=0.5, latency_tolerance=3.0):
+        self.initial = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self._cond = threading.Condition()
+        self._hosts = {}
+
+    def _state(self, host):
+        state = self._hosts.get(host)
+        if state is None:
+            state = {'limit': float(self.initial), 'in_flight': 0, 'peak_in_flight': 0, 'slow_start': True,
+                     'window': 0, 'min_latency': None, 'latency': None, 'last_decrease': 0.0,
+                     'requests': 0, 'errors': 0, 'throttled': 0}
+            self._hosts[host] = state
+        return state
+
+    def limit(self, host):
+        with self._cond:
+            return max(self.min_limit, int(self._state(host)['limit']))
+
+    def try_acquire(self, host):
+        """Reserva un hueco sin bloquear. Returns True si se obtuvo"""
+        with self._cond:
+            state = self._state(host)
+            if state['in_flight'] >= max(self.min_limit, int(state['limit'])):
+                return False
+            state['in_flight'] += 1
+            state['peak_in_flight'] = max(state['peak_in_flight'], state['in_flight'])
+            return True
+
+    def acquire(self, host, timeout=None):
+        """Espera un hueco. Returns False si vence timeout"""
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while not self.try_acquire(host):
+                remaining = None if end is None else end - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def release(self, host, latency=None, error=None):
+        """Libera el hueco y ajusta el límite. latency=None: la petición no llegó a hacerse"""
+        with self._cond:
+            state = self._state(host)
+            state['in_flight'] = max(0, state['in_flight'] - 1)
+            if latency is not None:
+                self._record(state, latency, error, time.monotonic())
+            self._cond.notify_all()
+
+    def _record(self, state, latency, error, now):
+        state['requests'] += 1
+        if error is not None:
+            state['errors'] += 1
+            reason, host_fault = classify_failure(error)
+            if reason == 'http_429':
+                state['throttled'] += 1
+            elif not host_fault:
+                return # 404, invalid image...: says nothing about the host's capacity
+            if now - state['last_decrease'] >= (state['latency'] or latency):
+                state['limit'] = max(self.min_limit, state['limit'] * self.backoff)
+                state['slow_start'] = False
+                state['last_decrease'] = now
+            state['window'] = 0
+            return
+
+        # Baseline drifts up slowly so a host that got permanently slower is not throttled forever
+        baseline = state['min_latency']
+        state['min_latency'] = latency if baseline is None else min(latency, baseline * 1.01)
+        state['latency'] = latency if state['latency'] is None else 0.8 * state['latency'] + 0.2 * latency
+        if state['latency'] > self.latency_tolerance * state['min_latency']:
+            state['window'] = 0 # Queueing at the origin: hold
+            return
+        state['window'] += 1
+        if state['window'] >= int(state['limit']):
+            state['window'] = 0
+            grown = state['limit'] * 2 if state['slow_start'] else state['limit'] + 1
+            state['limit'] = min(self.max_limit, grown)
+
+    def stats(self, hosts=None):
+        """Límite elegido por host (para img_stats)"""
+        with self._cond:
+            return {
+                host: {
+                    'limit': max(self.min_limit, int(state['limit'])),
+                    'peak_in_flight': state['peak_in_flight'],
+                    'requests': state['requests'],
+                    'errors': state['errors'],
+                    'throttled': state['throttled'],
+                    'latency_ms': round(state['latency'] * 1000) if state['latency'] is not None else None,
+                }
+                for host, state in self._hosts.items() if hosts is None or host in hosts
+            }
+
+
+def _remaining(deadline):
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def is_retryable(error):
+    """Errores transitorios: 429, 5xx, timeouts y errores de conexión"""
+    reason, host_fault = classify_failure(error)
+    return host_fault or reason == 'http_429'
+
+
+def retry_after_seconds(error):
+    """Cabecera Retry-After (segundos o fecha HTTP) de una respuesta de error, o None"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or getattr(error, 'headers', None)
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(error, attempt, retries, deadline=None, base=RETRY_BASE_DELAY, cap=RETRY_MAX_DELAY):
+    """
+    Espera antes del siguiente intento (full jitter), o None si no se debe reintentar:
+    error no transitorio, reintentos agotados, o la espera no cabe antes del deadline.
+    """
+    if attempt >= retries or not is_retryable(error):
+        return None
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    retry_after = retry_after_seconds(error)
+    if retry_after is not None:
+        if retry_after > cap:
+            return None # The origin asks for longer than we are willing to wait
+        delay = max(delay, retry_after)
+    remaining = _remaining(deadline)
+    if remaining is not None and delay >= remaining:
+        return None
+    return delay
+
+
+def classify_failure(error):
+    """
+    Clasifica un error de descarga. Returns (reason, host_fault):
+    host_fault=True para timeouts, errores de conexión y 5xx (cuentan para el circuito del host).
+    """
+    status = getattr(getattr(error, 'response', None), 'status_code', None) or getattr(error, 'status', None)
+    if isinstance(status, int):
+        return f"http_{status}", status >= 500
+    if isinstance(error, ImageTooLargeError):
+        return 'too_large', False
+    if isinstance(error, (requests.Timeout, asyncio.TimeoutError, TimeoutError)):
+        return 'timeout', True
+    if isinstance(error, (requests.ConnectionError, ConnectionError)):
+        return 'connection', True
+    if HAS_AIOHTTP and isinstance(error, aiohttp.ClientConnectionError):
+        return 'connection', True
+    return 'invalid', False
+
+
+class FailureTracker:
+    """
+    Caché negativa de URLs fallidas (con TTL) y circuit breaker por host.
+    Se persiste en JSON junto al caché en disco para sobrevivir reinicios.
+    """
+
+    def __init__(self, path=None, transient_ttl=900, permanent_ttl=6 * 3600,
+                 breaker_threshold=5, breaker_cooldown=300, trial_timeout=60, save_interval=5):
+        self.path = path
+        self.transient_ttl = transient_ttl # timeouts, 5xx: el host puede recuperarse
+        self.permanent_ttl = permanent_ttl # 404, imagen inválida: no va a cambiar pronto
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.trial_timeout = trial_timeout # Una prueba sin resultado registrado no bloquea el host para siempre
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._negative = {}  # url -> {'until', 'reason'}
+        self._hosts = {}  # host -> {'failures', 'opened_at', 'trial': (url, inicio) o None}
+        self._dirty = False
+        self._last_save = 0
+        self.load()
+
+    def check(self, url, now=None):
+        """Returns el motivo para omitir la URL sin tocar la red, o None"""
+        now = now or time.time()
+        with self._lock:
+            entry = self._negative.get(url)
+            if entry is not None:
+                if entry['until'] > now:
+                    return entry['reason']
+                del self._negative[url]
+                self._dirty = True
+            host = self._hosts.get(get_host(url))
+            if host is None or host['opened_at'] is None:
+                return None
+            if now - host['opened_at'] < self.breaker_cooldown:
+                return 'circuit_open'
+            if host['trial'] is not None and now - host['trial'][1] < self.trial_timeout:
+                return 'circuit_open'
+            # Half-open: let a single trial request through (a lost trial is replaced after trial_timeout)
+            host['trial'] = (url, now)
+            return None
+
+    def _trial_host(self, url):
+        """Estado del host si url es su petición de prueba en curso (con el lock tomado)"""
+        host = self._hosts.get(get_host(url))
+        if host is not None and host['trial'] is not None and host['trial'][0] == url:
+            return host
+        return None
+
+    def record_failure(self, url, error, now=None):
+        reason, host_fault = classify_failure(error)
+        now = now or time.time()
+        ttl = self.transient_ttl if host_fault else self.permanent_ttl
+        with self._lock:
+            self._negative[url] = {'until': now + ttl, 'reason': reason}
+            if host_fault:
+                host = self._hosts.setdefault(get_host(url), {'failures': 0, 'opened_at': None, 'trial': None})
+                host['failures'] += 1
+                if host['trial'] is not None or host['failures'] >= self.breaker_threshold:
+                    host['opened_at'] = now
+                host['trial'] = None
+            elif self._trial_host(url) is not None:
+                # 404, invalid image, too large: the host did answer the trial
+                del self._hosts[get_host(url)]
+            self._dirty = True
+        self._maybe_save(now)
+        return reason
+
+    def record_success(self, url):
+        host_key = get_host(url)
+        with self._lock:
+            if host_key in self._hosts:
+                del self._hosts[host_key]
+                self._dirty = True
+        self._maybe_save()
+
+    def record_abandoned(self, url, now=None):
+        """
+        La petición terminó sin respuesta del host (deadline, omitida): si era la prueba
+        del half-open, el circuito se vuelve a abrir con un cooldown nuevo
+        """
+        now = now or time.time()
+        with self._lock:
+            host = self._trial_host(url)
+            if host is None:
+                return
+            host['opened_at'] = now
+            host['trial'] = None
+            self._dirty = True
+        self._maybe_save(now)
+
+    def open_hosts(self, now=None):
+        """Hosts que hoy se omiten: en cooldown o con su prueba half-open en curso"""
+        now = now or time.time()
+        with self._lock:
+            return sorted(host for host, state in self._hosts.items()
+                          if state['opened_at'] is not None and (
+                              now - state['opened_at'] < self.breaker_cooldown
+                              or (state['trial'] is not None and now - state['trial'][1] < self.trial_timeout)))
+
+    def stats(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            negative = sum(1 for entry in self._negative.values() if entry['until'] > now)
+        return {'negative_entries': negative, 'open_hosts': self.open_hosts(now)}
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        with self._lock:
+            self._negative = {url: entry for url, entry in data.get('negative', {}).items() if entry.get('until', 0) > now}
+            self._hosts = {host: {'failures': state.get('failures', 0), 'opened_at': state.get('opened_at'), 'trial': None}
+                           for host, state in data.get('hosts', {}).items()}
+
+    def save(self):
+        """Escribe el estado a disco (best effort, escritura atómica)"""
+        if not self.path:
+            return
+        with self._lock:
+            data = {
+                'negative': dict(self._negative),
+                'hosts': {host: {'failures': state['failures'], 'opened_at': state['opened_at']}
+                          for host, state in self._hosts.items()},
+            }
+            self._dirty = False
+            self._last_save = time.time()
+        try:
+            tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
+
+    def _maybe_save(self, now=None):
+        now = now or time.time()
+        if self._dirty and now - self._last_save >= self.save_interval:
+            self.save()
+
+    def flush(self):
+        if self._dirty:
+            self.save()
+
+
+_shared_fetcher = None
+_shared_fetcher_lock = threading.Lock()
+
+
+def get_shared_fetcher(pool_size=20):
+    """Fetcher único por proceso, compartido por todas las sesiones"""
+    global _shared_fetcher
+    with _shared_fetcher_lock:
+        if _shared_fetcher is None:
+            _shared_fetcher = PooledImageFetcher(pool_size=pool_size)
+    _shared_fetcher.ensure_pool_size(pool_size)
+    return _shared_fetcher
+
+
+def get_host(url):
+    """Host de una URL (clave para pools y límites por host)"""
+    try:
+        return urlparse(str(url)).netloc.lower()
+    except ValueError:
+        return ''
+
+
+def group_urls_by_host(urls):
+    """Agrupa URLs por host conservando el orden de aparición"""
+    groups = OrderedDict()
+    for url in urls:
+        groups.setdefault(get_host(url), []).append(url)
+    return groups
+
+
+def _interleave_by_host(groups):
+    """Round-robin entre hosts para que un host grande no acapare el cupo global"""
+    queues = [list(host_urls) for host_urls in groups.values()]
+    ordered = []
+    index = 0
+    while queues:
+        queue = queues[index % len(queues)]
+        ordered.append(queue.pop(0))
+        if not queue:
+            queues.remove(queue)
+        else:
+            index += 1
+    return ordered
+
+
+async def stream_images_async(urls, global_limit=200, per_host_limit=16, timeout=READ_TIMEOUT, max_bytes=DEFAULT_MAX_BYTES, skip=None,
+                              validators=None, limiter=None, connect_timeout=CONNECT_TIMEOUT, retries=DEFAULT_RETRIES, deadline=None,
+                              counters=None):
+    """
+    Descarga URLs con asyncio y entrega (url, content, error, validators) en orden de llegada.
+    Límites: global_limit peticiones en vuelo en total, per_host_limit por host,
+    max_bytes por imagen (el cuerpo se lee en streaming).
+    skip(url) -> motivo o None se consulta justo antes de cada petición (circuit breaker).
+    validators(url) -> dict o None convierte la petición en condicional; un 304 se
+    entrega como error ImageNotModified.
+    limiter (AdaptiveLimiter): límite dinámico por host dentro del tope per_host_limit.
+    Timeouts de conexión y de lectura por petición; los errores transitorios se reintentan
+    (backoff + jitter) sin ocupar huecos mientras esperan. Pasado deadline (time.monotonic())
+    lo pendiente se entrega como ImageDeadlineError. counters['retries'] cuenta reintentos.
+    """
+    if not HAS_AIOHTTP:
+        raise ImportError("aiohttp no está instalado")
+    if not urls:
+        return
+
+    groups = group_urls_by_host(urls)
+    host_limits = {host: asyncio.Semaphore(per_host_limit) for host in groups}
+    global_limit_sem = asyncio.Semaphore(global_limit)
+    results = asyncio.Queue()
+    counters = counters if counters is not None else {}
+    counters.setdefault('retries', 0)
+
+    connector = aiohttp.TCPConnector(limit=global_limit, limit_per_host=per_host_limit, ttl_dns_cache=300)
+    client_timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=timeout)
+    async with aiohttp.ClientSession(connector=connector, headers=DEFAULT_HEADERS, timeout=client_timeout) as session:
+
+        gates = {host: asyncio.Condition() for host in groups}
+
+        async def acquire_adaptive(host):
+            gate = gates[host]
+            async with gate:
+                while not limiter.try_acquire(host):
+                    remaining = _remaining(deadline)
+                    if remaining is not None and remaining <= 0:
+                        return False
+                    try:
+                        # Woken by our own releases; the timeout covers slots freed by other threads
+                        await asyncio.wait_for(gate.wait(), 0.05)
+                    except asyncio.TimeoutError:
+                        pass
+            return True
+
+        async def release_adaptive(host, latency=None, error=None):
+            limiter.release(host, latency, error)
+            async with gates[host]:
+                gates[host].notify_all()
+
+        async def fetch(url):
+            attempt = 0
+            while True:
+                result = await fetch_once(url)
+                error = result[2]
+                delay = None
+                if error is not None and not isinstance(error, (ImageNotModified, ImageSkippedError)):
+                    delay = retry_delay(error, attempt, retries, deadline)
+                if delay is None:
+                    await results.put(result)
+                    return
+                counters['retries'] += 1
+                await asyncio.sleep(delay) # No slot is held while backing off
+                attempt += 1
+
+        async def fetch_once(url):
+            host = get_host(url)
+            # Host slot first so a slow host never holds global slots while queued
+            async with host_limits[host]:
+                if limiter is not None and not await acquire_adaptive(host):
+                    return url, None, ImageDeadlineError(), None
+                latency, error = None, None
+                try:
+                    async with global_limit_sem:
+                        remaining = _remaining(deadline)
+                        if remaining is not None and remaining <= 0:
+                            return url, None, ImageDeadlineError(), None
+                        reason = skip(url) if skip else None
+                        if reason:
+                            # Host tripped while this URL was queued: fail fast
+                            return url, None, ImageSkippedError(reason), None
+                        started = time.monotonic()
+                        try:
+                            result = await asyncio.wait_for(request(url), remaining)
+                        except asyncio.TimeoutError:
+                            return url, None, ImageDeadlineError(), None
+                        latency = time.monotonic() - started
+                        if not isinstance(result[2], ImageNotModified):
+                            error = result[2]
+                        return result
+                finally:
+                    if limiter is not None:
+                        await release_adaptive(host, latency, error)
+
+        async def request(url):
+            """GET (condicional si hay validadores). Returns (url, content, error, validators)"""
+            cached_validators = validators(url) if validators else None
+            try:
+                async with session.get(str(url), headers=conditional_headers(cached_validators)) as response:
+                    if response.status == 304:
+                        raise ImageNotModified(dict(cached_validators or {}, **response_validators(response.headers)))
+                    response.raise_for_status()
+                    _check_content_length(response.headers.get('Content-Length'), max_bytes)
+                    body = bytearray()
+                    async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                        body += chunk
+                        if max_bytes and len(body) > max_bytes:
+                            raise ImageTooLargeError(f"{url} supera {max_bytes} bytes")
+                    return url, bytes(body), None, response_validators(response.headers)
+            except Exception as e:
+                return url, None, e, None
+
+        tasks = [asyncio.create_task(fetch(url)) for url in _interleave_by_host(groups)]
+        try:
+            for _ in range(len(tasks)):
+                yield await results.get()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
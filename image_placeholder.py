@@ -0,0 +1,65 @@
+"""
+Placeholder Image for CatalogPro
+Imagen "Sin imagen": se dibuja una vez por proceso y cada variante (destino, tamaño) se codifica una sola vez
+"""
+import threading
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+class PlaceholderImage:
+    """Placeholder compartido por todas las sesiones; las variantes se guardan ya codificadas"""
+
+    def __init__(self, size=(300, 300), text="Sin imagen"):
+        self.image = self._draw(size, text)
+        self._variants = {}
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _draw(size, text):
+        width, height = size
+        image = Image.new('RGB', (width, height), color='#f0f0f0')
+        draw = ImageDraw.Draw(image)
+
+        draw.rectangle([10, 10, width-10, height-10], outline='#cccccc', width=2)
+
+        try:
+            font = ImageFont.truetype("arial.ttf", 24)
+        except:
+            font = ImageFont.load_default()
+
+        text_bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = text_bbox[2] - text_bbox[0]
+        text_height = text_bbox[3] - text_bbox[1]
+
+        text_x = (width - text_width) // 2
+        text_y = (height - text_height) // 2
+
+        draw.text((text_x, text_y), text, fill='#999999', font=font)
+        return image
+
+    def variant(self, max_size=None):
+        """Placeholder que cabe en max_size (el original si ya cabe)"""
+        if max_size is None or (self.image.size[0] <= max_size[0] and self.image.size[1] <= max_size[1]):
+            return self.image
+        with self._lock:
+            image = self._variants.get(max_size)
+            if image is None:
+                image = self.image.copy()
+                image.thumbnail(max_size, Image.Resampling.LANCZOS)
+                self._variants[max_size] = image
+            return image
+
+    def encoded(self, target, encode, max_size=None):
+        """
+        Bytes de la variante para un destino; encode(image) se ejecuta una sola vez por (destino, tamaño).
+        Returns: (data, (width, height))
+        """
+        image = self.variant(max_size)
+        key = (target, image.size)
+        with self._lock:
+            entry = self._encoded.get(key)
+            if entry is None:
+                entry = self._encoded[key] = (encode(image), image.size)
+            return entry
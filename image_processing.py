@@ -0,0 +1,115 @@
+"""
+Image Processing for CatalogPro
+Etapa de decodificación de imágenes (CPU) ejecutable en procesos separados.
+Sin dependencias de Streamlit para que los workers arranquen rápido.
+"""
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+
+def process_image_bytes(content, max_size):
+    """Decodifica, reduce y aplana a RGB los bytes de una imagen"""
+    image = Image.open(io.BytesIO(content))
+
+    # JPEG: decode straight at the nearest 1/2, 1/4 or 1/8 scale that still covers max_size
+    if image.format == 'JPEG' and (image.size[0] > max_size[0] or image.size[1] > max_size[1]):
+        ratio = min(max_size[0] / image.size[0], max_size[1] / image.size[1])
+        image.draft(None, (max(1, int(image.size[0] * ratio)), max(1, int(image.size[1] * ratio))))
+
+    # Convert P to RGBA/RGB
+    if image.mode == 'P':
+        image = image.convert('RGBA')
+
+    # Thumbnail processing (Save space); reducing_gap shrinks other formats with a fast reduce() first
+    if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+        image.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    # Ensure RGB for JPEG saving
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
+        image = background
+
+    image.load()
+    return image
+
+
+def _encode_jpeg(image, quality):
+    buffered = io.BytesIO()
+    image.save(buffered, "JPEG", quality=quality)
+    return buffered.getvalue()
+
+
+def decode_master_and_size(content, master_size, master_quality, max_size, quality=85):
+    """
+    Worker: descarga cruda -> maestro JPEG + tamaño derivado JPEG.
+    Returns: (master_bytes, derived_bytes, (mode, size, pixels)); los píxeles evitan re-decodificar en el padre.
+    """
+    master_image = process_image_bytes(content, master_size)
+    master = _encode_jpeg(master_image, master_quality)
+
+    image = master_image
+    if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
+        image = image.copy()
+        image.thumbnail(max_size, Image.Resampling.LANCZOS)
+    return (master,) + _encode_derived(image, quality)
+
+
+def derive_size(master, max_size, quality=85):
+    """Worker: maestro JPEG -> tamaño derivado. Returns (derived_bytes, pixels)"""
+    return _encode_derived(process_image_bytes(master, max_size), quality)
+
+
+def _encode_derived(image, quality):
+    return _encode_jpeg(image, quality), (image.mode, image.size, image.tobytes())
+
+
+def image_from_pixels(pixels):
+    mode, size, data = pixels
+    return Image.frombytes(mode, size, data)
+
+
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+
+def get_decode_pool(max_workers=None):
+    """
+    Pool de procesos único por proceso. Returns None con un solo núcleo
+    (el pool solo añadiría overhead de serialización).
+    """
+    global _decode_pool
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers < 2:
+        return None
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            # spawn: never fork a server process that already runs threads
+            _decode_pool = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _decode_pool
+
+
+def _reset_decode_pool(pool):
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is pool:
+            _decode_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run_decode(fn, *args, max_workers=None):
+    """Ejecuta fn en el pool de procesos; en el hilo actual si no hay pool o se rompió"""
+    pool = get_decode_pool(max_workers)
+    if pool is not None:
+        try:
+            return pool.submit(fn, *args).result()
+        except BrokenProcessPool:
+            # A worker died (OOM, killed): recreate the pool on next call, decode here now
+            _reset_decode_pool(pool)
+    return fn(*args)
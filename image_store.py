@@ -0,0 +1,484 @@
+"""
+Image Store for CatalogPro
+Caché en disco empaquetada: un archivo de datos append-only + índice SQLite
+"""
+import glob
+import mmap
+import os
+import re
+import sqlite3
+import threading
+import time
+
+_HASH_FILENAME = re.compile(r'^[0-9a-f]{32}\.jpg$')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    variant TEXT NOT NULL DEFAULT '',
+    host TEXT NOT NULL DEFAULT '',
+    created REAL NOT NULL,
+    last_access REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    source TEXT NOT NULL DEFAULT '',
+    etag TEXT,
+    last_modified TEXT,
+    validated REAL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Columnas añadidas después de la primera versión del esquema
+_ADDED_COLUMNS = {
+    'source': "TEXT NOT NULL DEFAULT ''",
+    'etag': "TEXT",
+    'last_modified': "TEXT",
+    'validated': "REAL",
+}
+
+# Orden de expulsión por política (primero = se expulsa antes)
+_EVICTION_ORDER = {
+    'lru': "last_access ASC",
+    'lfu': "hits ASC, last_access ASC",  # hits se reduce a la mitad periódicamente (aging)
+}
+
+
+class ImagePackStore:
+    """
+    Almacén clave -> bytes en un único pack append-only leído con mmap.
+
+    El índice persistente es una base SQLite (clave, offset, bytes, variante, host
+    de origen, último acceso, aciertos y validadores HTTP para revalidar). Los accesos se acumulan en memoria y un
+    hilo de mantenimiento los vuelca, expulsa por LRU (o LFU con aging) hasta
+    cumplir el presupuesto de bytes y compacta el pack; nada de eso ocurre en el
+    camino de la petición.
+    """
+
+    def __init__(self, directory, max_bytes, name='images', eviction='lru', compact_ratio=0.5,
+                 compact_min_bytes=32 * 1024 * 1024, maintenance_interval=30, aging_interval=3600):
+        if eviction not in _EVICTION_ORDER:
+            raise ValueError(f"Política de expulsión desconocida: {eviction}")
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.maintenance_interval = maintenance_interval
+        self.aging_interval = aging_interval
+        self.db_path = os.path.join(directory, f"{name}.sqlite")
+        self._lock = threading.RLock()
+        self._compact_lock = threading.Lock()
+        self._index = {}  # key -> [offset, length, validated]
+        self._pending_access = {}  # key -> [last_access, hits] aún no volcados a SQLite
+        self._live_bytes = 0
+        self._mmap = None
+        self._last_aging = time.time()
+        self.compactions = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        legacy_index = os.path.join(directory, f"{name}.idx")
+        self.is_new = not os.path.exists(self.db_path) and not os.path.exists(legacy_index)
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._upgrade_schema()
+        self._generation = int(self._get_meta('generation', '0'))
+        self._remove_stale_packs()
+        self._open_pack()
+        if os.path.exists(legacy_index):
+            self._migrate_text_index(legacy_index)
+        self._load_index()
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._maintenance_loop, name=f'{name}-store-maintenance', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------ files
+
+    def _pack_path(self, generation):
+        suffix = '' if generation == 0 else f".{generation}"
+        return os.path.join(self.directory, f"{self.name}{suffix}.pack")
+
+    @property
+    def pack_path(self):
+        return self._pack_path(self._generation)
+
+    def _remove_stale_packs(self):
+        """Packs de otra generación = compactación interrumpida por un crash"""
+        current = os.path.abspath(self.pack_path)
+        pattern = os.path.join(self.directory, f"{self.name}*.pack")
+        for path in glob.glob(pattern):
+            if os.path.abspath(path) != current:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _open_pack(self):
+        self._pack = open(self.pack_path, 'ab')
+        self._pack_size = self._pack.tell()
+        self._mmap = None
+
+    def _close_pack(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._pack.close()
+
+    def _view(self, end):
+        """mmap que cubre al menos [0, end); se re-mapea cuando el pack creció"""
+        if self._mmap is None or len(self._mmap) < end:
+            if self._mmap is not None:
+                self._mmap.close()
+            self._pack.flush()
+            with open(self.pack_path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mmap
+
+    def _get_meta(self, name, default=None):
+        row = self._db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else default
+
+    def _upgrade_schema(self):
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(entries)")}
+        for name, definition in _ADDED_COLUMNS.items():
+            if name not in columns:
+                self._db.execute(f"ALTER TABLE entries ADD COLUMN {name} {definition}")
+        self._db.commit()
+
+    def _load_index(self):
+        rows = self._db.execute("SELECT key, offset, length, COALESCE(validated, created) FROM entries").fetchall()
+        # Drop entries pointing past the end of the pack (pack lost its tail)
+        bad = [(row[0],) for row in rows if row[1] + row[2] > self._pack_size]
+        if bad:
+            self._db.executemany("DELETE FROM entries WHERE key = ?", bad)
+            self._db.commit()
+        self._index = {key: [offset, length, validated] for key, offset, length, validated in rows
+                       if offset + length <= self._pack_size}
+        self._live_bytes = sum(e[1] for e in self._index.values())
+
+    def _migrate_text_index(self, path):
+        """Migración del índice de texto append-only de la versión anterior"""
+        entries = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.rstrip('\n').split('\t')
+                try:
+                    if parts[0] == '-':
+                        entries.pop(parts[1], None)
+                    elif parts[0] == '+':
+                        _, key, offset, length, variant, last_access = parts
+                        entries[key] = (int(offset), int(length), variant, float(last_access))
+                except (ValueError, IndexError):
+                    continue
+        self._db.executemany(
+            "INSERT OR REPLACE INTO entries (key, offset, length, variant, created, last_access) VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, o, n, v, t, t) for key, (o, n, v, t) in entries.items()]
+        )
+        self._db.commit()
+        os.remove(path)
+
+    # ------------------------------------------------------------------ API
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def __len__(self):
+        with self._lock:
+            return len(self._index)
+
+    def get(self, key):
+        """Returns bytes o None. El acceso se registra en memoria (sin escribir en SQLite)"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            offset, length = entry[0], entry[1]
+            data = self._view(offset + length)[offset:offset + length]
+            access = self._pending_access.setdefault(key, [0, 0])
+            access[0] = time.time()
+            access[1] += 1
+            return data
+
+    def put(self, key, data, variant='', host='', source='', validators=None):
+        """
+        Añade (o reemplaza) una entrada. La expulsión la hace el hilo de mantenimiento.
+        source: URL de origen (para invalidar todas sus variantes); validators: ETag / Last-Modified
+        """
+        validators = validators or {}
+        if len(data) > self.max_bytes:
+            return False
+        now = time.time()
+        with self._lock:
+            old = self._index.pop(key, None)
+            if old is not None:
+                self._live_bytes -= old[1]
+            offset = self._pack_size
+            self._pack.write(data)
+            self._pack.flush()
+            self._pack_size += len(data)
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, offset, length, variant, host, created, last_access, hits, "
+                "source, etag, last_modified, validated) VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (key, offset, len(data), str(variant), host or '', now, now,
+                 str(source or ''), validators.get('etag'), validators.get('last_modified'), now)
+            )
+            self._db.commit()
+            self._index[key] = [offset, len(data), now]
+            self._pending_access.pop(key, None)
+            self._live_bytes += len(data)
+            over_budget = self._live_bytes > self.max_bytes
+        if over_budget:
+            self._wake.set()
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            entry = self._index.pop(key, None)
+            if entry is None:
+                return
+            self._live_bytes -= entry[1]
+            self._pending_access.pop(key, None)
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._db.commit()
+
+    def delete_source(self, source):
+        """Borra todas las variantes de una URL de origen (la imagen cambió). Returns borradas"""
+        with self._lock:
+            keys = [row[0] for row in self._db.execute("SELECT key FROM entries WHERE source = ?", (str(source),))]
+            for key in keys:
+                entry = self._index.pop(key, None)
+                if entry is not None:
+                    self._live_bytes -= entry[1]
+                self._pending_access.pop(key, None)
+            self._db.execute("DELETE FROM entries WHERE source = ?", (str(source),))
+            self._db.commit()
+            return len(keys)
+
+    def get_validators(self, key):
+        """ETag / Last-Modified guardados con la entrada ({} si el servidor no envió ninguno)"""
+        with self._lock:
+            row = self._db.execute("SELECT etag, last_modified FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return {}
+        return {name: value for name, value in zip(('etag', 'last_modified'), row) if value}
+
+    def is_stale(self, key, max_age, now=None):
+        """True si la entrada existe y no se ha revalidado en max_age segundos (sin consultar SQLite)"""
+        with self._lock:
+            entry = self._index.get(key)
+            return entry is not None and (now or time.time()) - entry[2] >= max_age
+
+    def mark_validated(self, key, validators=None):
+        """La fuente respondió 304: la entrada vuelve a ser fresca"""
+        now = time.time()
+        validators = validators or {}
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return
+            entry[2] = now
+            self._db.execute(
+                "UPDATE entries SET validated = ?, etag = COALESCE(?, etag), "
+                "last_modified = COALESCE(?, last_modified) WHERE key = ?",
+                (now, validators.get('etag'), validators.get('last_modified'), key)
+            )
+            self._db.commit()
+
+    def stats(self):
+        self.flush_access()
+        with self._lock:
+            hits = self._db.execute("SELECT COALESCE(SUM(hits), 0) FROM entries").fetchone()[0]
+            return {
+                'entries': len(self._index),
+                'live_bytes': self._live_bytes,
+                'pack_bytes': self._pack_size,
+                'dead_bytes': self._pack_size - self._live_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': hits,
+                'eviction': self.eviction,
+                'evictions': self.evictions,
+                'compactions': self.compactions,
+            }
+
+    def host_stats(self, limit=10):
+        """Uso del caché por host de origen (panel de administración)"""
+        self.flush_access()
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT host, COUNT(*), SUM(length), SUM(hits), MAX(last_access) FROM entries "
+                "GROUP BY host ORDER BY SUM(length) DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{'host': host or '-', 'entries': count, 'bytes': nbytes, 'hits': hits, 'last_access': last}
+                for host, count, nbytes, hits, last in rows]
+
+    def import_loose_files(self, directory=None):
+        """
+        Migración única: importa los JPEG sueltos <md5>.jpg del caché anterior.
+        Los archivos originales no se tocan. Returns número importado
+        """
+        directory = directory or self.directory
+        imported = 0
+        try:
+            names = [n for n in os.listdir(directory) if _HASH_FILENAME.match(n)]
+        except OSError:
+            return 0
+        # Oldest first so the most recent end up with the latest access time
+        paths = sorted((os.path.join(directory, n) for n in names), key=lambda p: os.path.getmtime(p))
+        for path in paths:
+            key = os.path.basename(path)[:-4]
+            if key in self:
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if self.put(key, data, variant='legacy'):
+                imported += 1
+        return imported
+
+    # ------------------------------------------------------------ maintenance
+
+    def _maintenance_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.maintenance_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.run_maintenance()
+            except Exception as e:
+                print(f"Warning: image store maintenance failed: {e}")
+
+    def run_maintenance(self):
+        """Vuelca accesos, envejece contadores (LFU), expulsa y compacta si hace falta"""
+        self.flush_access()
+        if self.eviction == 'lfu' and time.time() - self._last_aging >= self.aging_interval:
+            self.age_hits()
+        self.evict()
+        with self._lock:
+            needs_compaction = self._needs_compaction()
+        if needs_compaction:
+            self.compact()
+
+    def flush_access(self):
+        with self._lock:
+            if not self._pending_access:
+                return
+            pending, self._pending_access = self._pending_access, {}
+            self._db.executemany(
+                "UPDATE entries SET last_access = ?, hits = hits + ? WHERE key = ?",
+                [(last, hits, key) for key, (last, hits) in pending.items()]
+            )
+            self._db.commit()
+
+    def age_hits(self):
+        """Aging LFU: reduce a la mitad los aciertos para que lo antiguo caliente pueda salir"""
+        with self._lock:
+            self._db.execute("UPDATE entries SET hits = hits / 2")
+            self._db.commit()
+            self._last_aging = time.time()
+
+    def evict(self, low_watermark=0.9):
+        """Expulsa según la política hasta quedar bajo low_watermark * max_bytes. Returns expulsadas"""
+        self.flush_access()
+        with self._lock:
+            if self._live_bytes <= self.max_bytes:
+                return 0
+            target = self.max_bytes * low_watermark
+            victims = []
+            for key, length in self._db.execute(
+                f"SELECT key, length FROM entries ORDER BY {_EVICTION_ORDER[self.eviction]}"
+            ):
+                if self._live_bytes <= target:
+                    break
+                if self._index.pop(key, None) is not None:
+                    self._live_bytes -= length
+                victims.append((key,))
+            self._db.executemany("DELETE FROM entries WHERE key = ?", victims)
+            self._db.commit()
+            self.evictions += len(victims)
+            return len(victims)
+
+    def _needs_compaction(self):
+        dead = self._pack_size - self._live_bytes
+        return dead >= self.compact_min_bytes and dead >= self._pack_size * self.compact_ratio
+
+    def compact(self):
+        """
+        Reescribe las entradas vivas en un pack de nueva generación.
+        La copia masiva ocurre fuera del lock; el cambio de offsets y de generación
+        es una sola transacción SQLite, así que un crash deja siempre un índice válido.
+        """
+        with self._compact_lock:
+            with self._lock:
+                snapshot = {key: list(entry) for key, entry in self._index.items()}
+                old_path = self.pack_path
+                new_generation = self._generation + 1
+            new_path = self._pack_path(new_generation)
+            try:
+                new_offsets = {}
+                with open(old_path, 'rb') as src, open(new_path, 'wb') as dst:
+                    for key, (offset, length, _) in snapshot.items():
+                        src.seek(offset)
+                        new_offsets[key] = dst.tell()
+                        dst.write(src.read(length))
+
+                    with self._lock:
+                        # Reconcile with writes/deletes that happened during the copy
+                        final = {}
+                        for key, (offset, length, validated) in self._index.items():
+                            if key in new_offsets and snapshot[key][0] == offset:
+                                final[key] = [new_offsets[key], length, validated]
+                            else:
+                                src.seek(offset)
+                                final[key] = [dst.tell(), length, validated]
+                                dst.write(src.read(length))
+                        dst.flush()
+                        os.fsync(dst.fileno())
+
+                        self._db.executemany(
+                            "UPDATE entries SET offset = ? WHERE key = ?",
+                            [(entry[0], key) for key, entry in final.items()]
+                        )
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO meta (name, value) VALUES ('generation', ?)", (str(new_generation),)
+                        )
+                        self._db.commit()
+
+                        self._close_pack()
+                        self._generation = new_generation
+                        self._open_pack()
+                        self._index = final
+                        self._live_bytes = sum(e[1] for e in final.values())
+                        self.compactions += 1
+            except Exception:
+                if self._generation != new_generation and os.path.exists(new_path):
+                    os.remove(new_path)
+                raise
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass # Removed on next start
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
+        self.flush_access()
+        with self._lock:
+            self._close_pack()
+            self._db.close()
@@ -0,0 +1,95 @@
+"""
+Image Warm-up for CatalogPro
+Precarga de imágenes en segundo plano al confirmar una importación
+"""
+import threading
+import time
+
+
+class WarmupJob:
+    """
+    Ejecuta prefetch(urls, progress_callback=...) en un hilo daemon
+    (p. ej. ImageManager.download_images_async). Los reruns de Streamlit leen
+    el progreso sin bloquear; la exportación posterior encuentra las imágenes en
+    caché o se une a las descargas aún en vuelo (single-flight).
+    Las URLs se precargan por lotes de batch_size: cancel() detiene el job al terminar
+    el lote en curso. after: job anterior al que se espera antes de empezar (nunca dos a la vez).
+    """
+
+    def __init__(self, urls, prefetch, name='image-warmup', batch_size=500, after=None):
+        self.urls = list(urls)
+        self.total = len(self.urls)
+        self.completed = 0
+        self.stats = None
+        self.error = None
+        self.cancelled = False
+        self.started_at = None
+        self.finished_at = None
+        self._prefetch = prefetch
+        self._batch_size = batch_size
+        self._after = after
+        self._offset = 0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        """Pide detener el job; las imágenes del lote en curso terminan de descargarse"""
+        self.cancelled = True
+
+    def _run(self):
+        try:
+            if self._after is not None:
+                self._after.wait()
+                self._after = None
+            for start in range(0, len(self.urls), self._batch_size):
+                if self.cancelled:
+                    break
+                batch = self.urls[start:start + self._batch_size]
+                self._offset = start
+                self.stats = self._merge_stats(self.stats, self._prefetch(batch, progress_callback=self._on_progress))
+            else:
+                self.completed = self.total
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished_at = time.time()
+            self._done.set()
+
+    @staticmethod
+    def _merge_stats(total, batch):
+        """Contadores sumados entre lotes; el resto (conexiones, caché...) es el del último lote"""
+        if total is None or batch is None:
+            return batch if total is None else total
+        merged = dict(total)
+        for key, value in batch.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(merged.get(key), (int, float)):
+                merged[key] += value
+            else:
+                merged[key] = value
+        return merged
+
+    def _on_progress(self, completed, total):
+        self.completed = self._offset + completed
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def progress(self):
+        """Fracción completada (0.0 - 1.0)"""
+        if self.done or not self.total:
+            return 1.0 if self.done else 0.0
+        return min(1.0, self.completed / self.total)
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
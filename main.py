@@ -1,8 +1,7 @@
 ﻿import streamlit as st
 import streamlit.components.v1 as components
 import pandas as pd
-import requests
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import io
 import base64
 from datetime import datetime, timedelta
@@ -13,6 +12,12 @@ import time
 import re
 import numpy as np
 import math
+import asyncio
+import uuid
+import zipfile
+import contextlib
+import functools
+from concurrent.futures.process import BrokenProcessPool
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image as RLImage, PageBreak, KeepTogether
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -28,6 +33,16 @@ import time
 from frd_schema import FRD_SCHEMA, get_required_columns, get_optional_columns, get_all_columns
 from frd_validator import FRDValidator
 
+from image_cache import SharedImageCache, SessionCacheView, SingleFlight, ByteLRUCache
+from image_processing import decode_master_and_size, derive_size, image_from_pixels, run_decode, get_decode_pool
+from image_store import ImagePackStore
+from image_warmup import WarmupJob
+from image_placeholder import PlaceholderImage
+from image_bundle import BundleRegistry, is_bundle_url, sheet_image_anchors
+from pdf_render import NumberedCanvas, DedupImage, HAS_PYPDF, DEFAULT_BRANDING, PRO_MARGINS, LAYOUT_VERSION, LAYOUT_ENGINES, clean_text, draw_footer, pro_image, product_story, sort_catalog, split_shards, shard_fingerprint, render_shard, merge_shards
+from pdf_store import PDFArtifactStore, catalog_fingerprint
+from image_fetcher import get_shared_fetcher, PooledImageFetcher, FailureTracker, ImageSkippedError, ImageDeadlineError, ImageNotModified, stream_images_async, group_urls_by_host, get_host, HAS_AIOHTTP
+
 # ============================================
 # TAREA 2: CARGA DE TEMA CORPORATIVO ANTAY
 # ============================================
@@ -59,31 +74,6 @@ def load_antay_theme():
 # Cargar tema corporativo al inicio (solo UNA VEZ)
 load_antay_theme()
 
-class NumberedCanvas(canvas.Canvas):
-    """Canvas avanzado que soporta 'Página X de Y'"""
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
-
-    def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        """Metodo mágico que rellena el total de páginas al final"""
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.draw_page_number(num_pages)
-            canvas.Canvas.showPage(self)
-        canvas.Canvas.save(self)
-        
-    def draw_page_number(self, page_count):
-        self.setFont("Helvetica", 9)
-        self.setFillColor(colors.HexColor('#7f8c8d'))
-        page_text = f"Página {self._pageNumber} de {page_count}"
-        self.drawRightString(A4[0] - 50, 40, page_text)
-
 # Configuración de la página
 st.set_page_config(
     page_title="CatalogPro Enhanced - Catálogo Digital",
@@ -107,31 +97,6 @@ def load_antay_theme():
     except Exception as e:
         print(f"[WARNING] No se pudo cargar tema Antay: {e}")
 
-class NumberedCanvas(canvas.Canvas):
-    """Canvas avanzado que soporta 'Página X de Y'"""
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
-
-    def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
-
-    def save(self):
-        """Metodo mágico que rellena el total de páginas al final"""
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.draw_page_number(num_pages)
-            canvas.Canvas.showPage(self)
-        canvas.Canvas.save(self)
-
-    def draw_page_number(self, page_count):
-        self.setFont("Helvetica", 9)
-        self.setFillColor(colors.HexColor('#7f8c8d'))
-        page_text = f"Página {self._pageNumber} de {page_count}"
-        self.drawRightString(A4[0] - 50, 40, page_text)
-
 # =============================================================================
 
 class DataHandler:
@@ -140,15 +105,55 @@ class DataHandler:
     def __init__(self):
         self.required_columns = ['Línea', 'Familia', 'Marca', 'Código', 'Producto', 'Descripción', 'Unidad', 'Precio', 'Stock', 'ImagenURL']
         
-    def load_excel(self, uploaded_file):
-        """Cargar datos desde un archivo Excel"""
+    def load_excel(self, uploaded_file, image_bundles=None):
+        """
+        Cargar datos desde un archivo Excel.
+        image_bundles (BundleRegistry): si se indica, las imágenes pegadas en las filas
+        se usan como ImagenURL (zip://) donde la celda está vacía
+        """
         try:
             df = pd.read_excel(uploaded_file)
             self._validate_columns(df)
+            if image_bundles is not None:
+                df = self._attach_embedded_images(uploaded_file, df, image_bundles)
             return df
         except Exception as e:
             raise Exception(f"Error al cargar archivo Excel: {str(e)}")
     
+    def _attach_embedded_images(self, uploaded_file, df, image_bundles):
+        """Asigna a cada fila la imagen anclada en ella; el libro se guarda como bundle solo si tiene imágenes"""
+        embedded = self._embedded_image_urls(uploaded_file, image_bundles)
+        if not embedded:
+            return df
+        
+        column = next(c for c in df.columns if str(c).strip().lower() == 'imagenurl')
+        df[column] = df[column].astype(object)
+        for row, url in embedded.items():
+            index = row - 1 # Sheet row 0 is the header
+            if index in df.index and (pd.isna(df.at[index, column]) or not str(df.at[index, column]).strip()):
+                df.at[index, column] = url
+        return df
+    
+    def _embedded_image_urls(self, uploaded_file, image_bundles):
+        """
+        {fila: URL zip://} de las imágenes ancladas en el libro. Se calcula una vez por archivo
+        subido (file_id): los reruns de Streamlit no vuelven a hashear, copiar ni parsear el libro
+        """
+        upload_id = getattr(uploaded_file, 'file_id', None)
+        cached = st.session_state.get('embedded_images_excel')
+        if upload_id is not None and cached is not None and cached['upload_id'] == upload_id:
+            return cached['urls']
+        
+        uploaded_file.seek(0)
+        with zipfile.ZipFile(uploaded_file) as workbook:
+            anchors = sheet_image_anchors(workbook)
+        urls = {}
+        if anchors:
+            uploaded_file.seek(0)
+            urls = image_bundles.add(uploaded_file).embedded_images(anchors)
+        st.session_state['embedded_images_excel'] = {'upload_id': upload_id, 'urls': urls}
+        return urls
+    
     def load_google_sheets(self, sheets_url):
         """Cargar datos desde Google Sheets"""
         try:
@@ -256,158 +261,412 @@ class DataCleaner:
         
         return df
 
+@st.cache_resource
+def get_shared_image_cache(process_mb, session_mb):
+    """Caché de imágenes decodificadas única por proceso, compartida entre sesiones"""
+    return SharedImageCache(process_mb * 1024 * 1024, session_mb * 1024 * 1024)
+
+
+@st.cache_resource
+def get_disk_store(directory, max_mb):
+    """Caché en disco empaquetada (pack + índice SQLite), abierta una sola vez por proceso"""
+    store = ImagePackStore(directory, max_mb * 1024 * 1024, eviction=ImageManager.DISK_CACHE_EVICTION)
+    if store.is_new:
+        # One-time migration of the loose <md5>.jpg files of the previous cache layout
+        store.import_loose_files()
+    return store
+
+
+@st.cache_resource
+def get_failure_tracker(path):
+    """Caché negativa + circuit breaker por host, compartidos por el proceso"""
+    return FailureTracker(path)
+
+
+@st.cache_resource
+def get_image_bundles(directory):
+    """ZIPs de imágenes subidos por los usuarios, abiertos una sola vez por proceso"""
+    return BundleRegistry(directory)
+
+
+@st.cache_resource
+def get_placeholder_image():
+    """Placeholder "Sin imagen" único por proceso, ya codificado para cada destino"""
+    placeholder = PlaceholderImage()
+    for target in ImageManager.ENCODED_TARGETS:
+        placeholder.encoded(target, lambda image, target=target: ImageManager.encode_for_target(image, target))
+    return placeholder
+
+
+@st.cache_resource
+def get_section_cache(max_mb):
+    """Tramos del PDF ya maquetados por huella de contenido, compartidos entre sesiones"""
+    return ByteLRUCache(max_mb * 1024 * 1024)
+
+
+@st.cache_resource
+def get_pdf_store(directory, max_mb, max_age):
+    """Almacén en disco de PDFs terminados, abierto una sola vez por proceso"""
+    return PDFArtifactStore(directory, max_mb * 1024 * 1024, max_age)
+
+
+@st.cache_resource
+def get_image_flights():
+    """Descargas en vuelo por proceso: una URL se descarga una sola vez aunque la pidan varios hilos o sesiones"""
+    return SingleFlight()
+
+
 class ImageManager:
     """Clase para manejar la descarga y procesamiento de imágenes"""
     
-    MAX_CACHE_SIZE = 1000 # Max number of files
+    DISK_CACHE_MB = 1024 # Tope en bytes del caché en disco (pack)
+    DISK_CACHE_EVICTION = 'lru' # 'lru' o 'lfu' (con aging) para el caché en disco
     CACHE_DIR = os.path.abspath(os.path.join(os.getcwd(), '.img_cache'))
+    HTTP_POOL_SIZE = 64 # Conexiones keep-alive por host (igual a max_workers)
+    FETCH_MAX_WORKERS = 64 # Tope de hilos de descarga; el límite real por host lo ajusta AdaptiveLimiter
+    ASYNC_GLOBAL_LIMIT = 200 # Peticiones en vuelo (modo asyncio)
+    ASYNC_PER_HOST_LIMIT = 64 # Tope por host (modo asyncio); el límite efectivo es adaptativo (AIMD)
+    MEMORY_CACHE_SESSION_MB = 256 # Bitmaps decodificados por sesión
+    MEMORY_CACHE_PROCESS_MB = 1024 # Suma de todas las sesiones del worker
+    MASTER_SIZE = (800, 800) # Maestro canónico por URL; los demás tamaños se derivan de él
+    MASTER_QUALITY = 90
+    MAX_IMAGE_BYTES = 15 * 1024 * 1024 # Tope por imagen descargada (se lee en streaming)
+    IMAGE_PHASE_DEADLINE = 90 # Segundos máximos de la fase de imágenes por exportación; lo pendiente usa placeholder
+    IMAGE_FRESHNESS_HOURS = 24 # Pasado este tiempo el maestro se revalida con una petición condicional (ETag / Last-Modified)
+    DECODE_WORKERS = os.cpu_count() or 1 # Procesos para decodificar/redimensionar (CPU-bound)
+    # Bytes finales por destino: se codifican una vez y se reutilizan en cada rerun/exportación
+    ENCODED_TARGETS = {
+        'pdf': {'format': 'JPEG', 'quality': 85, 'reuse_disk': True}, # Same JPEG as the disk cache; RLImage embeds it as-is
+        'preview': {'format': 'JPEG', 'quality': 80, 'data_uri': True}, # <img src> de la vista catálogo
+    }
+
+    PLACEHOLDER_STATUSES = ('empty', 'error', 'skipped', 'deadline') # Estados servidos con el placeholder
 
     def __init__(self):
-        self.placeholder_image = self._generate_placeholder_image()
-        
-        # 1. Setup Disk Cache Directory (Best Effort)
+        # Drawn and encoded once per process, shared by every manager and session
+        self.placeholder = get_placeholder_image()
+        self.placeholder_image = self.placeholder.image
+        # Shared connection pool: one TCP+TLS handshake per host, not per image
+        self.fetcher = get_shared_fetcher(self.HTTP_POOL_SIZE)
+        self.flights = get_image_flights()
+        self.bundles = get_image_bundles(os.path.join(self.CACHE_DIR, 'bundles'))
+        
+        # 1. Setup Disk Cache (Best Effort): single pack file + index, shared by the process
         self.disk_cache_enabled = False
+        self.disk_store = None
         try:
-            if not os.path.exists(self.CACHE_DIR):
-                os.makedirs(self.CACHE_DIR, exist_ok=True)
+            self.disk_store = get_disk_store(self.CACHE_DIR, self.DISK_CACHE_MB)
             self.disk_cache_enabled = True
-            # Optional: Cleanup on init (LRU-like could be expensive on every start, keeping simple limit)
-            self._cleanup_cache() 
         except Exception as e:
             print(f"Warning: Disabling disk cache due to error: {e}")
             st.error(f"Disk Cache Init Error: {e}") # Show in UI for debug
             self.disk_cache_enabled = False
 
-        # 2. Persist Session Cache (Memory Layer)
-        if 'image_cache_persistent' not in st.session_state:
-            st.session_state['image_cache_persistent'] = {}
-        self.image_cache = st.session_state['image_cache_persistent']
+        # Failed URLs and dead hosts fail fast instead of waiting for the timeout again
+        failures_path = os.path.join(self.CACHE_DIR, 'failures.json') if self.disk_cache_enabled else None
+        self.failures = get_failure_tracker(failures_path)
+
+        # 2. Memory Layer: one byte-bounded LRU per process, shared by every session
+        if 'image_cache_session_id' not in st.session_state:
+            st.session_state['image_cache_session_id'] = uuid.uuid4().hex
+        shared_cache = get_shared_image_cache(self.MEMORY_CACHE_PROCESS_MB, self.MEMORY_CACHE_SESSION_MB)
+        self.image_cache = SessionCacheView(
+            shared_cache,
+            st.session_state['image_cache_session_id'],
+            label=st.session_state.get('user_email')
+        )
 
-    def _get_cache_path(self, url, max_size):
-        """Generates a secure MD5 filename from URL"""
+    def _get_cache_hash(self, url, max_size):
+        """MD5 of URL + size: disk cache key and single-flight key"""
         import hashlib
-        hash_obj = hashlib.md5(f"{url}_{max_size}".encode('utf-8'))
-        return os.path.join(self.CACHE_DIR, f"{hash_obj.hexdigest()}.jpg")
+        return hashlib.md5(f"{url}_{max_size}".encode('utf-8')).hexdigest()
 
-    def _cleanup_cache(self):
-        """Enforces MAX_CACHE_SIZE by deleting oldest files (LRU approximation)"""
-        try:
-            files = [os.path.join(self.CACHE_DIR, f) for f in os.listdir(self.CACHE_DIR)]
-            if len(files) > self.MAX_CACHE_SIZE:
-                # Sort by access time (oldest first)
-                files.sort(key=lambda x: os.path.getmtime(x) if os.path.exists(x) else 0)
-                # Delete excess files
-                num_to_delete = len(files) - self.MAX_CACHE_SIZE
-                for f in files[:num_to_delete]:
-                    try:
-                        os.remove(f)
-                    except:
-                        pass
-        except Exception:
-            pass # Fail silently on cleanup
-        
-    def download_image(self, image_url, max_size=(400, 400)):
-        """Descargar imagen desde URL con caché y Headers"""
+    def download_image(self, image_url, max_size=(400, 400), deadline=None):
+        """
+        Descargar imagen desde URL con caché y Headers.
+        deadline (time.monotonic()): pasado ese instante solo se sirve lo que ya está en caché
+        """
         if pd.isna(image_url) or not image_url or str(image_url) == 'nan':
             return self.placeholder_image, "empty"
             
+        # 1-2. Memory / Disk Cache, or derived from the canonical master
+        cached = self._lookup_local(image_url, max_size)
+        if cached is not None:
+            return cached
+
+        # Export image phase is over: placeholder instead of a network wait
+        if deadline is not None and time.monotonic() >= deadline:
+            return self.placeholder_image, "deadline"
+
+        # Known-bad URL or host with an open circuit: no network round trip
+        if not is_bundle_url(image_url) and self.failures.check(image_url):
+            return self.placeholder_image, "skipped"
+
+        # 3. Fetch the master once from the net
+        # Single-flight: concurrent callers for the same URL wait for one download
+        import concurrent.futures
+        try:
+            master, shared = self.flights.do(
+                self._get_cache_hash(image_url, 'master'), self._fetch_master, image_url, max_size, deadline,
+                timeout=None if deadline is None else max(0, deadline - time.monotonic())
+            )
+        except (ImageDeadlineError, concurrent.futures.TimeoutError):
+            if deadline is None or time.monotonic() < deadline:
+                # It was another caller's deadline (e.g. an export we were waiting on): try on our own
+                return self.download_image(image_url, max_size, deadline)
+            return self.placeholder_image, "deadline"
+        status = "shared" if shared else "download"
+        if master is None:
+            return self.placeholder_image, "error"
+        cached = self._lookup_cached(image_url, max_size) # The leader stored its own size
+        if cached is not None:
+            return cached[0], status
+        try:
+            return self._derive_and_store(image_url, master, max_size), status
+        except Exception:
+            return self.placeholder_image, "error"
+
+    def _lookup_local(self, image_url, max_size):
+        """Tamaño pedido en caché, o derivado del maestro local. Returns (image, status) o None"""
+        cached = self._lookup_cached(image_url, max_size)
+        if cached is not None:
+            return cached
+        master = self._lookup_master(image_url)
+        if master is None:
+            return None
+        try:
+            return self._derive_and_store(image_url, master, max_size), "derived"
+        except Exception:
+            return None
+
+    def _fetch_master(self, image_url, max_size, deadline=None):
+        """
+        Líder del single-flight: descarga y guarda el maestro. Returns JPEG bytes o None
+        Raises: ImageDeadlineError (no cuenta como fallo de la URL)
+        """
+        # A previous flight may have stored the master since our lookup
+        master = self._lookup_master(image_url)
+        if master is not None:
+            return master
+
+        if is_bundle_url(image_url):
+            # Uploaded ZIP: read the member directly, same decode/cache pipeline, no network
+            try:
+                content = self.bundles.read(image_url, max_bytes=self.MAX_IMAGE_BYTES)
+                return self._decode_and_store(image_url, content, max_size)[1]
+            except Exception:
+                return None
+
+        # Download from Net (pooled session, User-Agent set by the fetcher)
+        try:
+            # Streamed with a byte cap: oversized photos are rejected before they are buffered
+            # Connect/read timeouts and retries with backoff are handled by the fetcher
+            content, validators = self.fetcher.fetch(image_url, max_bytes=self.MAX_IMAGE_BYTES, deadline=deadline)
+            master = self._decode_and_store(image_url, content, max_size, validators)[1]
+        except ImageDeadlineError:
+            self.failures.record_abandoned(image_url)
+            raise
+        except Exception as e:
+            # print(f"Error downloading {image_url}: {e}") # Debug log
+            self.failures.record_failure(image_url, e)
+            return None
+        self.failures.record_success(image_url)
+        return master
+
+    def _is_stale(self, image_url):
+        """True si hay un maestro en disco que superó la ventana de frescura (los del ZIP nunca cambian)"""
+        return self.disk_cache_enabled and not is_bundle_url(image_url) and self.disk_store.is_stale(
+            self._get_cache_hash(image_url, 'master'), self.IMAGE_FRESHNESS_HOURS * 3600
+        )
+
+    def revalidate_image(self, image_url, max_size=(400, 400), deadline=None):
+        """
+        Petición condicional del maestro en caché.
+        Returns: 'revalidated' (304), 'updated' (imagen nueva) o None (fuente no disponible: se sigue sirviendo la copia)
+        """
+        if self.failures.check(image_url):
+            return None
+        master_key = self._get_cache_hash(image_url, 'master')
+        try:
+            content, validators = self.fetcher.fetch(
+                image_url, max_bytes=self.MAX_IMAGE_BYTES, validators=self.disk_store.get_validators(master_key), deadline=deadline
+            )
+            self._replace_image(image_url, content, max_size, validators)
+        except ImageNotModified as e:
+            self.disk_store.mark_validated(master_key, e.validators)
+            self.failures.record_success(image_url)
+            return 'revalidated'
+        except ImageSkippedError:
+            self.failures.record_abandoned(image_url)
+            return None
+        except Exception as e:
+            self.failures.record_failure(image_url, e)
+            return None
+        self.failures.record_success(image_url)
+        return 'updated'
+
+    def _replace_image(self, image_url, content, max_size, validators):
+        """La imagen cambió en el origen: descarta todas sus variantes (memoria + disco) y guarda la nueva"""
+        decoded = self._decode(content, max_size) # An undecodable new version keeps the cached one
+        self.image_cache.discard_prefix(f"{image_url}_")
+        self.disk_store.delete_source(image_url)
+        return self._store_decoded(image_url, max_size, decoded, validators)
+
+    def _prefetch_one(self, image_url, max_size, deadline=None):
+        """Precarga de una URL: revalida el maestro si está vencido, si no descarga/deriva"""
+        if self._is_stale(image_url):
+            status = self.revalidate_image(image_url, max_size, deadline)
+            if status is not None:
+                return None, status
+        return self.download_image(image_url, max_size, deadline)
+
+    def _lookup_master(self, image_url):
+        """Maestro canónico en memoria o disco. Returns JPEG bytes o None"""
+        cache_key = f"{image_url}_master"
+        master = self.image_cache.get(cache_key)
+        if master is not None:
+            return master
+        if self.disk_cache_enabled:
+            master = self.disk_store.get(self._get_cache_hash(image_url, 'master'))
+            if master is not None:
+                self.image_cache.put(cache_key, master) # Promote to memory
+                return master
+        return None
+
+    def _derive_and_store(self, image_url, master, max_size):
+        """Deriva un tamaño a partir del maestro (pool de procesos) y lo cachea (disco + memoria)"""
+        derived, pixels = run_decode(derive_size, master, max_size, max_workers=self.DECODE_WORKERS)
+        image = image_from_pixels(pixels)
+        self._store_disk(image_url, max_size, derived)
+        self.image_cache[f"{image_url}_{max_size}"] = image
+        return image
+
+    def _store_disk(self, image_url, variant, data, validators=None):
+        """Añade bytes codificados al pack en disco (best effort)"""
+        if self.disk_cache_enabled:
+            try:
+                self.disk_store.put(self._get_cache_hash(image_url, variant), data, variant=variant,
+                                    host=get_host(image_url), source=image_url, validators=validators)
+            except Exception:
+                pass
+
+    def _lookup_cached(self, image_url, max_size):
+        """Busca en memoria y luego en disco. Returns (image, status) o None"""
         cache_key = f"{image_url}_{max_size}"
         # 1. Check Memory Cache
-        if cache_key in self.image_cache:
-            return self.image_cache[cache_key], "cache"
+        image = self.image_cache.get(cache_key)
+        if image is not None:
+            return image, "cache"
         
         # 2. Check Disk Cache (if enabled)
-        cache_path = None
         if self.disk_cache_enabled:
-            cache_path = self._get_cache_path(image_url, max_size)
-            if os.path.exists(cache_path):
+            disk_key = self._get_cache_hash(image_url, max_size)
+            data = self.disk_store.get(disk_key)
+            if data is not None:
                 try:
                     # Simple open, no pickle
-                    image = Image.open(cache_path)
+                    image = Image.open(io.BytesIO(data))
                     image.load() # Verify integrity
                     self.image_cache[cache_key] = image # Promote to memory
                     return image, "disk"
                 except Exception:
-                    # Corrupt file? Delete it
-                    try: os.remove(cache_path)
-                    except: pass
+                    # Corrupt entry? Drop it
+                    self.disk_store.delete(disk_key)
+        return None
 
-        # 3. Download from Net
-        try:
-            # FIX: User-Agent to avoid 403 blocks
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            response = requests.get(str(image_url), headers=headers, timeout=10) # 10s timeout
-            response.raise_for_status()
-            
-            image = Image.open(io.BytesIO(response.content))
-            
-            # Convert P to RGBA/RGB
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            
-            # Thumbnail processing (Save space)
-            if image.size[0] > max_size[0] or image.size[1] > max_size[1]:
-                image.thumbnail(max_size, Image.Resampling.LANCZOS)
-            
-            # Ensure RGB for JPEG saving
-            if image.mode in ('RGBA', 'LA'):
-                background = Image.new('RGB', image.size, (255, 255, 255))
-                background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-                image = background
-            
-            # 4. Save to Disk Cache (if enabled)
-            if self.disk_cache_enabled and cache_path:
-                try:
-                    # Save as standard JPEG
-                    image.save(cache_path, "JPEG", quality=85)
-                except Exception as e:
-                    pass 
-            
-            image.load()    
-            self.image_cache[cache_key] = image
-            return image, "download"
-            
-        except Exception as e:
-            # print(f"Error downloading {image_url}: {e}") # Debug log
-            return self.placeholder_image, "error"
+    def get_encoded_image(self, image_url, target='pdf', max_size=(400, 400), deadline=None):
+        """
+        Imagen ya codificada para un destino (ENCODED_TARGETS), cacheada en memoria.
+        Returns: (data, (width, height), status)
+        """
+        cache_key = f"{image_url}_{max_size}_{target}"
+        entry = self.image_cache.get(cache_key)
+        if entry is not None:
+            return entry[0], entry[1], "cache"
+        
+        image, status = self.download_image(image_url, max_size, deadline)
+        if status in self.PLACEHOLDER_STATUSES:
+            data, size = self.get_encoded_placeholder(target, max_size)
+            return data, size, status
+        
+        data = self._encode_image(image, target, self._get_cache_hash(image_url, max_size))
+        self.image_cache.put(cache_key, (data, image.size), nbytes=len(data))
+        return data, image.size, status
+
+    def _encode_image(self, image, target, disk_key=None):
+        """Codifica un PIL Image según el destino"""
+        spec = self.ENCODED_TARGETS[target]
+        data = None
+        if spec.get('reuse_disk') and disk_key and self.disk_cache_enabled:
+            # Disk cache already holds this exact JPEG: reuse it instead of re-encoding
+            data = self.disk_store.get(disk_key)
+        if data is None:
+            return self.encode_for_target(image, target)
+        return self._as_target(data, spec)
+
+    @classmethod
+    def encode_for_target(cls, image, target):
+        """Codifica un PIL Image según el destino, sin pasar por el caché en disco"""
+        spec = cls.ENCODED_TARGETS[target]
+        buffered = io.BytesIO()
+        image.save(buffered, format=spec['format'], quality=spec['quality'])
+        return cls._as_target(buffered.getvalue(), spec)
+
+    @staticmethod
+    def _as_target(data, spec):
+        if spec.get('data_uri'):
+            mime = spec['format'].lower()
+            return f"data:image/{mime};base64,{base64.b64encode(data).decode()}"
+        return data
+
+    def get_encoded_placeholder(self, target, max_size=None):
+        """Placeholder ya codificado (singleton de proceso). Returns (data, (width, height))"""
+        return self.placeholder.encoded(target, lambda image: self.encode_for_target(image, target), max_size)
+
+    def _decode_and_store(self, image_url, content, max_size, validators=None):
+        """
+        Etapa de decodificación (pool de procesos): maestro + tamaño pedido, ya codificados
+        para el caché en disco. validators (ETag / Last-Modified) se guardan con el maestro.
+        Returns (image, master)
+        """
+        return self._store_decoded(image_url, max_size, self._decode(content, max_size), validators)
+
+    def _decode(self, content, max_size):
+        return run_decode(
+            decode_master_and_size, content, self.MASTER_SIZE, self.MASTER_QUALITY, max_size,
+            max_workers=self.DECODE_WORKERS
+        )
+
+    def _store_decoded(self, image_url, max_size, decoded, validators=None):
+        master, derived, pixels = decoded
+        image = image_from_pixels(pixels)
+        self._store_disk(image_url, 'master', master, validators)
+        self._store_disk(image_url, max_size, derived)
+        self.image_cache.put(f"{image_url}_master", master)
+        self.image_cache[f"{image_url}_{max_size}"] = image
+        return image, master
 
-    def download_images_concurrently(self, urls, max_workers=10, progress_callback=None):
+    def download_images_concurrently(self, urls, max_workers=10, progress_callback=None, deadline=None, max_size=(400, 400)):
         """
-        Descarga múltiples imágenes en paralelo.
-        Returns: Dict with stats {'total', 'ok', 'failed', 'empty', 'cached'}
+        Descarga múltiples imágenes en paralelo. deadline: fin de la fase de imágenes (time.monotonic())
+        max_size: el tamaño que pedirá la maquetación, para que luego solo lea del caché
+        Returns: Dict with stats {'total', 'ok', 'failed', 'empty', 'cached', 'coalesced', 'skipped', 'revalidated', 'updated', 'deadline'}
         """
         import concurrent.futures
         
-        stats = {'total': len(urls), 'valid_urls': 0, 'ok': 0, 'failed': 0, 'empty': 0, 'cached': 0}
+        stats = {'total': len(urls), 'valid_urls': 0, 'ok': 0, 'failed': 0, 'empty': 0, 'cached': 0, 'coalesced': 0, 'skipped': 0, 'revalidated': 0, 'updated': 0, 'deadline': 0}
         
-        unique_urls = [u for u in list(set(urls)) if pd.notna(u) and u and str(u) != 'nan']
-        stats['valid_urls'] = len(unique_urls)
-        stats['empty'] = stats['total'] - stats['valid_urls']
-        
-        total = len(unique_urls)
-        completed = 0
+        # Pool size follows max_workers so no thread waits for a free connection
+        self.fetcher.ensure_pool_size(max_workers)
+        conn_before = self.fetcher.get_stats()
         
-        if total == 0:
-            return stats
-        
-        # Pre-check cache to avoid unnecessary threads
-        to_download = [u for u in unique_urls if f"{u}_{(300, 300)}" not in self.image_cache and f"{u}_{(400, 400)}" not in self.image_cache]
-        cached_count = total - len(to_download)
-        
-        if progress_callback and cached_count > 0:
-            progress_callback(cached_count, total)
-            completed = cached_count
-            stats['cached'] = cached_count
-            stats['ok'] += cached_count
-
+        to_download, total, completed = self._plan_prefetch(urls, stats, progress_callback, max_size)
         if not to_download:
             return stats
 
         with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
             # Create a dictionary to map future to url
-            future_to_url = {executor.submit(self.download_image, url, (300, 300)): url for url in to_download}
+            future_to_url = {executor.submit(self._prefetch_one, url, max_size, deadline): url for url in to_download}
             
             for future in concurrent.futures.as_completed(future_to_url):
                 completed += 1
@@ -415,38 +674,242 @@ class ImageManager:
                     progress_callback(completed, total)
                 try:
                     img, status = future.result() # Now returns tuple (image, status)
-                    if status == 'error':
-                        stats['failed'] += 1
-                    else:
-                        stats['ok'] += 1
+                    self._count_status(stats, status)
                 except Exception:
                     stats['failed'] += 1
-                    
+        
+        stats['connections'] = PooledImageFetcher.diff_stats(conn_before, self.fetcher.get_stats())
+        stats['concurrency'] = self.fetcher.limiter.stats(group_urls_by_host([u for u in to_download if not is_bundle_url(u)]))
+        stats['memory_cache'] = self.image_cache.stats()
+        self.failures.flush()
+        stats['failures'] = self.failures.stats()
         return stats
+
+    @staticmethod
+    def _count_status(stats, status):
+        """Acumula el estado de una imagen en las stats de la descarga"""
+        if status in ('error', 'skipped', 'deadline'):
+            stats['failed'] += 1
+            if status in ('skipped', 'deadline'):
+                stats[status] += 1
+        else:
+            stats['ok'] += 1
+            if status == 'shared':
+                stats['coalesced'] += 1
+            elif status in ('revalidated', 'updated'):
+                stats[status] += 1
     
-    def _generate_placeholder_image(self):
-        """Generar imagen placeholder para productos sin imagen"""
-        width, height = 300, 300
-        image = Image.new('RGB', (width, height), color='#f0f0f0')
-        draw = ImageDraw.Draw(image)
+    def _plan_prefetch(self, urls, stats, progress_callback=None, max_size=(400, 400)):
+        """
+        Deduplica URLs y descarta las que ya están en memoria en max_size (salvo maestros vencidos, que se revalidan).
+        Returns: (to_download, total, completed) y actualiza stats in-place
+        """
+        unique_urls = [u for u in list(set(urls)) if pd.notna(u) and u and str(u) != 'nan']
+        stats['valid_urls'] = len(unique_urls)
+        stats['empty'] = stats['total'] - stats['valid_urls']
         
-        draw.rectangle([10, 10, width-10, height-10], outline='#cccccc', width=2)
+        total = len(unique_urls)
+        if total == 0:
+            return [], 0, 0
         
-        try:
-            font = ImageFont.truetype("arial.ttf", 24)
-        except:
-            font = ImageFont.load_default()
-            
-        text = "Sin imagen"
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
+        # Pre-check cache to avoid unnecessary threads. A master alone still goes to the pool:
+        # deriving the requested size here keeps that work off the layout thread
+        to_download = [u for u in unique_urls if f"{u}_{max_size}" not in self.image_cache or self._is_stale(u)]
+        cached_count = total - len(to_download)
+        stats['cached'] = cached_count
+        stats['ok'] += cached_count
         
-        text_x = (width - text_width) // 2
-        text_y = (height - text_height) // 2
+        stats['memory_cache'] = self.image_cache.stats()
         
-        draw.text((text_x, text_y), text, fill='#999999', font=font)
-        return image
+        if progress_callback and cached_count > 0:
+            progress_callback(cached_count, total)
+        return to_download, total, cached_count
+
+    def download_images_async(self, urls, max_size=(400, 400), global_limit=None, per_host_limit=None, progress_callback=None, deadline=None):
+        """
+        Descarga con asyncio: cientos de peticiones en vuelo sin cientos de hilos.
+        Agrupa por host, aplica límites por host y global, y envía cada imagen
+        a la etapa de decodificación en cuanto llega.
+        Returns: mismo dict de stats que download_images_concurrently
+        """
+        if not HAS_AIOHTTP:
+            return self.download_images_concurrently(urls, max_workers=self.FETCH_MAX_WORKERS, progress_callback=progress_callback, deadline=deadline, max_size=max_size)
+        
+        global_limit = global_limit or self.ASYNC_GLOBAL_LIMIT
+        per_host_limit = per_host_limit or self.ASYNC_PER_HOST_LIMIT
+        stats = {'total': len(urls), 'valid_urls': 0, 'ok': 0, 'failed': 0, 'empty': 0, 'cached': 0, 'coalesced': 0, 'skipped': 0, 'revalidated': 0, 'updated': 0, 'deadline': 0}
+        to_download, total, completed = self._plan_prefetch(urls, stats, progress_callback, max_size)
+        if not to_download:
+            return stats
+        
+        progress = {'completed': completed}
+        
+        def on_done(status):
+            progress['completed'] += 1
+            self._count_status(stats, status)
+            if progress_callback:
+                progress_callback(progress['completed'], total)
+        
+        counters = {'retries': 0}
+        coro = self._prefetch_async(to_download, max_size, global_limit, per_host_limit, on_done, deadline, counters)
+        try:
+            asyncio.get_running_loop()
+            in_event_loop = True
+        except RuntimeError:
+            in_event_loop = False
+        
+        if in_event_loop:
+            # Already inside an event loop: run the pipeline on its own loop in a helper thread
+            import concurrent.futures
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as runner:
+                runner.submit(asyncio.run, coro).result()
+        else:
+            asyncio.run(coro)
+        
+        remote = [u for u in to_download if not is_bundle_url(u)]
+        stats['fetch_mode'] = 'async'
+        stats['connections'] = {
+            'hosts': len(group_urls_by_host(remote)),
+            'global_limit': global_limit,
+            'per_host_limit': per_host_limit,
+            'retries': counters['retries'],
+        }
+        stats['concurrency'] = self.fetcher.limiter.stats(group_urls_by_host(remote))
+        stats['memory_cache'] = self.image_cache.stats()
+        self.failures.flush()
+        stats['failures'] = self.failures.stats()
+        return stats
+
+    async def _prefetch_async(self, urls, max_size, global_limit, per_host_limit, on_done, deadline=None, counters=None):
+        """Pipeline: disco -> red (asyncio, condicional para maestros vencidos) -> decodificación (pool de hilos)"""
+        import concurrent.futures
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count() or 4) as decode_pool:
+            # 1. Local hits (requested size or canonical master) never touch the network
+            lookups = await asyncio.gather(*[
+                loop.run_in_executor(decode_pool, self._lookup_local, url, max_size) for url in urls
+            ])
+            misses = []
+            stale = {}  # url -> status of the local copy, served if revalidation fails
+            for url, cached in zip(urls, lookups):
+                if cached is not None and self._is_stale(url):
+                    stale[url] = cached[1]
+                elif cached is not None:
+                    on_done(cached[1])
+                else:
+                    misses.append(url)
+            
+            # 2. Single-flight on the master: URLs already in flight elsewhere are awaited, not fetched
+            leaders = {}
+            followers = []
+            
+            async def follow(url, future):
+                try:
+                    # shield: giving up on the wait must not cancel the shared flight for other waiters
+                    timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                    master = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+                    if master is None:
+                        raise ValueError("master fetch failed")
+                    await loop.run_in_executor(decode_pool, self._derive_and_store, url, master, max_size)
+                    on_done('shared')
+                except asyncio.TimeoutError:
+                    on_done('deadline')
+                except ImageDeadlineError:
+                    if deadline is not None and time.monotonic() >= deadline:
+                        on_done('deadline')
+                    else:
+                        # The leader ran out of its own (export) deadline, not ours
+                        _, status = await loop.run_in_executor(decode_pool, self.download_image, url, max_size, deadline)
+                        on_done(status)
+                except Exception:
+                    on_done('error')
+            
+            async def read_bundle(url):
+                # ZIP members skip the network stage; download_image keeps the single-flight
+                _, status = await loop.run_in_executor(decode_pool, self.download_image, url, max_size, deadline)
+                on_done(status)
+            
+            for url in misses:
+                if is_bundle_url(url):
+                    followers.append(read_bundle(url))
+                    continue
+                key = self._get_cache_hash(url, 'master')
+                future, is_leader = self.flights.begin(key)
+                if is_leader:
+                    leaders[url] = (key, future)
+                else:
+                    followers.append(follow(url, future))
+            
+            def settle(url, master=None):
+                if url in leaders:
+                    key, future = leaders[url]
+                    self.flights.finish(key, future, result=master)
+            
+            def cached_validators(url):
+                if url in stale:
+                    return self.disk_store.get_validators(self._get_cache_hash(url, 'master'))
+                return None
+            
+            try:
+                # 3. Network stage streams each body to the decode stage as it arrives
+                pending = []
+                async for url, content, error, validators in stream_images_async(
+                    list(leaders) + list(stale), global_limit, per_host_limit, max_bytes=self.MAX_IMAGE_BYTES,
+                    skip=self.failures.check, validators=cached_validators, limiter=self.fetcher.limiter,
+                    deadline=deadline, counters=counters
+                ):
+                    if isinstance(error, ImageNotModified):
+                        self.disk_store.mark_validated(self._get_cache_hash(url, 'master'), error.validators)
+                        self.failures.record_success(url)
+                        on_done('revalidated')
+                        continue
+                    if error is not None and url in stale:
+                        # Source unavailable: keep serving the cached copy
+                        if isinstance(error, ImageSkippedError):
+                            self.failures.record_abandoned(url)
+                        else:
+                            self.failures.record_failure(url, error)
+                        on_done(stale[url])
+                        continue
+                    if error is not None:
+                        settle(url)
+                        if isinstance(error, ImageSkippedError):
+                            self.failures.record_abandoned(url)
+                        if isinstance(error, ImageDeadlineError):
+                            on_done('deadline')
+                        elif isinstance(error, ImageSkippedError):
+                            on_done('skipped')
+                        else:
+                            self.failures.record_failure(url, error)
+                            on_done('error')
+                        continue
+                    store = self._replace_image if url in stale else self._decode_and_store
+                    future = loop.run_in_executor(decode_pool, store, url, content, max_size, validators)
+                    
+                    def on_decoded(f, url=url):
+                        if f.cancelled():
+                            # Deadline or pipeline cancelled while the image was decoding
+                            settle(url)
+                            on_done('deadline')
+                            return
+                        error = f.exception()
+                        if error:
+                            self.failures.record_failure(url, error)
+                            settle(url)
+                            on_done(stale.get(url, 'error'))
+                        else:
+                            self.failures.record_success(url)
+                            settle(url, f.result()[1])
+                            on_done('updated' if url in stale else 'download')
+                    
+                    future.add_done_callback(on_decoded)
+                    pending.append(future)
+                await asyncio.gather(*pending, *followers, return_exceptions=True)
+            finally:
+                # Never leave waiters hanging if the pipeline is cancelled or fails
+                for url in leaders:
+                    settle(url)
+
 
 class CatalogGenerator:
     """Clase para generar catálogos visuales de productos - MEJORADA v1.2"""
@@ -509,11 +972,8 @@ class CatalogGenerator:
         with st.container():
             # Image handling with Lazy Toggle
             if show_images:
-                image, status = self.image_manager.download_image(product['ImagenURL'])
-                buffered = io.BytesIO()
-                image.save(buffered, format="PNG")
-                img_str = base64.b64encode(buffered.getvalue()).decode()
-                st.markdown(f"<div class='product-image-container'><img src='data:image/png;base64,{img_str}' alt='{product['Producto']}'></div>", unsafe_allow_html=True)
+                img_src, _, status = self.image_manager.get_encoded_image(product['ImagenURL'], target='preview')
+                st.markdown(f"<div class='product-image-container'><img src='{img_src}' alt='{product['Producto']}'></div>", unsafe_allow_html=True)
             else:
                 # Placeholder HTML separate from ImageManager logic for pure speed
                 st.markdown(f"""
@@ -565,18 +1025,25 @@ class CatalogGenerator:
 class EnhancedPDFExporter:
     """Clase mejorada para exportar catálogos a PDF con imágenes"""
     
+    SHARDED_MIN_PRODUCTS = 1000 # Por debajo, arrancar workers y unir PDFs cuesta más de lo que ahorra
+    SHARD_TARGET_PRODUCTS = 500 # Productos por tramo; fijo para que los cortes no se muevan entre exportaciones
+    SECTION_CACHE_MB = 256 # PDFs de tramos ya maquetados, compartidos por el proceso
+    PDF_STORE_MB = 512 # PDFs terminados en disco, por huella del catálogo exportado
+    PRO_IMAGE_PIXELS = (400, 400) # Tamaño decodificado de las imágenes por layout: la precarga prepara el mismo
+    CLASSIC_IMAGE_PIXELS = (300, 300)
+    
     def __init__(self):
         self.styles = getSampleStyleSheet()
         self.image_manager = ImageManager()
+        self.section_cache = get_section_cache(self.SECTION_CACHE_MB)
+        self.pdf_store = get_pdf_store(os.path.join(ImageManager.CACHE_DIR, 'pdf'), self.PDF_STORE_MB, ImageManager.IMAGE_FRESHNESS_HOURS * 3600)
         self.business_name_for_footer = ""
         self.phone_number_for_footer = ""
         self.email_for_footer = ""
 
     def _clean_text(self, val):
         """Clean nan values from text fields"""
-        if pd.isna(val) or str(val).lower() == 'nan':
-            return ""
-        return str(val)
+        return clean_text(val)
 
     def _get_pro_image(self, image_url):
         """
@@ -585,66 +1052,35 @@ class EnhancedPDFExporter:
         Returns a ReportLab Image object.
         """
         try:
-            pil_img, status = self.image_manager.download_image(image_url)
-            
-            # Target size in ReportLab points (1.5 inch = 108 pts approx)
-            target_size_pts = 108 
-            
-            # Create a ReportLab Image from the PIL image
-            # We save it to a buffer first to be safe with ReportLab's expected input
-            img_buffer = io.BytesIO()
-            pil_img.save(img_buffer, format='PNG')
-            img_buffer.seek(0)
-            
-            rl_img = RLImage(img_buffer)
-            
-            # Scaling logic: Fit inside target_size_pts x target_size_pts
-            img_width, img_height = pil_img.size
-            if img_width > img_height:
-                factor = target_size_pts / img_width
-            else:
-                factor = target_size_pts / img_height
-                
-            rl_img.drawWidth = img_width * factor
-            rl_img.drawHeight = img_height * factor
-            
-            # Force max dimensions just in case
-            if rl_img.drawWidth > target_size_pts: rl_img.drawWidth = target_size_pts
-            if rl_img.drawHeight > target_size_pts: rl_img.drawHeight = target_size_pts
-            
-            return rl_img
+            jpeg_bytes, size, status = self.image_manager.get_encoded_image(
+                image_url, target='pdf', max_size=self.PRO_IMAGE_PIXELS, deadline=getattr(self, 'image_deadline', None)
+            )
+            # Pre-encoded JPEG from the cache: ReportLab embeds it without re-encoding
+            key = 'placeholder' if status in ImageManager.PLACEHOLDER_STATUSES else f"{image_url}_{self.PRO_IMAGE_PIXELS}"
+            return pro_image(jpeg_bytes, size, key=key)
         except Exception:
             return None
 
-    def _build_pdf_pro(self, df, business_name, currency, progress_callback=None, branding=None):
+    def _build_pdf_pro(self, df, business_name, currency, progress_callback=None, branding=None, layout_engine='platypus'):
         """
         Professional Layout Engine (v2) - Enhanced with Hierarchy
         Order: Línea -> Familia -> Grupo -> Producto
+        layout_engine: 'platypus' (Tables) | 'grid' (tarjetas en coordenadas precalculadas, mismo resultado)
         """
+        story = self._build_cover_story(business_name, branding)
+        story.extend(product_story(
+            layout_engine, df, currency, self._get_pro_image, branding,
+            progress_callback=(lambda done, total: progress_callback(0.5 + 0.45 * (done / total))) if progress_callback else None
+        ))
+        return story
+
+    def _build_cover_story(self, business_name, branding=None):
+        """Portada del layout profesional: logo, título y subtítulo/fecha, y salto de página"""
         story = []
-        
-        # Defaults if no branding provided
-        if not branding:
-            branding = {
-                'primary': '#2c3e50', 
-                'secondary': '#e74c3c', 
-                'accent': '#3498db', 
-                'text': '#2c3e50'
-            }
+        branding = branding or DEFAULT_BRANDING
         
         # Title Style
         title_style = ParagraphStyle('CustomTitle', parent=self.styles['Heading1'], fontSize=24, spaceAfter=20, alignment=TA_CENTER, textColor=colors.HexColor(branding['primary']))
-        
-        # Hierarchy Headers
-        h1_style = ParagraphStyle('H1_Linea', parent=self.styles['Heading2'], fontSize=18, spaceBefore=20, spaceAfter=10, textColor=colors.HexColor(branding['secondary']), borderPadding=5, borderWidth=0)
-        h2_style = ParagraphStyle('H2_Familia', parent=self.styles['Heading3'], fontSize=14, spaceBefore=10, spaceAfter=5, textColor=colors.HexColor(branding['accent']), leftIndent=10)
-        h3_style = ParagraphStyle('H3_Grupo', parent=self.styles['Heading4'], fontSize=12, spaceBefore=5, spaceAfter=5, textColor=colors.HexColor(branding['text']), leftIndent=20)
-        
-        # Product Text Styles
-        prod_name_style = ParagraphStyle('ProdName', parent=self.styles['Normal'], fontSize=10, leading=12, fontName='Helvetica-Bold', textColor=colors.HexColor(branding['text']))
-        prod_desc_style = ParagraphStyle('ProdDesc', parent=self.styles['Normal'], fontSize=8, leading=10, textColor=colors.HexColor('#7f8c8d'))
-        prod_meta_style = ParagraphStyle('ProdMeta', parent=self.styles['Normal'], fontSize=9, leading=11, textColor=colors.HexColor(branding['primary']))
-
 
         # --- COVER PAGE ---
         # Logo Logic (CP-BUG-019 fix: Support both session upload and DB persistence)
@@ -719,139 +1155,6 @@ class EnhancedPDFExporter:
 
         story.append(Spacer(1, 40))
         story.append(PageBreak()) # Start products on Page 2
-        
-        # --- HIERARCHY PROCESSING ---
-        # Ensure hierarchy columns exist
-        hierarchy_cols = ['Línea', 'Familia', 'Grupo']
-        valid_cols = [c for c in hierarchy_cols if c in df.columns]
-        
-        # Check if hierarchy columns have actual data (not all NaN)
-        has_hierarchy_data = False
-        if valid_cols:
-            for col in valid_cols:
-                if df[col].notna().any():
-                    has_hierarchy_data = True
-                    break
-        
-        # If no hierarchy data, process all products without grouping
-        if not has_hierarchy_data or not valid_cols:
-            # No hierarchy - process all products as one flat list
-            valid_cols = []  # Don't group by anything
-            df_sorted = df.sort_values(by=['Producto'])
-            
-            # Create a single "group" with all products
-            grouped = [(None, df_sorted)]
-        else:
-            # Has hierarchy - use normal grouping
-            # Sort Data
-            sort_cols = valid_cols + ['Producto']
-            df_sorted = df.sort_values(by=sort_cols)
-            
-            # Grouping Logic
-            grouped = df_sorted.groupby(valid_cols)
-        
-        total_rows = len(df_sorted)
-        processed_rows = 0
-        
-        # We can implement a "smart iterator" that checks previous key.
-        prev_keys = [None] * len(valid_cols) if valid_cols else []
-        
-        # However, to use KeepTogether properly on the LOWEST level (Grupo + Products), we should group by the FULL hierarchy.
-        
-        for name, group in grouped:
-            # 'name' is a tuple of values (Linea, Familia, Grupo)
-            if not isinstance(name, tuple): name = (name,)
-            
-            # Check Level Changes (only if we have hierarchy)
-            if prev_keys:  # Only process headers if we have hierarchy
-                for i, val in enumerate(name):
-                    if val != prev_keys[i]:
-                        # Level i changed. Print Header i and all subsequent headers
-                        clean_val = self._clean_text(val)
-                        if not clean_val: continue
-                        
-                        if i == 0: story.append(Paragraph(str(clean_val).upper(), h1_style))
-                        elif i == 1: story.append(Paragraph(str(clean_val), h2_style))
-                        elif i == 2: story.append(Paragraph(str(clean_val), h3_style))
-                        
-                        # Reset lower levels
-                        for j in range(i+1, len(prev_keys)):
-                            prev_keys[j] = None
-                        prev_keys[i] = val
-                    
-            # --- Build Product Table for this Group ---
-            section_elements = []  
-            data_matrix = []
-            row_buffer = []
-            
-            for idx, row in group.iterrows():
-                # Prepare Cell Content
-                img_obj = self._get_pro_image(row['ImagenURL'])
-                p_name = self._clean_text(row['Producto'])
-                p_desc = self._clean_text(row.get('Descripción', ''))
-                p_unit = self._clean_text(row.get('Unidad', ''))
-                p_price = row['Precio']
-                price_str = f"{currency} {float(p_price):.2f}" if pd.notna(p_price) else ""
-                
-                cell_content = [
-                    img_obj if img_obj else Paragraph("Sin Imagen", prod_desc_style),
-                    Spacer(1, 5),
-                    Paragraph(p_name, prod_name_style),
-                    Paragraph(p_desc[:100], prod_desc_style),
-                    Spacer(1, 3),
-                    Paragraph(f"<b>{price_str}</b> / {p_unit}", prod_meta_style)
-                ]
-                row_buffer.append(cell_content)
-                if len(row_buffer) == 2:
-                    data_matrix.append(row_buffer)
-                    row_buffer = []
-
-            if row_buffer:
-                while len(row_buffer) < 2: row_buffer.append([])
-                data_matrix.append(row_buffer)
-
-            if data_matrix:
-                t = Table(data_matrix, colWidths=[240, 240])
-                t.setStyle(TableStyle([
-                    ('VALIGN', (0,0), (-1,-1), 'TOP'),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('LEFTPADDING', (0,0), (-1,-1), 10),
-                    ('RIGHTPADDING', (0,0), (-1,-1), 10),
-                    ('TOPPADDING', (0,0), (-1,-1), 10),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 15),
-                    ('GRID', (0,0), (-1,-1), 0.5, colors.HexColor('#ecf0f1')),
-                ]))
-                
-                # KeepTogether logic: Keep the whole table if small, or at least the first row?
-                # Actually, the requirement says "Section Header" + "Products".
-                # But here we already printed headers outside the Loop (above). 
-                # This could result in orphaned H3.
-                # FIX: We should accumulate elements and flush them with KeepTogether.
-                
-                # Since we are printing headers "on the fly" inside the loop based on diff, 
-                # they are already added to 'story'. 'KeepTogether' won't work retroactively.
-                # REFACTOR STRATEGY: Instead of direct append, build a 'block' of flowables.
-                # But 'grouped' gives us the lowest level chunk.
-                # So we can effectively wrap THIS chunk (Table) with the LAST Header (H3) if it was just printed.
-                
-                # Simpler: Just allow breaks for now, but KeepTogether the Table (or chunks of it).
-                # ReportLab Table handles page breaks automatically unless wrapped in KeepTogether.
-                # If we want to prevent orphaned headers, we should use KeepTogether([Header, Table]).
-                # But headers are hierarchical.
-                
-                # Minimal Robust: Just add the table. If a header is at bottom, it's a known ReportLab issue.
-                # Solving strictly requires a recursive build or buffering.
-                # Given strict deadline, we stick to standard flow. The Table itself is unbreakable if wrapped, 
-                # but we want it breakable.
-                
-                # COMPROMISE for v1.2.5: Add table to story. 
-                story.append(t)
-                story.append(Spacer(1, 10))
-            
-            processed_rows += len(group)
-            if progress_callback:
-                progress_callback(0.5 + 0.45 * (processed_rows / total_rows))
-                
         return story
 
     def _add_footer(self, canvas, doc):
@@ -876,6 +1179,7 @@ class EnhancedPDFExporter:
 
     def generate_pdf_with_images(self, df, business_name, currency, phone_number, user_email):
         """LEGACY: Generar PDF del catálogo con imágenes de productos"""
+        self.image_deadline = None
         self.business_name_for_footer = business_name
         self.phone_number_for_footer = phone_number
         self.email_for_footer = user_email
@@ -898,8 +1202,69 @@ class EnhancedPDFExporter:
         
         return self._build_pdf_doc(doc, df, currency, business_name)
 
-    def generate_pdf_optimized(self, df, business_name, currency, phone_number, user_email, progress_callback=None, use_pro_layout=True):
-        """OPTIMIZED v1.2.1: Generar PDF con descarga paralela e instrumentación"""
+    def generate_pdf_optimized(self, df, business_name, currency, phone_number, user_email, progress_callback=None, use_pro_layout=True, fetch_mode='auto', render_mode='auto', layout_engine='platypus'):
+        """
+        OPTIMIZED v1.2.1: Generar PDF con descarga paralela e instrumentación
+        render_mode: 'single' (un solo proceso) | 'sharded' (tramos por Línea en el pool de procesos) | 'auto'
+        layout_engine: 'platypus' | 'grid' (motor rápido del layout profesional, ver pdf_grid)
+        Un catálogo idéntico a uno ya exportado se sirve desde el almacén de PDFs sin regenerarlo.
+        """
+        start_time = time.time()
+        if layout_engine not in LAYOUT_ENGINES:
+            raise ValueError(f"Motor de maquetación desconocido: {layout_engine}")
+        artifact_key = self._artifact_key(df, business_name, currency, phone_number, user_email, use_pro_layout, render_mode, layout_engine)
+        cached = self.pdf_store.get(artifact_key)
+        if cached is not None:
+            pdf_bytes, meta = cached
+            if progress_callback: progress_callback(1.0, "📦 Catálogo sin cambios: PDF recuperado del almacén")
+            stats = {
+                "total_time": time.time() - start_time,
+                "fetch_time": 0,
+                "render_time": 0,
+                "img_stats": meta.get('img_stats', {}),
+                "file_size_mb": len(pdf_bytes) / (1024 * 1024),
+                "page_count": meta.get('page_count'),
+                "render_mode": 'cached',
+                "layout_engine": meta.get('layout_engine', layout_engine),
+                "shards": meta.get('shards', 1)
+            }
+            return pdf_bytes, stats
+
+        pdf_bytes, stats = self._generate_pdf(df, business_name, currency, phone_number, user_email, progress_callback, use_pro_layout, fetch_mode, render_mode, layout_engine)
+
+        # Placeholders from failed or late images are not frozen into the stored artifact
+        img_stats = stats['img_stats']
+        if not (img_stats.get('failed') or img_stats.get('skipped') or img_stats.get('deadline')):
+            self.pdf_store.put(artifact_key, pdf_bytes, {
+                'page_count': stats['page_count'],
+                'shards': stats.get('shards', 1),
+                'layout_engine': stats.get('layout_engine'),
+                'img_stats': {k: img_stats.get(k, 0) for k in ('total', 'valid_urls', 'ok', 'failed', 'empty')}
+            })
+        return pdf_bytes, stats
+
+    def _artifact_key(self, df, business_name, currency, phone_number, user_email, use_pro_layout, render_mode, layout_engine='platypus'):
+        """Huella de todo lo que entra en el PDF: datos, branding, layout, logo, portada y pie de página"""
+        user_info = st.session_state.get('user_info', {})
+        logo = st.session_state.get('logo')
+        logo_bytes = logo.getvalue() if hasattr(logo, 'getvalue') else None
+        return catalog_fingerprint(
+            df,
+            LAYOUT_VERSION,
+            bool(use_pro_layout),
+            layout_engine if use_pro_layout else None,
+            self._use_sharded_render(df, use_pro_layout, render_mode),
+            st.session_state.get('branding_config'),
+            logo_bytes or user_info.get('logo_base64'),
+            user_info.get('pdf_custom_title'),
+            user_info.get('pdf_custom_subtitle'),
+            business_name, currency, phone_number, user_email,
+            # The cover prints today's date
+            datetime.now().strftime('%d/%m/%Y')
+        )
+
+    def _generate_pdf(self, df, business_name, currency, phone_number, user_email, progress_callback=None, use_pro_layout=True, fetch_mode='auto', render_mode='auto', layout_engine='platypus'):
+        """Pipeline completo: imágenes, maquetación y render. Returns (PDF bytes, stats)"""
         import time
         t_start = time.time()
         
@@ -919,17 +1284,53 @@ class EnhancedPDFExporter:
         image_urls = df['ImagenURL'].tolist()
         total_imgs = len(image_urls)
         
-        img_stats = self.image_manager.download_images_concurrently(
-            image_urls, 
-            max_workers=20,
-            progress_callback=lambda n, total: progress_callback(0.1 + (0.4 * n/total), f"📷 Descargando imágenes: {n}/{total}") if progress_callback else None
-        )
+        image_progress = lambda n, total: progress_callback(0.1 + (0.4 * n/total), f"📷 Descargando imágenes: {n}/{total}") if progress_callback else None
+        
+        # Upper bound for the whole image phase (prefetch + lookups while rendering)
+        self.image_deadline = time.monotonic() + self.image_manager.IMAGE_PHASE_DEADLINE
+        # Decode in the prefetch pool at the size the layout will ask for: rendering only reads the cache
+        image_size = self.PRO_IMAGE_PIXELS if use_pro_layout else self.CLASSIC_IMAGE_PIXELS
+        
+        # fetch_mode: 'async' (asyncio, per-host limits) | 'threads' (legacy pool) | 'auto'
+        if fetch_mode == 'async' or (fetch_mode == 'auto' and HAS_AIOHTTP):
+            img_stats = self.image_manager.download_images_async(image_urls, max_size=image_size, progress_callback=image_progress, deadline=self.image_deadline)
+        else:
+            img_stats = self.image_manager.download_images_concurrently(
+                image_urls, 
+                max_workers=self.image_manager.FETCH_MAX_WORKERS, # Upper bound; per-host parallelism adapts (AIMD)
+                progress_callback=image_progress,
+                deadline=self.image_deadline,
+                max_size=image_size
+            )
         
         fetch_time = time.time()
         
         # 2. Build PDF Story
         if progress_callback: progress_callback(0.55, "📄 Maquetando estructura del documento...")
         
+        if self._use_sharded_render(df, use_pro_layout, render_mode):
+            try:
+                pdf_bytes, page_count, shards, reused = self._render_sharded(df, business_name, currency, progress_callback, layout_engine)
+            except BrokenProcessPool:
+                # A worker died (OOM, killed): fall back to the single-process build below
+                pdf_bytes = None
+            if pdf_bytes is not None:
+                self.image_deadline = None
+                end_time = time.time()
+                stats = {
+                    "total_time": end_time - start_time,
+                    "fetch_time": fetch_time - start_time,
+                    "render_time": end_time - fetch_time,
+                    "img_stats": img_stats,
+                    "file_size_mb": len(pdf_bytes) / (1024 * 1024),
+                    "page_count": page_count,
+                    "render_mode": 'sharded',
+                    "layout_engine": layout_engine,
+                    "shards": shards,
+                    "sections_reused": reused
+                }
+                return pdf_bytes, stats
+        
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(
             buffer,
@@ -943,7 +1344,8 @@ class EnhancedPDFExporter:
         if use_pro_layout:
             story = self._build_pdf_pro(df, business_name, currency, 
                 progress_callback=lambda p: progress_callback(0.55 + (0.35 * p), "🎨 Renderizando secciones y tablas...") if progress_callback else None,
-                branding=st.session_state.get('branding_config')
+                branding=st.session_state.get('branding_config'),
+                layout_engine=layout_engine
             )
         else:
             # Legacy Flow (No Branding applied to maintain legacy behavior strictly)
@@ -957,6 +1359,7 @@ class EnhancedPDFExporter:
         
         # Use NumberedCanvas for "Page X of Y"
         doc.build(story, canvasmaker=NumberedCanvas, onFirstPage=self._add_footer_first, onLaterPages=self._add_footer_later)
+        self.image_deadline = None
         
         end_time = time.time()
         
@@ -974,11 +1377,92 @@ class EnhancedPDFExporter:
             "render_time": end_time - fetch_time,
             "img_stats": img_stats,
             "file_size_mb": file_size_mb,
-            "page_count": page_count
+            "page_count": page_count,
+            "render_mode": 'single',
+            "layout_engine": layout_engine if use_pro_layout else None,
+            "shards": 1
         }
         
         buffer.seek(0)
         return buffer.getvalue(), stats # Return bytes and stats
+
+    def _use_sharded_render(self, df, use_pro_layout, render_mode):
+        """Tramos (en paralelo si hay varios núcleos) solo para el layout profesional, con pypdf y catálogos grandes"""
+        if render_mode == 'single' or not use_pro_layout or not HAS_PYPDF:
+            return False
+        return render_mode == 'sharded' or len(df) >= self.SHARDED_MIN_PRODUCTS
+
+    def _render_sharded(self, df, business_name, currency, progress_callback=None, layout_engine='platypus'):
+        """
+        Maqueta el catálogo en tramos por Línea, cada uno en un proceso del pool, y los une
+        tras la portada con la numeración global. Las imágenes se resuelven aquí (caché del
+        padre) y viajan ya codificadas a cada worker. Los tramos cuya huella no cambió desde
+        otra exportación se toman del caché de secciones sin volver a maquetarlos.
+        Returns: (PDF bytes, páginas, tramos, tramos reutilizados)
+        Raises: BrokenProcessPool si un worker muere
+        """
+        import concurrent.futures
+        pool = get_decode_pool()
+        df_sorted, group_cols = sort_catalog(df)
+        shards = split_shards(df_sorted, group_cols, self.SHARD_TARGET_PRODUCTS)
+
+        # Encoded JPEGs for every distinct URL, resolved in parallel against the shared cache
+        urls = {url for url in df_sorted['ImagenURL'] if isinstance(url, str)}
+        placeholder = self.image_manager.get_encoded_placeholder('pdf')
+        deadline = getattr(self, 'image_deadline', None)
+
+        def encoded(url):
+            try:
+                data, size, _ = self.image_manager.get_encoded_image(url, target='pdf', max_size=self.PRO_IMAGE_PIXELS, deadline=deadline)
+                return url, (data, size)
+            except Exception:
+                return url, placeholder
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+            images = dict(executor.map(encoded, urls))
+        images[''] = placeholder
+
+        branding = st.session_state.get('branding_config')
+        contact_info = self._footer_contact_info()
+        columns = [c for c in ('Línea', 'Familia', 'Grupo', 'Producto', 'Descripción', 'Unidad', 'Precio', 'ImagenURL') if c in df_sorted.columns]
+
+        # Unchanged sections (same fingerprint) come straight from the section cache
+        parts = [None] * len(shards)
+        pending = []
+        for index, shard in enumerate(shards):
+            shard = shard[columns]
+            shard_images = {url: images[url] for url in shard['ImagenURL'] if isinstance(url, str)}
+            shard_images[''] = placeholder
+            key = shard_fingerprint(shard, currency, shard_images, branding, contact_info, layout_engine)
+            parts[index] = self.section_cache.get(key)
+            if parts[index] is None:
+                pending.append((index, key, shard, shard_images))
+        reused = len(shards) - len(pending)
+
+        with contextlib.ExitStack() as stack:
+            futures = {}
+            if pending:
+                # Single core: lay out in a background thread; the cache still skips unchanged sections
+                executor = pool if pool is not None else stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=1))
+                for index, key, shard, shard_images in pending:
+                    futures[executor.submit(render_shard, shard, currency, shard_images, branding, contact_info, engine=layout_engine)] = (index, key)
+
+            # Cover page is laid out here while the workers run
+            cover_buffer = io.BytesIO()
+            cover_doc = SimpleDocTemplate(cover_buffer, pagesize=A4, **PRO_MARGINS)
+            cover_doc.build(self._build_cover_story(business_name, branding), onFirstPage=self._add_footer_first, onLaterPages=self._add_footer_later)
+
+            # Progress per finished shard; reused ones count as done
+            for done, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+                index, key = futures[future]
+                parts[index] = future.result()
+                self.section_cache.put(key, parts[index])
+                if progress_callback:
+                    progress_callback(0.55 + 0.35 * (reused + done) / len(shards), f"🎨 Renderizando secciones: {done} de {len(pending)} tramos con cambios...")
+
+        if progress_callback: progress_callback(0.95, "💾 Uniendo secciones y numerando páginas...")
+        pdf_bytes, page_count = merge_shards([cover_buffer.getvalue()] + parts)
+        return pdf_bytes, page_count, len(shards), reused
         
     def _add_footer_first(self, canvas, doc):
         """Footer solo para la primera página (puede variar si se desea)"""
@@ -990,22 +1474,17 @@ class EnhancedPDFExporter:
 
     def _add_footer_content(self, canvas, doc, is_first=False):
         """Contenido común del footer"""
-        canvas.saveState()
-        canvas.setFont('Helvetica', 9)
-        canvas.setFillColor(colors.HexColor('#7f8c8d'))
-        
         # NOTE: Page numbering is handled by NumberedCanvas.draw_page_number
-        
-        # Contact info
+        draw_footer(canvas, self._footer_contact_info())
+
+    def _footer_contact_info(self):
         contact_info = self.business_name_for_footer
         if self.phone_number_for_footer:
             contact_info += f" | Tel: {self.phone_number_for_footer}"
         if self.email_for_footer:
             contact_info += f" | Email: {self.email_for_footer}"
-        
-        canvas.drawString(50, 40, contact_info)
-        
-        canvas.restoreState()
+        return contact_info
+
     def _build_pdf_doc(self, doc, df, currency, business_name):
         def first_page_template(canvas, doc):
             canvas.saveState()
@@ -1221,12 +1700,12 @@ class EnhancedPDFExporter:
         """Crear celda de producto mejorada"""
         product_image = None
         try:
-            image = self.image_manager.download_image(product['ImagenURL'], max_size=(300, 300))
-            img_buffer = io.BytesIO()
-            image.save(img_buffer, format='JPEG', quality=85)
-            img_buffer.seek(0)
+            jpeg_bytes, _, status = self.image_manager.get_encoded_image(
+                product['ImagenURL'], target='pdf', max_size=self.CLASSIC_IMAGE_PIXELS, deadline=getattr(self, 'image_deadline', None)
+            )
             image_width = col_width * 0.8 # Use 80% of cell width for the image
-            product_image = RLImage(img_buffer, width=image_width, height=image_width)
+            key = 'placeholder' if status in ImageManager.PLACEHOLDER_STATUSES else f"{product['ImagenURL']}_{self.CLASSIC_IMAGE_PIXELS}"
+            product_image = DedupImage(jpeg_bytes, image_width, image_width, key=key)
         except:
             pass
         
@@ -1441,6 +1920,9 @@ class HTMLExporter:
             image_url = product['ImagenURL']
             if pd.isna(image_url) or not image_url or str(image_url) == 'nan':
                 image_src = "data:image/svg+xml;base64,PHN2ZyB3aWR0aD0iMzAwIiBoZWlnaHQ9IjIwMCIgeG1sbnM9Imh0dHA6Ly93d3cudzMub3JnLzIwMDAvc3ZnIj4KPHJlY3Qgd2lkdGg9IjEwMCUiIGhlaWdodD0iMTAwJSIgZmlsbD0iI2YwZjBmMCIvPgo8dGV4dCB4PSI1MCUiIHk9IjUwJSIgZm9udC1mYW1pbHk9IkFyaWFsIiBmb250LXNpemU9IjE4IiBmaWxsPSIjOTk5IiB0ZXh0LWFuY2hvcj0ibWlkZGxlIiBkeT0iLjNlbSI+U2luIGltYWdlbjwvdGV4dD4KPC9zdmc+"
+            elif is_bundle_url(image_url):
+                # Image from the uploaded ZIP: no public URL, embed it in the file
+                image_src = self.image_manager.get_encoded_image(image_url, target='preview')[0]
             else:
                 image_src = str(image_url)
             
@@ -2077,6 +2559,7 @@ class EnhancedCatalogApp:
                 'pdf_custom_subtitle': str(user_info.get('pdf_custom_subtitle') or ''),
                 'pdf_columns': int(user_info.get('pdf_columns', 2)),
                 'pdf_use_pro': bool(user_info.get('pdf_use_pro', True) if 'pdf_use_pro' in user_info else True),
+                'pdf_layout_engine': user_info.get('pdf_layout_engine') if user_info.get('pdf_layout_engine') in LAYOUT_ENGINES else 'platypus',
                 'brand_primary': default_brand_primary,
                 'brand_secondary': default_brand_secondary,
                 'brand_accent': default_brand_accent,
@@ -2138,6 +2621,16 @@ class EnhancedCatalogApp:
                 index=layout_idx,
                 key="cfg_pdf_layout"
             )
+            # Same output as the standard engine, laid out without platypus Tables (pdf_grid)
+            engine_labels = {'platypus': "Estándar", 'grid': "Rápido (rejilla)"}
+            cfg_pdf_engine_str = st.selectbox(
+                "Motor de maquetación",
+                list(engine_labels.values()),
+                index=LAYOUT_ENGINES.index(baseline['pdf_layout_engine']),
+                key="cfg_pdf_engine",
+                disabled=cfg_pdf_layout_str != "Profesional (v2)",
+                help="Solo diseño Profesional. El motor rápido produce el mismo PDF en menos tiempo en catálogos grandes"
+            )
 
         self.render_brand_configuration(baseline)
         cfg_brand_primary = st.session_state.get('cfg_brand_primary', baseline.get('brand_primary', '#fe933a'))
@@ -2157,6 +2650,7 @@ class EnhancedCatalogApp:
             'pdf_custom_subtitle': str(cfg_pdf_subtitle or ''),
             'pdf_columns': int(cfg_pdf_cols),
             'pdf_use_pro': bool(cfg_pdf_layout_str == "Profesional (v2)"),
+            'pdf_layout_engine': next(k for k, v in engine_labels.items() if v == cfg_pdf_engine_str),
             'brand_primary': cfg_brand_primary,
             'brand_secondary': cfg_brand_secondary,
             'brand_accent': cfg_brand_accent,
@@ -2211,6 +2705,7 @@ class EnhancedCatalogApp:
                      st.session_state.phone_number = updates['phone_number']
                      st.session_state.pdf_custom_title = updates['pdf_custom_title']
                      st.session_state.pdf_custom_subtitle = updates['pdf_custom_subtitle']
+                     st.session_state.pdf_layout_engine = updates['pdf_layout_engine']
                      
                      # Branding cache
                      st.session_state.brand_primary = updates['brand_primary']
@@ -2238,11 +2733,98 @@ class EnhancedCatalogApp:
             st.session_state.setdefault('currency', user_info.get('currency', 'S/'))
             st.session_state.setdefault('phone_number', user_info.get('phone_number', ''))
             st.session_state.setdefault('pdf_use_pro', user_info.get('pdf_use_pro', True))
+            st.session_state.setdefault('pdf_layout_engine', user_info.get('pdf_layout_engine') if user_info.get('pdf_layout_engine') in LAYOUT_ENGINES else 'platypus')
             st.session_state.setdefault('pdf_custom_title', user_info.get('pdf_custom_title', ''))
             st.session_state.setdefault('pdf_custom_subtitle', user_info.get('pdf_custom_subtitle', ''))
 
         self.render_sidebar_user_info()
         self.render_sidebar_navigation(is_admin)
+        self.render_sidebar_image_warmup()
+
+    def render_sidebar_image_warmup(self):
+        """Progreso de la precarga de imágenes iniciada al confirmar la importación"""
+        job = st.session_state.get('image_warmup')
+        if job is None:
+            return
+        with st.sidebar:
+            if hasattr(st, 'fragment'):
+                # Partial rerun every second while the job runs; the rest of the app is untouched
+                polling = not job.done
+                st.fragment(run_every=1 if polling else None)(self._render_warmup_status)(job, polling)
+            else:
+                self._render_warmup_status(job)
+
+    def _render_warmup_status(self, job, polling=False):
+        if polling and job.done:
+            # run_every is only read on a full rerun: without one the fragment keeps polling forever
+            st.rerun()
+        if not job.done:
+            st.progress(job.progress(), text=f"🖼️ Precargando imágenes: {job.completed}/{job.total}")
+        elif job.error is not None:
+            st.caption(f"⚠️ Precarga de imágenes interrumpida: {job.error}")
+        else:
+            stats = job.stats or {}
+            failed = f" · {stats['failed']} sin imagen" if stats.get('failed') else ""
+            st.caption(f"🖼️ Imágenes listas: {stats.get('ok', 0)}/{stats.get('valid_urls', job.total)}{failed} ({job.elapsed():.0f}s)")
+
+    def _render_image_bundle_uploader(self, source_type):
+        """ZIP opcional con las fotos: ImagenURL puede ser el nombre del archivo dentro del ZIP"""
+        zip_file = st.file_uploader(
+            "Imágenes (ZIP, opcional)",
+            type=['zip'],
+            key=f"zip_{source_type}",
+            help="Fotos de producto en un ZIP. En ImagenURL escribe el nombre del archivo (p. ej. SKU123.jpg)"
+        )
+        state_key = f"image_bundle_{source_type}"
+        if zip_file is None:
+            st.session_state[state_key] = None
+            return
+        upload_id = getattr(zip_file, 'file_id', None) or (zip_file.name, zip_file.size)
+        current = st.session_state.get(state_key)
+        if current is None or current['upload_id'] != upload_id:
+            try:
+                zip_file.seek(0)
+                bundle = self.pdf_exporter.image_manager.bundles.add(zip_file)
+            except Exception as e:
+                st.session_state[state_key] = None
+                st.error(f"**ZIP no válido:** {str(e)}")
+                return
+            current = st.session_state[state_key] = {'upload_id': upload_id, 'bundle_id': bundle.bundle_id, 'images': len(bundle)}
+        st.caption(f"ZIP cargado: {current['images']} imágenes")
+
+    def _get_image_bundle(self, source_type):
+        current = st.session_state.get(f"image_bundle_{source_type}")
+        if not current:
+            return None
+        return self.pdf_exporter.image_manager.bundles.get(current['bundle_id'])
+
+    def _apply_image_bundle(self, df, source_type):
+        """Reescribe los ImagenURL presentes en el ZIP como zip://<id>/<archivo>"""
+        bundle = self._get_image_bundle(source_type)
+        if bundle is None or 'ImagenURL' not in df.columns:
+            return df
+        df['ImagenURL'] = df['ImagenURL'].map(lambda v: (bundle.url_for(v) or v) if pd.notna(v) else v)
+        return df
+
+    def _start_image_warmup(self, df):
+        """Precarga en segundo plano las imágenes importadas para que Exportar sea casi solo maquetación"""
+        if df is None or 'ImagenURL' not in df.columns:
+            return
+        urls = [u for u in df['ImagenURL'].dropna().unique().tolist() if str(u).strip() and str(u) != 'nan']
+        if not urls:
+            return
+        # Any ImageManager works: caches, flights and connection pools are per process
+        manager = self.pdf_exporter.image_manager
+        # A new import replaces the running warm-up: it stops after its current batch and the new one waits for it
+        previous = st.session_state.get('image_warmup')
+        if previous is not None and not previous.done:
+            previous.cancel()
+        else:
+            previous = None
+        # Warm the size the selected layout will ask for at export time
+        max_size = EnhancedPDFExporter.PRO_IMAGE_PIXELS if st.session_state.get('pdf_use_pro', True) else EnhancedPDFExporter.CLASSIC_IMAGE_PIXELS
+        prefetch = functools.partial(manager.download_images_async, max_size=max_size)
+        st.session_state.image_warmup = WarmupJob(urls, prefetch, after=previous).start()
 
     def render_main_content(self, is_admin):
         """Contenido principal con tabs post-login"""
@@ -2447,6 +3029,8 @@ class EnhancedCatalogApp:
                     st.session_state.import_stage = 'select'
                     st.session_state.validation_result = None
                     st.session_state.validation_status = 'idle'
+                    st.session_state.image_bundle_excel = None
+                    st.session_state.image_bundle_sheets = None
                     
                     st.session_state.current_page = 1
                     st.session_state.show_reset_modal = False
@@ -2477,12 +3061,15 @@ class EnhancedCatalogApp:
                 help="Selecciona tu archivo"
             )
             
+            # Optional ZIP with the product photos referenced by ImagenURL
+            self._render_image_bundle_uploader(source_type='excel')
+            
             # Process Excel file
             if file:
                 try:
                     # Load data
                     with st.spinner("Importando datos..."):
-                        df = self.data_handler.load_excel(file)
+                        df = self.data_handler.load_excel(file, image_bundles=self.pdf_exporter.image_manager.bundles)
                     
                     # Store in Excel-specific preview
                     st.session_state.excel_preview_data = df
@@ -2513,6 +3100,8 @@ class EnhancedCatalogApp:
                 help="Asegúrate de que el documento sea público o compartido como lector"
             )
             
+            self._render_image_bundle_uploader(source_type='sheets')
+            
             # Botón Validar
             if st.button("Validar", type="secondary", key="validate_sheets"):
                 if url:
@@ -2685,6 +3274,12 @@ class EnhancedCatalogApp:
         
         st.dataframe(preview_df, use_container_width=True, height=400)
         
+        bundle = self._get_image_bundle(source_type)
+        if bundle is not None and 'ImagenURL' in df.columns:
+            values = df['ImagenURL'].dropna().astype(str)
+            matched = sum(1 for v in values if bundle.resolve(v) is not None)
+            st.caption(f"Imágenes desde el ZIP: {matched} de {len(values)} valores de ImagenURL encontrados")
+        
         # Guardar resultado de validación en session state
         st.session_state.validation_result = validation_result
         
@@ -2722,10 +3317,11 @@ class EnhancedCatalogApp:
                         
                         with feedback_placeholder:
                             with st.spinner("Procesando datos..."):
-                                cleaned = self.data_cleaner.clean_data(df)
+                                cleaned = self._apply_image_bundle(self.data_cleaner.clean_data(df), source_type)
                                 self.render_data_loading_with_progress(df, cleaned, source_name)
                         
                         st.session_state.import_stage = 'confirmed'
+                        self._start_image_warmup(cleaned)
                         
                         # Limpiar placeholders
                         button_placeholder.empty()
@@ -3081,7 +3677,8 @@ class EnhancedCatalogApp:
                         st.session_state.get('phone_number'),
                         st.session_state.get('user_email'),
                         progress_callback=progress_handler,
-                        use_pro_layout=st.session_state.get('pdf_use_pro', True)
+                        use_pro_layout=st.session_state.get('pdf_use_pro', True),
+                        layout_engine=st.session_state.get('pdf_layout_engine', 'platypus')
                     )
                     st.session_state['last_pdf_stats'] = stats
                 else:
@@ -3171,6 +3768,36 @@ class EnhancedCatalogApp:
                  sc1.metric("Tiempo Total", f"{stats.get('total_time', 0):.2f}s")
                  sc2.metric("Descarga Imágenes", f"{stats.get('fetch_time', 0):.2f}s")
                  sc3.metric("Renderizado PDF", f"{stats.get('render_time', 0):.2f}s")
+                 if stats.get('render_mode') == 'cached':
+                     st.caption("Catálogo sin cambios desde una exportación anterior: PDF servido desde el almacén, sin regenerar")
+                 if stats.get('render_mode') == 'sharded':
+                     st.caption(f"Maquetación por tramos: {stats['shards']} tramos por Línea, {stats.get('sections_reused', 0)} reutilizados sin cambios")
+                 if stats.get('layout_engine') == 'grid':
+                     st.caption("Motor de maquetación: rápido (rejilla en coordenadas precalculadas)")
+                 conn = istats.get('connections')
+                 if conn and 'requests' in conn:
+                     st.caption(f"Conexiones HTTP: {conn['requests']} solicitudes, {conn['new_connections']} nuevas, {conn['reused_connections']} reutilizadas ({conn['reuse_ratio']:.0%})")
+                 mem = istats.get('memory_cache')
+                 if mem:
+                     st.caption(f"Caché en memoria: {mem['bytes'] / (1024 * 1024):.1f} / {mem['max_bytes'] / (1024 * 1024):.0f} MB | {mem['hits']} aciertos, {mem['misses']} fallos, {mem['evictions']} expulsiones")
+                 failures = istats.get('failures')
+                 if istats.get('skipped') or (failures and failures['open_hosts']):
+                     hosts = ", ".join(failures['open_hosts']) if failures and failures['open_hosts'] else "ninguno"
+                     st.caption(f"URLs omitidas sin red: {istats.get('skipped', 0)} (fallos recientes o host caído) | Hosts con circuito abierto: {hosts}")
+                 if istats.get('deadline'):
+                     st.caption(f"Plazo de imágenes agotado ({ImageManager.IMAGE_PHASE_DEADLINE}s): {istats['deadline']} productos usan placeholder")
+                 retries = (istats.get('connections') or {}).get('retries')
+                 if retries:
+                     st.caption(f"Reintentos por errores transitorios: {retries}")
+                 if istats.get('coalesced'):
+                     st.caption(f"Descargas compartidas: {istats['coalesced']} imágenes esperaron una descarga ya en curso")
+                 concurrency = istats.get('concurrency')
+                 if concurrency:
+                     limits = ", ".join(f"{host}: {info['limit']}" + (f" ({info['throttled']}×429)" if info['throttled'] else "")
+                                        for host, info in concurrency.items())
+                     st.caption(f"Concurrencia adaptativa por host: {limits}")
+                 if istats.get('revalidated') or istats.get('updated'):
+                     st.caption(f"Revalidación HTTP: {istats.get('revalidated', 0)} sin cambios (304), {istats.get('updated', 0)} actualizadas en el origen")
                  st.json(stats) # Full debug view
         
         # --- Secondary Exports (HTML) ---
@@ -3300,7 +3927,7 @@ class EnhancedCatalogApp:
             
             | Nombre de Columna | Descripción                                    |
             |-------------------|------------------------------------------------|
-            | `ImagenURL`       | Enlace público (URL) a la imagen del producto. |
+            | `ImagenURL`       | Enlace público (URL) a la imagen del producto, o el nombre del archivo dentro del ZIP de imágenes. En Excel también puedes pegar la foto en la fila. |
             | `Producto`        | Nombre del producto.                           |
             | `Descripción`     | Breve descripción del producto.                |
             | `Unidad`          | Unidad de venta (Ej: Kg, Litro, Paquete).      |
@@ -3732,6 +4359,66 @@ class EnhancedCatalogApp:
         with col3:
             st.metric("Regulares", len(users_list) - admins)
 
+        self._render_image_cache_usage()
+
+    def _render_image_cache_usage(self):
+        """Uso de la caché de imágenes compartida, por sesión"""
+        shared_cache = get_shared_image_cache(ImageManager.MEMORY_CACHE_PROCESS_MB, ImageManager.MEMORY_CACHE_SESSION_MB)
+        totals = shared_cache.stats()
+
+        st.markdown("---")
+        st.subheader("Caché de Imágenes")
+
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Memoria", f"{totals['bytes'] / 1048576:.0f} / {totals['max_bytes'] / 1048576:.0f} MB")
+        with col2:
+            st.metric("Imágenes", totals['entries'])
+        with col3:
+            st.metric("Aciertos", f"{totals['hit_ratio']:.0%}")
+
+        usage = shared_cache.usage_by_session()
+        if usage:
+            st.dataframe(pd.DataFrame([{
+                'Usuario': row['label'] or 'anónimo',
+                'Sesión': row['session_id'][:8],
+                'Imágenes': row['entries'],
+                'MB': round(row['bytes'] / 1048576, 1),
+                'Aciertos': row['hits'],
+                'Fallos': row['misses'],
+                'Expulsiones': row['evictions'],
+            } for row in usage]), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Sin actividad de caché en este proceso.")
+
+        try:
+            disk_store = get_disk_store(ImageManager.CACHE_DIR, ImageManager.DISK_CACHE_MB)
+            disk = disk_store.stats()
+            hosts = disk_store.host_stats()
+        except Exception as e:
+            st.caption(f"Caché en disco no disponible: {e}")
+            return
+
+        st.markdown("**Caché en Disco**")
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Disco", f"{disk['live_bytes'] / 1048576:.0f} / {disk['max_bytes'] / 1048576:.0f} MB")
+        with col2:
+            st.metric("Imágenes", disk['entries'])
+        with col3:
+            st.metric("Expulsiones", disk['evictions'], help=f"Política: {disk['eviction'].upper()}")
+        with col4:
+            st.metric("Espacio a compactar", f"{disk['dead_bytes'] / 1048576:.0f} MB")
+
+        if hosts:
+            st.dataframe(pd.DataFrame([{
+                'Host': row['host'],
+                'Imágenes': row['entries'],
+                'MB': round(row['bytes'] / 1048576, 1),
+                'Aciertos': row['hits'],
+                'Último acceso': datetime.fromtimestamp(row['last_access']).strftime('%Y-%m-%d %H:%M') if row['last_access'] else '-',
+            } for row in hosts]), hide_index=True, use_container_width=True)
+
 # =============================================================================
 # EJECUTAR
 # =============================================================================
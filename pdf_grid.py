@@ -0,0 +1,358 @@
+"""
+PDF Grid for CatalogPro
+Motor "grid rápido" del layout profesional: las tarjetas de producto se dibujan en
+coordenadas precalculadas sobre el canvas, sin Tables de platypus. Cada texto se mide
+una sola vez y la paginación reproduce la de platypus: mismas páginas y mismas posiciones
+"""
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.platypus import Flowable, Paragraph
+from reportlab.rl_config import spaceShrinkage
+
+from pdf_render import clean_text, product_styles, sort_catalog, _iter_groups
+
+# Same geometry as the platypus Table of build_product_story
+COL_WIDTHS = (240, 240)
+CELL_PADDING = {'left': 10, 'right': 10, 'top': 10, 'bottom': 15}
+TEXT_WIDTH = COL_WIDTHS[0] - CELL_PADDING['left'] - CELL_PADDING['right']
+GRID_COLOR = colors.HexColor('#ecf0f1')
+GRID_WIDTH = 0.5
+GROUP_SPACE = 10 # Spacer(1, 10) after each table
+_FUZZ = 1e-6 # Same tolerance as platypus Frame
+
+# Text Paragraph would parse or wrap differently: measured and drawn by Paragraph itself
+_MARKUP = ('<', '>', '&', '\xa0')
+
+
+def _wrap_words(text, font, size, width):
+    """
+    Cortes de línea de Paragraph: voraz por palabras, con la misma tolerancia de
+    encogimiento de espacios (spaceShrinkage). Returns [(texto, espaciado extra por
+    espacio)] o None si una palabra no cabe sola (Paragraph la partiría)
+    """
+    space = stringWidth(' ', font, size)
+    lines, current, current_width = [], [], -space
+
+    def close():
+        # Overfull line (within the shrink allowance): Paragraph squeezes its spaces
+        extra = width - current_width
+        word_space = extra / (len(current) - 1) if extra < -1e-8 and len(current) > 1 else 0
+        lines.append((' '.join(current), word_space))
+
+    for word in text.split():
+        word_width = stringWidth(word, font, size)
+        if word_width > width:
+            return None
+        if current and current_width + space + word_width > width + spaceShrinkage * space * len(current):
+            close()
+            current, current_width = [word], word_width
+        else:
+            current.append(word)
+            current_width += space + word_width
+    if current:
+        close()
+    return lines
+
+
+class _Text:
+    """
+    Bloque de texto medido una vez. lines: [(segmentos, espaciado extra por espacio)],
+    segmentos: [(texto, fuente)]; todo el bloque va en un solo objeto de texto, como Paragraph
+    """
+
+    def __init__(self, lines, style):
+        self.lines = lines
+        self.style = style
+
+    def drawOn(self, canv, x, y):
+        style = self.style
+        canv.setFillColor(style.textColor)
+        baseline = y + len(self.lines) * style.leading - style.fontSize
+        tx = canv.beginText()
+        word_space = 0
+        for segments, line_space in self.lines:
+            tx.setTextOrigin(x, baseline)
+            if line_space != word_space:
+                # Overfull line (within the shrink allowance): squeezed spaces, as in Paragraph
+                word_space = line_space
+                tx.setWordSpace(word_space)
+            for text, font in segments:
+                tx.setFont(font, style.fontSize)
+                tx.textOut(text)
+            baseline -= style.leading
+        canv.drawText(tx)
+
+
+def _text(text, style):
+    if any(c in text for c in _MARKUP):
+        return Paragraph(text, style)
+    lines = _wrap_words(text, style.fontName, style.fontSize, TEXT_WIDTH)
+    if lines is None:
+        return Paragraph(text, style)
+    return _Text([([(line, style.fontName)], word_space) for line, word_space in lines], style)
+
+
+def _price_text(price_str, unit, style):
+    """'<b>precio</b> / unidad' en una línea; si no cabe, Paragraph hace los cortes"""
+    bold = ' '.join(price_str.split())
+    regular = ' '.join(f"/ {unit}".split())
+    if any(c in price_str + unit for c in _MARKUP):
+        return Paragraph(f"<b>{price_str}</b> / {unit}", style)
+    segments = [(bold, 'Helvetica-Bold'), (f" {regular}" if bold else regular, style.fontName)]
+    segments = [(text, font) for text, font in segments if text]
+    if sum(stringWidth(text, font, style.fontSize) for text, font in segments) > TEXT_WIDTH:
+        return Paragraph(f"<b>{price_str}</b> / {unit}", style)
+    return _Text([(segments, 0)], style)
+
+
+class _Space:
+    def __init__(self, height):
+        self.height = height
+
+    def drawOn(self, canv, x, y):
+        pass
+
+
+def _measure(part):
+    """(parte, ancho, alto): lo que Table obtiene de wrap() en cada pasada, calculado una vez"""
+    if isinstance(part, _Text):
+        return part, TEXT_WIDTH, len(part.lines) * part.style.leading
+    if isinstance(part, _Space):
+        return part, 1, part.height
+    width, height = part.wrap(TEXT_WIDTH, 1e6)
+    return part, width, height
+
+
+def _card(img, name, desc, unit, price_str, styles):
+    """Contenido de una celda (mismo orden que build_product_story) ya medido"""
+    return [_measure(part) for part in (
+        img if img is not None else _text("Sin Imagen", styles['desc']),
+        _Space(5),
+        _text(name, styles['name']),
+        _text(desc[:100], styles['desc']),
+        _Space(3),
+        _price_text(price_str, unit, styles['meta'])
+    )]
+
+
+def build_grid_story(df, currency, get_image, branding=None, progress_callback=None):
+    """
+    Equivalente de build_product_story para el motor grid: un único flowable que se
+    pagina solo. get_image(url) -> flowable o None; progress_callback(filas_procesadas, total_filas)
+    """
+    styles = product_styles(branding)
+    df_sorted, valid_cols = sort_catalog(df)
+    total_rows = len(df_sorted)
+    processed_rows = 0
+    items = []
+    prev_keys = [None] * len(valid_cols)
+
+    for name, group in _iter_groups(df_sorted, valid_cols):
+        if not isinstance(name, tuple): name = (name,)
+
+        if prev_keys:
+            for i, val in enumerate(name):
+                if val != prev_keys[i]:
+                    clean_val = clean_text(val)
+                    if not clean_val: continue
+
+                    if i == 0: items.append(('header', Paragraph(str(clean_val).upper(), styles['h1'])))
+                    elif i == 1: items.append(('header', Paragraph(str(clean_val), styles['h2'])))
+                    elif i == 2: items.append(('header', Paragraph(str(clean_val), styles['h3'])))
+
+                    for j in range(i+1, len(prev_keys)):
+                        prev_keys[j] = None
+                    prev_keys[i] = val
+
+        cards = []
+        for row in group.to_dict('records'):
+            p_price = row['Precio']
+            cards.append(_card(
+                get_image(row['ImagenURL']),
+                clean_text(row['Producto']),
+                clean_text(row.get('Descripción', '')),
+                clean_text(row.get('Unidad', '')),
+                f"{currency} {float(p_price):.2f}" if pd.notna(p_price) else "",
+                styles
+            ))
+
+        if cards:
+            rows = []
+            for i in range(0, len(cards), 2):
+                pair = cards[i:i + 2] + [[]] * (2 - len(cards[i:i + 2]))
+                content = max(sum(height for _, _, height in card) for card in pair)
+                rows.append((content + CELL_PADDING['top'] + CELL_PADDING['bottom'], pair))
+            items.append(('table', rows))
+            items.append(('space', GROUP_SPACE))
+
+        processed_rows += len(group)
+        if progress_callback:
+            progress_callback(processed_rows, total_rows)
+
+    return [ProductGrid(items)] if items else []
+
+
+class ProductGrid(Flowable):
+    """
+    Sección de productos completa como un solo flowable. wrap() planifica la página actual
+    con las mismas reglas que platypus Frame/Table (espacios antes/después, tablas partidas
+    entre filas, cabeceras y espaciadores que no caben pasan a la página siguiente) y split()
+    devuelve esa página ya posicionada más el resto. Empieza siempre al principio de una página.
+    """
+
+    def __init__(self, items, cursor=(0, 0), page_height=None):
+        Flowable.__init__(self)
+        self.items = items
+        self.cursor = cursor # (item, first table row still pending)
+        self.page_height = page_height # Full frame height, known after the first wrap
+        self._plan = None
+
+    def _page(self, avail_width, avail_height):
+        """Returns (ops, height, cursor siguiente); ops: (tipo, top desde arriba, payload)"""
+        if self._plan is not None and self._plan[0] == (avail_width, avail_height):
+            return self._plan[1]
+        ops = []
+        used = 0.0
+        bottom = 0.0
+        prev_after = 0.0
+        at_top = True
+        index, first_row = self.cursor
+
+        while index < len(self.items):
+            kind, payload = self.items[index]
+            if kind == 'table':
+                rows = payload[first_row:]
+                height = sum(row_height for row_height, _ in rows)
+                if used + height <= avail_height + _FUZZ:
+                    fits = len(rows)
+                else:
+                    # Table.split: as many whole rows as fit
+                    fits, height = 0, 0.0
+                    for row_height, _ in rows:
+                        if height + row_height > avail_height - used:
+                            break
+                        height += row_height
+                        fits += 1
+                if not fits:
+                    break
+                ops.append(('table', used, rows[:fits]))
+                used += height
+                bottom = used
+                prev_after = 0.0
+                at_top = False
+                if fits < len(rows):
+                    # Rest of the table continues on the next page
+                    first_row += fits
+                    break
+                index, first_row = index + 1, 0
+                continue
+
+            if kind == 'header':
+                para = payload
+                _, height = para.wrap(avail_width, avail_height)
+                space_before, space_after = para.getSpaceBefore(), para.getSpaceAfter()
+            else:
+                height, space_before, space_after = payload, 0.0, 0.0
+            space = 0.0 if at_top else max(space_before - prev_after, 0.0)
+            if used + space + height > avail_height + _FUZZ:
+                break
+            ops.append((kind, used + space, payload))
+            if kind == 'header':
+                bottom = used + space + height
+            used += space + height + space_after
+            prev_after = space_after
+            at_top = at_top and (space + height + space_after) == 0
+            index += 1
+
+        result = (ops, bottom, (index, first_row))
+        self._plan = ((avail_width, avail_height), result)
+        return result
+
+    def _continues_here(self, availHeight):
+        """Una continuación solo se coloca al principio de una página nueva, como en el plan"""
+        if self.page_height is None:
+            self.page_height = availHeight
+        return availHeight >= self.page_height - _FUZZ
+
+    def wrap(self, availWidth, availHeight):
+        self.width = availWidth
+        if not self._continues_here(availHeight):
+            self.height = availHeight + 1
+            return self.width, self.height
+        ops, height, cursor = self._page(availWidth, availHeight)
+        if cursor[0] >= len(self.items):
+            self.height = height
+        else:
+            # More pages pending: report not fitting so platypus calls split()
+            self.height = availHeight + 1
+        return self.width, self.height
+
+    def split(self, availWidth, availHeight):
+        if not self._continues_here(availHeight):
+            return []
+        ops, height, cursor = self._page(availWidth, availHeight)
+        if cursor[0] >= len(self.items):
+            return [self]
+        if not ops:
+            return []
+        return [_GridPage(ops, availWidth, height), ProductGrid(self.items, cursor, self.page_height)]
+
+    def draw(self):
+        _draw_ops(self.canv, self._plan[1][0], self.width, self.height)
+
+
+class _GridPage(Flowable):
+    """Una página ya planificada de ProductGrid"""
+
+    def __init__(self, ops, width, height):
+        Flowable.__init__(self)
+        self.ops = ops
+        self.width = width
+        self.height = height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        _draw_ops(self.canv, self.ops, self.width, self.height)
+
+
+def _draw_ops(canv, ops, width, height):
+    table_x = (width - sum(COL_WIDTHS)) / 2.0
+    for kind, top, payload in ops:
+        if kind == 'header':
+            payload.drawOn(canv, 0, height - top - payload.height)
+        elif kind == 'table':
+            _draw_rows(canv, table_x, height - top, payload)
+
+
+def _draw_rows(canv, x, top, rows):
+    """Filas de tarjetas desde top hacia abajo, con la misma rejilla que TableStyle GRID"""
+    y = top
+    edges = [y]
+    for row_height, pair in rows:
+        col_x = x
+        for col_width, card in zip(COL_WIDTHS, pair):
+            cell_y = y - CELL_PADDING['top']
+            for part, width, height in card:
+                cell_y -= height
+                # ALIGN CENTER: each part is centred in the padded cell
+                part.drawOn(canv, col_x + (col_width + CELL_PADDING['left'] - CELL_PADDING['right'] - width) / 2.0, cell_y)
+            col_x += col_width
+        y -= row_height
+        edges.append(y)
+
+    canv.saveState()
+    canv.setLineCap(1)
+    canv.setLineJoin(1)
+    canv.setLineWidth(GRID_WIDTH)
+    canv.setStrokeColor(GRID_COLOR)
+    right = x + sum(COL_WIDTHS)
+    for edge in edges:
+        canv.line(x, edge, right, edge)
+    col_x = x
+    for col_width in (0,) + COL_WIDTHS:
+        col_x += col_width
+        canv.line(col_x, top, col_x, y)
+    canv.restoreState()
@@ -0,0 +1,369 @@
+"""
+PDF Rendering for CatalogPro
+Maquetación del catálogo sin dependencias de Streamlit: la usa el exportador en el
+hilo actual y los workers del modo por tramos (un proceso por tramo).
+"""
+import hashlib
+import io
+
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Flowable
+
+# Modo por tramos opcional: sin pypdf no se pueden unir los PDFs y se maqueta en un solo hilo
+try:
+    from pypdf import PdfReader, PdfWriter
+    HAS_PYPDF = True
+except ImportError:
+    HAS_PYPDF = False
+
+HIERARCHY_COLS = ['Línea', 'Familia', 'Grupo']
+DEFAULT_BRANDING = {'primary': '#2c3e50', 'secondary': '#e74c3c', 'accent': '#3498db', 'text': '#2c3e50'}
+PRO_MARGINS = {'rightMargin': 30, 'leftMargin': 30, 'topMargin': 40, 'bottomMargin': 40}
+PRO_IMAGE_SIZE = 108 # Marco de la imagen en puntos (1.5 inch)
+LAYOUT_VERSION = 1 # Forma parte de la huella de cada tramo: subirla al cambiar la maquetación invalida el caché
+LAYOUT_ENGINES = ('platypus', 'grid') # Motores del layout profesional; 'grid' vive en pdf_grid
+
+
+class NumberedCanvas(canvas.Canvas):
+    """
+    Canvas avanzado que soporta 'Página X de Y'.
+    Y es un form XObject único que se escribe en save(), cuando ya se conoce el total:
+    no se guarda el estado de cada página (memoria constante con cualquier número de páginas)
+    """
+    PAGE_COUNT_FORM = 'page_count'
+    LABEL_RIGHT = A4[0] - 50 # Right edge of the widest expected label ("Página 999 de 999")
+
+    def __init__(self, *args, **kwargs):
+        canvas.Canvas.__init__(self, *args, **kwargs)
+        self._page_count = 0
+
+    def showPage(self):
+        self._page_count += 1
+        self.draw_page_number(self._page_count)
+        canvas.Canvas.showPage(self)
+
+    def save(self):
+        """Rellena el total de páginas al final"""
+        self.beginForm(self.PAGE_COUNT_FORM, -10, -10, 100, 20)
+        self.setFont("Helvetica", 9)
+        self.setFillColor(colors.HexColor('#7f8c8d'))
+        self.drawString(0, 0, str(self._page_count))
+        self.endForm()
+        canvas.Canvas.save(self)
+
+    def draw_page_number(self, page):
+        self.saveState()
+        self.setFont("Helvetica", 9)
+        self.setFillColor(colors.HexColor('#7f8c8d'))
+        page_text = f"Página {page} de "
+        x = self.LABEL_RIGHT - self.stringWidth("Página 999 de 999", "Helvetica", 9)
+        self.drawString(x, 40, page_text)
+        self.translate(x + self.stringWidth(page_text, "Helvetica", 9), 40)
+        self.doForm(self.PAGE_COUNT_FORM)
+        self.restoreState()
+
+
+class DedupImage(Flowable):
+    """
+    Imagen JPEG del PDF deduplicada: la primera celda la dibuja en un form XObject y las
+    demás solo lo referencian. key identifica la imagen (p. ej. la URL); sin key se usa el
+    hash de los bytes. El JPEG solo se abre al dibujar la primera referencia.
+    """
+
+    def __init__(self, data, width, height, key=None):
+        Flowable.__init__(self)
+        self.data = data
+        self.drawWidth = width
+        self.drawHeight = height
+        digest = hashlib.md5(key.encode('utf-8') if key is not None else data).hexdigest()
+        self.form_name = f"img_{digest}"
+
+    def wrap(self, availWidth, availHeight):
+        return self.drawWidth, self.drawHeight
+
+    def draw(self):
+        canv = self.canv
+        if not canv.hasForm(self.form_name):
+            # Unit square: every reference scales it to its own cell size
+            canv.beginForm(self.form_name, 0, 0, 1, 1)
+            canv.drawImage(ImageReader(io.BytesIO(self.data)), 0, 0, 1, 1, mask='auto')
+            canv.endForm()
+        canv.saveState()
+        canv.scale(self.drawWidth, self.drawHeight)
+        canv.doForm(self.form_name)
+        canv.restoreState()
+
+
+def clean_text(val):
+    """Clean nan values from text fields"""
+    if pd.isna(val) or str(val).lower() == 'nan':
+        return ""
+    return str(val)
+
+
+def draw_footer(canv, contact_info):
+    """Datos de contacto al pie de cada página"""
+    canv.saveState()
+    canv.setFont('Helvetica', 9)
+    canv.setFillColor(colors.HexColor('#7f8c8d'))
+    canv.drawString(50, 40, contact_info)
+    canv.restoreState()
+
+
+def pro_image(jpeg_bytes, size, target_size_pts=PRO_IMAGE_SIZE, key=None):
+    """
+    Imagen ajustada (sin deformar) a un marco cuadrado de target_size_pts.
+    key: identidad de la imagen (URL y tamaño) para deduplicarla sin hashear los bytes
+    """
+    img_width, img_height = size
+
+    # Scaling logic: Fit inside target_size_pts x target_size_pts
+    if img_width > img_height:
+        factor = target_size_pts / img_width
+    else:
+        factor = target_size_pts / img_height
+
+    # Repeated images (same URL, placeholder) are embedded once and referenced from each cell
+    return DedupImage(
+        jpeg_bytes,
+        min(img_width * factor, target_size_pts),
+        min(img_height * factor, target_size_pts),
+        key=key
+    )
+
+
+def sort_catalog(df):
+    """
+    Orden del catálogo: Línea -> Familia -> Grupo -> Producto.
+    Returns (df_sorted, group_cols); group_cols vacío si no hay datos de jerarquía
+    """
+    valid_cols = [c for c in HIERARCHY_COLS if c in df.columns]
+    # Check if hierarchy columns have actual data (not all NaN)
+    if not any(df[col].notna().any() for col in valid_cols):
+        return df.sort_values(by=['Producto']), []
+    return df.sort_values(by=valid_cols + ['Producto']), valid_cols
+
+
+def _iter_groups(df_sorted, group_cols):
+    if not group_cols:
+        # No hierarchy - a single "group" with all products
+        return [(None, df_sorted)]
+    return df_sorted.groupby(group_cols)
+
+
+def product_styles(branding=None):
+    branding = branding or DEFAULT_BRANDING
+    styles = getSampleStyleSheet()
+    return {
+        # Hierarchy Headers
+        'h1': ParagraphStyle('H1_Linea', parent=styles['Heading2'], fontSize=18, spaceBefore=20, spaceAfter=10, textColor=colors.HexColor(branding['secondary']), borderPadding=5, borderWidth=0),
+        'h2': ParagraphStyle('H2_Familia', parent=styles['Heading3'], fontSize=14, spaceBefore=10, spaceAfter=5, textColor=colors.HexColor(branding['accent']), leftIndent=10),
+        'h3': ParagraphStyle('H3_Grupo', parent=styles['Heading4'], fontSize=12, spaceBefore=5, spaceAfter=5, textColor=colors.HexColor(branding['text']), leftIndent=20),
+        # Product Text Styles
+        'name': ParagraphStyle('ProdName', parent=styles['Normal'], fontSize=10, leading=12, fontName='Helvetica-Bold', textColor=colors.HexColor(branding['text'])),
+        'desc': ParagraphStyle('ProdDesc', parent=styles['Normal'], fontSize=8, leading=10, textColor=colors.HexColor('#7f8c8d')),
+        'meta': ParagraphStyle('ProdMeta', parent=styles['Normal'], fontSize=9, leading=11, textColor=colors.HexColor(branding['primary'])),
+    }
+
+
+def product_story(engine, df, currency, get_image, branding=None, progress_callback=None):
+    """Secciones de productos con el motor elegido: 'platypus' (Tables) o 'grid' (coordenadas precalculadas)"""
+    if engine == 'grid':
+        from pdf_grid import build_grid_story # pdf_grid imports this module
+        return build_grid_story(df, currency, get_image, branding, progress_callback)
+    return build_product_story(df, currency, get_image, branding, progress_callback)
+
+
+def build_product_story(df, currency, get_image, branding=None, progress_callback=None):
+    """
+    Secciones de productos del layout profesional: cabeceras por nivel de jerarquía
+    y una tabla de 2 columnas por grupo.
+    get_image(url) -> flowable o None; progress_callback(filas_procesadas, total_filas)
+    """
+    story = []
+    styles = product_styles(branding)
+    df_sorted, valid_cols = sort_catalog(df)
+
+    total_rows = len(df_sorted)
+    processed_rows = 0
+
+    # A header is printed whenever its level changes (and all levels below it)
+    prev_keys = [None] * len(valid_cols)
+
+    for name, group in _iter_groups(df_sorted, valid_cols):
+        # 'name' is a tuple of values (Linea, Familia, Grupo)
+        if not isinstance(name, tuple): name = (name,)
+
+        # Check Level Changes (only if we have hierarchy)
+        if prev_keys:
+            for i, val in enumerate(name):
+                if val != prev_keys[i]:
+                    # Level i changed. Print Header i and all subsequent headers
+                    clean_val = clean_text(val)
+                    if not clean_val: continue
+
+                    if i == 0: story.append(Paragraph(str(clean_val).upper(), styles['h1']))
+                    elif i == 1: story.append(Paragraph(str(clean_val), styles['h2']))
+                    elif i == 2: story.append(Paragraph(str(clean_val), styles['h3']))
+
+                    # Reset lower levels
+                    for j in range(i+1, len(prev_keys)):
+                        prev_keys[j] = None
+                    prev_keys[i] = val
+
+        # --- Build Product Table for this Group ---
+        data_matrix = []
+        row_buffer = []
+
+        for idx, row in group.iterrows():
+            # Prepare Cell Content
+            img_obj = get_image(row['ImagenURL'])
+            p_name = clean_text(row['Producto'])
+            p_desc = clean_text(row.get('Descripción', ''))
+            p_unit = clean_text(row.get('Unidad', ''))
+            p_price = row['Precio']
+            price_str = f"{currency} {float(p_price):.2f}" if pd.notna(p_price) else ""
+
+            cell_content = [
+                img_obj if img_obj else Paragraph("Sin Imagen", styles['desc']),
+                Spacer(1, 5),
+                Paragraph(p_name, styles['name']),
+                Paragraph(p_desc[:100], styles['desc']),
+                Spacer(1, 3),
+                Paragraph(f"<b>{price_str}</b> / {p_unit}", styles['meta'])
+            ]
+            row_buffer.append(cell_content)
+            if len(row_buffer) == 2:
+                data_matrix.append(row_buffer)
+                row_buffer = []
+
+        if row_buffer:
+            while len(row_buffer) < 2: row_buffer.append([])
+            data_matrix.append(row_buffer)
+
+        if data_matrix:
+            t = Table(data_matrix, colWidths=[240, 240])
+            t.setStyle(TableStyle([
+                ('VALIGN', (0,0), (-1,-1), 'TOP'),
+                ('ALIGN', (0,0), (-1,-1), 'CENTER'),
+                ('LEFTPADDING', (0,0), (-1,-1), 10),
+                ('RIGHTPADDING', (0,0), (-1,-1), 10),
+                ('TOPPADDING', (0,0), (-1,-1), 10),
+                ('BOTTOMPADDING', (0,0), (-1,-1), 15),
+                ('GRID', (0,0), (-1,-1), 0.5, colors.HexColor('#ecf0f1')),
+            ]))
+
+            # Headers are appended on the fly, so KeepTogether can't bind them to the table:
+            # an orphaned header at the bottom of a page is a known limitation. The table stays breakable.
+            story.append(t)
+            story.append(Spacer(1, 10))
+
+        processed_rows += len(group)
+        if progress_callback:
+            progress_callback(processed_rows, total_rows)
+
+    return story
+
+
+def split_shards(df_sorted, group_cols, target):
+    """
+    Parte el catálogo ya ordenado en tramos contiguos de unas `target` filas.
+    Se corta en cambios de Línea; una Línea mucho mayor que el objetivo se corta
+    en cambios de grupo (el tramo siguiente repite sus cabeceras). Sin jerarquía se corta
+    por número de filas, en pares para no romper la fila de 2 productos.
+    Con un objetivo fijo los cortes solo dependen de las filas anteriores: cambiar
+    precios o textos no mueve ningún tramo.
+    Returns: lista de DataFrames
+    """
+    total = len(df_sorted)
+    if total <= target:
+        return [df_sorted]
+
+    if group_cols:
+        sections = df_sorted[group_cols].astype(str).agg('\x1f'.join, axis=1).to_numpy()
+        lines = df_sorted[group_cols[0]].astype(str).to_numpy()
+        boundaries = [i for i in range(1, total) if sections[i] != sections[i - 1]]
+        line_starts = {i for i in boundaries if lines[i] != lines[i - 1]}
+    else:
+        boundaries = list(range(2, total, 2))
+        line_starts = set(boundaries)
+
+    cuts = []
+    start = 0
+    for i in boundaries:
+        size = i - start
+        if (i in line_starts and size >= target) or size >= 1.5 * target:
+            cuts.append(i)
+            start = i
+    edges = [0] + cuts + [total]
+    return [df_sorted.iloc[a:b] for a, b in zip(edges, edges[1:])]
+
+
+def shard_fingerprint(df, currency, images, branding=None, contact_info='', engine='platypus'):
+    """
+    Huella de un tramo: sus filas, las imágenes que usa, branding, moneda, pie de página,
+    motor y LAYOUT_VERSION. Dos tramos con la misma huella producen el mismo PDF.
+    images: {url: (jpeg_bytes, size)} como en render_shard
+    """
+    digest = hashlib.sha1(f"v{LAYOUT_VERSION}\x1f{engine}\x1f{currency}\x1f{contact_info}\x1f{sorted((branding or {}).items())}".encode())
+    digest.update('\x1f'.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    for url in sorted({url if isinstance(url, str) else '' for url in df['ImagenURL']} | {''}):
+        entry = images.get(url) or images.get('')
+        digest.update(url.encode())
+        # Same URL, new picture: the bytes are part of the fingerprint
+        digest.update(hashlib.md5(entry[0]).digest() if entry else b'-')
+    return digest.hexdigest()
+
+
+def render_shard(df, currency, images, branding=None, contact_info='', engine='platypus'):
+    """
+    Worker: maqueta un tramo del catálogo en su propio PDF (sin número de página,
+    que se estampa al unir). images: {url: (jpeg_bytes, (width, height))}; '' es el placeholder.
+    Returns: PDF bytes
+    """
+    def get_image(url):
+        key = url if isinstance(url, str) and url in images else ''
+        entry = images.get(key)
+        return pro_image(*entry, key=key) if entry else None
+
+    story = product_story(engine, df, currency, get_image, branding)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, **PRO_MARGINS)
+    footer = lambda canv, _doc: draw_footer(canv, contact_info)
+    doc.build(story, onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
+
+
+def merge_shards(parts):
+    """
+    Une los PDFs en orden y estampa 'Página X de Y' global sobre cada página.
+    Returns: (PDF bytes, número de páginas)
+    """
+    writer = PdfWriter()
+    for part in parts:
+        writer.append(PdfReader(io.BytesIO(part)))
+    total = len(writer.pages)
+
+    # One NumberedCanvas page per merged page: same label as the single-pass build
+    overlay_buffer = io.BytesIO()
+    overlay = NumberedCanvas(overlay_buffer, pagesize=A4)
+    for _ in range(total):
+        overlay.showPage()
+    overlay.save()
+    for page, stamp in zip(writer.pages, PdfReader(overlay_buffer).pages):
+        page.merge_page(stamp)
+        # merge_page leaves the combined content uncompressed (~4x the size)
+        page.compress_content_streams()
+    # Images repeated across parts (placeholder, shared product photos) are stored once
+    writer.compress_identical_objects()
+
+    output = io.BytesIO()
+    writer.write(output)
+    return output.getvalue(), total
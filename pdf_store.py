@@ -0,0 +1,123 @@
+"""
+PDF Store for CatalogPro
+PDFs terminados en disco, direccionados por la huella de su contenido: volver a
+exportar un catálogo sin cambios devuelve el mismo archivo sin maquetar nada
+"""
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import pandas as pd
+
+_KEY = re.compile(r'[0-9a-f]{40}')
+
+
+def catalog_fingerprint(df, *parts):
+    """
+    Huella de una exportación: columnas y filas del DataFrame más cualquier otro
+    ingrediente del PDF (branding, layout, logo, título...). Las partes se serializan
+    como JSON ordenado; bytes (p. ej. el logo) entran por su hash.
+    """
+    digest = hashlib.sha1('\x1f'.join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    for part in parts:
+        if isinstance(part, (bytes, bytearray)):
+            part = hashlib.sha1(part).hexdigest()
+        digest.update(b'\x1e')
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class PDFArtifactStore:
+    """
+    Un <huella>.pdf por exportación más un <huella>.json con sus estadísticas.
+    Acotado por bytes: se expulsan los menos usados (mtime = último acierto).
+    max_age (segundos) caduca los PDFs cuyas imágenes podrían haber cambiado en origen.
+    """
+
+    def __init__(self, directory, max_bytes, max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def get(self, key):
+        """Returns (pdf_bytes, meta) o None si no existe o caducó"""
+        if not _KEY.fullmatch(key or ''):
+            return None
+        with self._lock:
+            try:
+                with open(self._path(key, 'json'), encoding='utf-8') as f:
+                    meta = json.load(f)
+                if self.max_age is not None and time.time() - meta.get('created', 0) > self.max_age:
+                    self._remove(key)
+                    raise FileNotFoundError(key)
+                with open(self._path(key, 'pdf'), 'rb') as f:
+                    data = f.read()
+                os.utime(self._path(key, 'pdf'))
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            return data, meta
+
+    def put(self, key, data, meta=None):
+        """Guarda un PDF (escritura atómica) y expulsa hasta cumplir max_bytes. Returns False si no cabe"""
+        if not _KEY.fullmatch(key or '') or len(data) > self.max_bytes:
+            return False
+        meta = dict(meta or {}, created=time.time(), bytes=len(data))
+        with self._lock:
+            # PDF first, then its metadata: a reader never sees metadata without the file
+            for ext, payload in (('pdf', data), ('json', json.dumps(meta, default=str).encode())):
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+                try:
+                    with os.fdopen(fd, 'wb') as tmp:
+                        tmp.write(payload)
+                    os.replace(tmp_path, self._path(key, ext))
+                except Exception:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+            self._prune(keep=key)
+        return True
+
+    def _prune(self, keep):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name[:-len('.pdf')]))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                self._remove(key)
+                total -= size
+
+    def _remove(self, key):
+        for ext in ('json', 'pdf'):
+            try:
+                os.remove(self._path(key, ext))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            sizes = [os.path.getsize(os.path.join(self.directory, n)) for n in os.listdir(self.directory) if n.endswith('.pdf')]
+            return {'entries': len(sizes), 'bytes': sum(sizes), 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
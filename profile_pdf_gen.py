@@ -1,6 +1,7 @@
 import time
 import pandas as pd
 from main import ImageManager, EnhancedPDFExporter
+from image_cache import SharedImageCache, SessionCacheView
 import io
 from reportlab.lib.pagesizes import A4
 # Mock streamlit session state for context
@@ -48,14 +49,14 @@ def profiler():
     
     # Run Optimized (Cold Cache) FIRST - CRITICAL TEST
     print("\n[Optimized Engine] Starting (Cold Cache - 800 items)...")
-    if 'image_cache_persistent' in st.session_state:
-        st.session_state['image_cache_persistent'] = {}
-        exporter.image_manager.image_cache = st.session_state['image_cache_persistent']
+    # Empty memory cache for this run (same byte limits as the app); the disk cache is left as is
+    cold_cache = SharedImageCache(ImageManager.MEMORY_CACHE_PROCESS_MB * 1024 * 1024, ImageManager.MEMORY_CACHE_SESSION_MB * 1024 * 1024)
+    exporter.image_manager.image_cache = SessionCacheView(cold_cache, 'profiler')
         
     t2 = time.time()
     pdf_opt, stats_opt = exporter.generate_pdf_optimized(
         df, "Benchmark Inc", "S/", "123", "a@b.com", 
-        progress_callback=lambda c, t, m: print(f"   Opt Progress: {c}%", end='\r')
+        progress_callback=lambda p, msg: print(f"   Opt Progress: {p:.0%}", end='\r')
     )
     t3 = time.time()
     opt_time = t3 - t2
@@ -98,8 +99,8 @@ def profiler():
     print(f"Optimized Warm Time: {opt_warm_time:.2f}s")
     
     print(f"\n--- RESULTS SUMMARY ---")
-    print(f"Legacy: {legacy_time:.2f}s")
-    print(f"Optimized (Cold): {opt_time:.2f}s (Speedup: {legacy_time/opt_time:.1f}x)")
+    print(f"Legacy (Projected): {legacy_projected:.2f}s")
+    print(f"Optimized (Cold): {opt_time:.2f}s (Speedup: {legacy_projected/opt_time:.1f}x)")
     print(f"Optimized (Warm): {opt_warm_time:.2f}s")
     
 class MediaInstrumentedPDFExporter(EnhancedPDFExporter):
@@ -107,6 +108,4 @@ class MediaInstrumentedPDFExporter(EnhancedPDFExporter):
     pass
 
 if __name__ == "__main__":
-    if 'image_cache_persistent' not in st.session_state:
-        st.session_state['image_cache_persistent'] = {}
     profiler()
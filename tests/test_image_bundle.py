@@ -0,0 +1,146 @@
+"""
+Pruebas del ZIP de imágenes subido junto al Excel (image_bundle)
+"""
+
+import io
+import os
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+from openpyxl import Workbook
+from openpyxl.drawing.image import Image as XLImage
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_bundle import BundleRegistry, is_bundle_url, parse_bundle_url, sheet_image_anchors
+
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    buffer.seek(0)
+    return buffer
+
+
+class TestImageBundle:
+    """Pruebas de resolución y lectura de miembros del ZIP"""
+
+    def test_resolves_path_name_and_stem(self, tmp_path):
+        """Test: ImagenURL puede ser la ruta, el nombre del archivo o el código sin extensión"""
+        registry = BundleRegistry(str(tmp_path))
+        bundle = registry.add(make_zip({'fotos/SKU1.JPG': b'a', 'fotos/sku2.png': b'b', 'notas.txt': b'x'}))
+
+        assert len(bundle) == 2
+        assert bundle.resolve('fotos/SKU1.JPG') == 'fotos/SKU1.JPG'
+        assert bundle.resolve('sku1.jpg') == 'fotos/SKU1.JPG'
+        assert bundle.resolve(' SKU2 ') == 'fotos/sku2.png'
+        assert bundle.resolve('notas.txt') is None
+        assert bundle.resolve('https://cdn.example.com/sku1.jpg') is None
+        assert bundle.resolve(float('nan')) is None
+        assert bundle.resolve('zip://0123456789abcdef/sku1.jpg') is None
+
+    def test_url_round_trip(self, tmp_path):
+        """Test: La URL zip:// lleva el id del ZIP y se lee sin extraer"""
+        registry = BundleRegistry(str(tmp_path))
+        bundle = registry.add(make_zip({'SKU1.jpg': b'jpeg-bytes'}))
+
+        url = bundle.url_for('SKU1.jpg')
+        assert is_bundle_url(url)
+        assert parse_bundle_url(url) == (bundle.bundle_id, 'SKU1.jpg')
+        assert registry.read(url) == b'jpeg-bytes'
+        assert not is_bundle_url('https://example.com/a.jpg')
+
+    def test_read_is_capped(self, tmp_path):
+        """Test: Un miembro mayor que max_bytes se rechaza"""
+        registry = BundleRegistry(str(tmp_path))
+        bundle = registry.add(make_zip({'big.jpg': b'x' * 100}))
+
+        with pytest.raises(ValueError):
+            registry.read(bundle.url_for('big.jpg'), max_bytes=10)
+        with pytest.raises(KeyError):
+            bundle.read('otro.jpg')
+
+    def test_same_content_same_id(self, tmp_path):
+        """Test: Subir el mismo ZIP dos veces reutiliza el archivo y el id"""
+        registry = BundleRegistry(str(tmp_path))
+        first = registry.add(make_zip({'a.jpg': b'1'}))
+        second = registry.add(make_zip({'a.jpg': b'1'}))
+
+        assert first is second
+        assert [n for n in os.listdir(tmp_path)] == [f"{first.bundle_id}.zip"]
+
+    def test_invalid_zip_and_unknown_id(self, tmp_path):
+        """Test: Un archivo que no es ZIP falla sin dejar restos; ids inválidos no tocan el disco"""
+        registry = BundleRegistry(str(tmp_path))
+        with pytest.raises(zipfile.BadZipFile):
+            registry.add(io.BytesIO(b'not a zip'))
+        assert os.listdir(tmp_path) == []
+        assert registry.get('../../etc/passwd') is None
+        with pytest.raises(FileNotFoundError):
+            registry.read('zip://0123456789abcdef/a.jpg')
+
+    def test_prunes_oldest_bundles(self, tmp_path):
+        """Test: Solo se conservan los max_bundles ZIPs más recientes"""
+        registry = BundleRegistry(str(tmp_path), max_bundles=2)
+        ids = []
+        for i in range(3):
+            bundle = registry.add(make_zip({f'{i}.jpg': bytes([i])}))
+            os.utime(bundle.path, (i, i))
+            ids.append(bundle.bundle_id)
+
+        assert registry.get(ids[0]) is None
+        assert registry.get(ids[2]) is not None
+
+
+def make_workbook(rows):
+    """xlsx con una imagen anclada por fila (openpyxl escribe oneCellAnchor)"""
+    wb = Workbook()
+    ws = wb.active
+    ws.append(['Producto', 'ImagenURL'])
+    for row, anchors in rows.items():
+        ws.cell(row=row + 1, column=1, value=f'p{row}')
+        for cell, color in anchors:
+            png = io.BytesIO()
+            Image.new('RGB', (8, 8), color).save(png, 'PNG')
+            png.seek(0)
+            ws.add_image(XLImage(png), cell)
+    wb.create_sheet('Otra').add_image(XLImage(io.BytesIO(png.getvalue())), 'A1')
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+class TestEmbeddedWorkbookImages:
+    """Pruebas de imágenes pegadas en el .xlsx"""
+
+    def test_maps_anchors_to_rows(self, tmp_path):
+        """Test: Cada imagen anclada se asigna a su fila; gana la columna más a la izquierda"""
+        workbook = make_workbook({1: [('B2', 'red')], 3: [('D4', 'blue'), ('C4', 'green')]})
+
+        with zipfile.ZipFile(workbook) as zf:
+            anchors = sheet_image_anchors(zf)
+        assert set(anchors) == {1, 3}
+        assert all(member.startswith('xl/media/') for member in anchors.values())
+
+        workbook.seek(0)
+        bundle = BundleRegistry(str(tmp_path)).add(workbook)
+        urls = bundle.embedded_images()
+        assert set(urls) == {1, 3}
+        image = bundle.read(parse_bundle_url(urls[3])[1])
+        assert Image.open(io.BytesIO(image)).getpixel((0, 0)) == (0, 128, 0)
+
+    def test_workbook_without_images(self):
+        """Test: Un libro sin dibujos o un ZIP cualquiera no devuelven anclas"""
+        buffer = io.BytesIO()
+        Workbook().save(buffer)
+
+        with zipfile.ZipFile(buffer) as zf:
+            assert sheet_image_anchors(zf) == {}
+        with zipfile.ZipFile(make_zip({'a.jpg': b'1'})) as zf:
+            assert sheet_image_anchors(zf) == {}
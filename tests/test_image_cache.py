@@ -0,0 +1,168 @@
+"""
+Pruebas de las capas de caché de imágenes (image_cache)
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_cache import ByteLRUCache, SharedImageCache, SessionCacheView, SingleFlight, estimate_size
+
+
+class TestByteLRUCache:
+    """Pruebas de la caché LRU acotada por bytes"""
+
+    def test_estimate_size_pil(self):
+        """Test: El tamaño de un bitmap es ancho x alto x bandas"""
+        assert estimate_size(Image.new('RGB', (10, 20))) == 600
+        assert estimate_size(b'12345') == 5
+
+    def test_evicts_least_recently_used_by_bytes(self):
+        """Test: Expulsa la entrada menos usada cuando se supera el límite en bytes"""
+        cache = ByteLRUCache(max_bytes=300)
+        cache.put('a', b'x' * 100)
+        cache.put('b', b'x' * 100)
+        cache.put('c', b'x' * 100)
+        assert cache.get('a') is not None  # 'a' becomes most recent
+        cache.put('d', b'x' * 100)
+
+        assert 'b' not in cache
+        assert 'a' in cache and 'c' in cache and 'd' in cache
+        assert cache.current_bytes == 300
+        assert cache.stats()['evictions'] == 1
+
+    def test_rejects_oversized_entry(self):
+        """Test: Una entrada mayor que el límite no se cachea"""
+        cache = ByteLRUCache(max_bytes=10)
+        assert cache.put('big', b'x' * 11) is False
+        assert len(cache) == 0
+        assert cache.stats()['rejected'] == 1
+
+    def test_hit_miss_counters(self):
+        """Test: Contadores de aciertos y fallos"""
+        cache = ByteLRUCache(max_bytes=100)
+        cache['k'] = b'v'
+        cache.get('k')
+        cache.get('missing')
+        stats = cache.stats()
+        assert stats['hits'] == 1
+        assert stats['misses'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+
+class TestSharedImageCache:
+    """Pruebas de la caché compartida entre sesiones"""
+
+    def test_sessions_share_entries(self):
+        """Test: Una imagen cargada por una sesión es un acierto para otra"""
+        shared = SharedImageCache(max_bytes=1000, per_session_bytes=500)
+        alice = SessionCacheView(shared, 's1', label='alice@example.com')
+        bob = SessionCacheView(shared, 's2', label='bob@example.com')
+
+        alice.put('img', b'x' * 100)
+        assert bob.get('img') == b'x' * 100
+        assert bob.stats()['hits'] == 1
+        assert alice.stats()['bytes'] == 100
+        assert bob.stats()['bytes'] == 0
+
+    def test_per_session_limit_evicts_own_entries(self):
+        """Test: Una sesión que supera su tope solo expulsa sus propias entradas"""
+        shared = SharedImageCache(max_bytes=1000, per_session_bytes=200)
+        alice = SessionCacheView(shared, 's1')
+        bob = SessionCacheView(shared, 's2')
+
+        bob.put('b1', b'x' * 100)
+        alice.put('a1', b'x' * 100)
+        alice.put('a2', b'x' * 100)
+        alice.put('a3', b'x' * 100)
+
+        assert 'a1' not in shared
+        assert 'b1' in shared
+        assert alice.stats()['evictions'] == 1
+        assert shared.current_bytes == 300
+
+    def test_discard_prefix_across_sessions(self):
+        """Test: Invalidar una URL quita sus variantes de todas las sesiones"""
+        shared = SharedImageCache(max_bytes=1000, per_session_bytes=500)
+        alice = SessionCacheView(shared, 's1')
+        bob = SessionCacheView(shared, 's2')
+        alice.put('http://a.com/x.jpg_master', b'x' * 100)
+        bob.put('http://a.com/x.jpg_(300, 300)', b'x' * 50)
+        bob.put('http://a.com/y.jpg_master', b'x' * 10)
+
+        assert alice.discard_prefix('http://a.com/x.jpg_') == 2
+        assert 'http://a.com/y.jpg_master' in shared
+        assert bob.stats()['bytes'] == 10
+
+    def test_usage_by_session(self):
+        """Test: Contabilidad por sesión para el panel de administración"""
+        shared = SharedImageCache(max_bytes=1000, per_session_bytes=500)
+        alice = SessionCacheView(shared, 's1', label='alice@example.com')
+        alice.put('a1', b'x' * 100)
+        alice.get('missing')
+        alice.clear()
+
+        usage = shared.usage_by_session()
+        assert usage == [{'session_id': 's1', 'label': 'alice@example.com', 'entries': 0,
+                          'bytes': 0, 'hits': 0, 'misses': 1, 'evictions': 0}]
+
+    def test_idle_empty_sessions_expire(self):
+        """Test: Una sesión sin entradas e inactiva deja de ocupar contabilidad; una con entradas se conserva"""
+        shared = SharedImageCache(max_bytes=200, per_session_bytes=200, session_ttl=0)
+        alice = SessionCacheView(shared, 's1')
+        bob = SessionCacheView(shared, 's2')
+        alice.put('a1', b'x' * 100)
+        bob.put('b1', b'x' * 200) # Global LRU evicts alice's only entry
+
+        SessionCacheView(shared, 's3').get('b1')
+        assert [usage['session_id'] for usage in shared.usage_by_session()] == ['s2']
+
+        alice.put('a2', b'x' * 10) # A returning session starts a fresh accounting entry
+        assert alice.stats()['bytes'] == 10
+
+
+class TestSingleFlight:
+    """Pruebas de la coalescencia de descargas concurrentes"""
+
+    def test_concurrent_callers_share_one_call(self):
+        """Test: N hilos pidiendo la misma clave ejecutan la función una sola vez"""
+        flights = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def fetch():
+            calls.append(1)
+            release.wait(2)
+            return 'image'
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            futures = [pool.submit(flights.do, 'key', fetch) for _ in range(8)]
+            while flights.stats()['coalesced'] < 7:
+                time.sleep(0.01)
+            release.set()
+            results = [f.result() for f in futures]
+
+        assert len(calls) == 1
+        assert [r[0] for r in results] == ['image'] * 8
+        assert sum(1 for _, shared in results if shared) == 7
+        assert flights.stats()['in_flight'] == 0
+
+    def test_error_propagates_to_waiters(self):
+        """Test: Si el líder falla, los que esperan reciben la misma excepción"""
+        flights = SingleFlight()
+        future, is_leader = flights.begin('key')
+        waiter, waiter_is_leader = flights.begin('key')
+        assert is_leader and not waiter_is_leader
+
+        flights.finish('key', future, error=ValueError('boom'))
+        with pytest.raises(ValueError):
+            waiter.result()
+        # Next caller starts a new flight
+        assert flights.begin('key')[1] is True
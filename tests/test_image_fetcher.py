@@ -0,0 +1,442 @@
+"""
+Pruebas del motor de descarga de imágenes (image_fetcher)
+Usa un servidor HTTP local para no depender de internet.
+"""
+
+import asyncio
+import io
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_fetcher import PooledImageFetcher, AdaptiveLimiter, FailureTracker, ImageTooLargeError, ImageSkippedError, ImageNotModified, ImageDeadlineError, retry_delay, stream_images_async, group_urls_by_host, HAS_AIOHTTP
+
+
+def _jpeg_bytes(size=(640, 480), color=(200, 30, 30)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+class _ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+    body = _jpeg_bytes()
+    delay = 0
+    in_flight = 0
+    max_in_flight = 0
+    flaky_calls = {}
+    lock = threading.Lock()
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(cls.delay)
+            self._respond()
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def _respond(self):
+        if self.path.startswith('/throttle'):
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/flaky'):
+            cls = type(self)
+            with cls.lock:
+                cls.flaky_calls[self.path] = cls.flaky_calls.get(self.path, 0) + 1
+                fail = cls.flaky_calls[self.path] <= 2
+            if fail:
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        if self.path.startswith('/missing'):
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path.startswith('/etag') and self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            return
+        self.send_response(200)
+        if self.path.startswith('/etag'):
+            self.send_header('ETag', '"v1"')
+            self.send_header('Last-Modified', 'Wed, 01 Jan 2025 00:00:00 GMT')
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def image_server():
+    """Servidor HTTP local que sirve un JPEG en cualquier ruta"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _ImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestPooledImageFetcher:
+    """Pruebas del pool de conexiones compartido"""
+
+    def test_reuses_connections_for_same_host(self, image_server):
+        """Test: Peticiones secuenciales al mismo host reutilizan la conexión"""
+        fetcher = PooledImageFetcher(pool_size=4)
+        for i in range(10):
+            response = fetcher.get(f"{image_server}/img{i}.jpg")
+            assert response.status_code == 200
+            assert response.content == _ImageHandler.body
+
+        stats = fetcher.get_stats()
+        assert stats['requests'] == 10
+        assert stats['new_connections'] == 1
+        assert stats['reused_connections'] == 9
+
+    def test_pool_grows_with_workers(self, image_server):
+        """Test: El pool se amplía a max_workers y conserva las estadísticas"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        fetcher.get(f"{image_server}/a.jpg")
+        fetcher.ensure_pool_size(8)
+        fetcher.ensure_pool_size(4)  # Never shrinks
+        fetcher.get(f"{image_server}/b.jpg")
+
+        stats = fetcher.get_stats()
+        assert stats['pool_size'] == 8
+        assert stats['requests'] == 2
+
+    def test_diff_stats(self, image_server):
+        """Test: Estadísticas por intervalo (una exportación)"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        fetcher.get(f"{image_server}/a.jpg")
+        before = fetcher.get_stats()
+        fetcher.get(f"{image_server}/b.jpg")
+        fetcher.get(f"{image_server}/missing.jpg")
+        delta = PooledImageFetcher.diff_stats(before, fetcher.get_stats())
+
+        assert delta['requests'] == 2
+        assert delta['new_connections'] == 0
+        assert delta['reuse_ratio'] == 1.0
+
+    def test_get_bytes_enforces_cap(self, image_server):
+        """Test: La descarga en streaming se corta al superar max_bytes"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        assert fetcher.get_bytes(f"{image_server}/a.jpg") == _ImageHandler.body
+        with pytest.raises(ImageTooLargeError):
+            fetcher.get_bytes(f"{image_server}/a.jpg", max_bytes=100)
+
+    def test_conditional_fetch(self, image_server):
+        """Test: Guarda ETag / Last-Modified y un 304 se señala con ImageNotModified"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        content, validators = fetcher.fetch(f"{image_server}/etag.jpg")
+        assert content == _ImageHandler.body
+        assert validators == {'etag': '"v1"', 'last_modified': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+
+        with pytest.raises(ImageNotModified) as info:
+            fetcher.fetch(f"{image_server}/etag.jpg", validators=validators)
+        assert info.value.validators['etag'] == '"v1"'
+
+        # Stale validator: full response
+        assert fetcher.fetch(f"{image_server}/etag.jpg", validators={'etag': '"v0"'})[0] == _ImageHandler.body
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+    def test_retries_transient_errors(self, image_server):
+        """Test: Un 503 transitorio se reintenta con backoff; un 404 no"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        assert fetcher.get_bytes(f"{image_server}/flaky-sync.jpg") == _ImageHandler.body
+        assert _ImageHandler.flaky_calls['/flaky-sync.jpg'] == 3
+        assert fetcher.get_stats()['retries'] == 2
+
+        with pytest.raises(requests.HTTPError):
+            fetcher.get_bytes(f"{image_server}/missing.jpg")
+        assert fetcher.get_stats()['retries'] == 2
+
+    def test_deadline_bounds_slow_host(self, image_server):
+        """Test: Un host lento no retiene la petición más allá del deadline"""
+        fetcher = PooledImageFetcher(pool_size=2)
+        _ImageHandler.delay = 1.0
+        started = time.monotonic()
+        try:
+            with pytest.raises((ImageDeadlineError, requests.Timeout)):
+                fetcher.get_bytes(f"{image_server}/slow.jpg", deadline=time.monotonic() + 0.3)
+        finally:
+            _ImageHandler.delay = 0
+        assert time.monotonic() - started < 0.9
+
+        with pytest.raises(ImageDeadlineError):
+            fetcher.get_bytes(f"{image_server}/a.jpg", deadline=time.monotonic() - 1)
+
+
+class TestRetryDelay:
+    """Pruebas de la política de reintentos"""
+
+    def test_exponential_backoff_with_jitter(self):
+        """Test: La espera crece exponencialmente con jitter y respeta los reintentos máximos"""
+        error = requests.Timeout()
+        for attempt in range(3):
+            delay = retry_delay(error, attempt, retries=5, base=0.5, cap=10)
+            assert 0 <= delay <= 0.5 * 2 ** attempt
+        assert retry_delay(error, 2, retries=2) is None
+
+    def test_retry_after_and_deadline(self):
+        """Test: Retry-After fija la espera mínima; no se reintenta si no cabe antes del deadline"""
+        response = requests.Response()
+        response.status_code = 429
+        response.headers['Retry-After'] = '2'
+        error = requests.HTTPError(response=response)
+        assert retry_delay(error, 0, retries=2, cap=8) >= 2
+        assert retry_delay(error, 0, retries=2, cap=1) is None
+        assert retry_delay(error, 0, retries=2, cap=8, deadline=time.monotonic() + 1) is None
+        assert retry_delay(_http_error(404), 0, retries=2) is None
+
+
+class TestAdaptiveLimiter:
+    """Pruebas del control de concurrencia AIMD por host"""
+
+    def _complete(self, limiter, host, n, latency=0.1, error=None):
+        for _ in range(n):
+            assert limiter.try_acquire(host)
+            limiter.release(host, latency, error)
+
+    def test_slow_start_then_additive_increase(self):
+        """Test: Duplica el límite hasta la primera congestión y luego crece de a uno"""
+        limiter = AdaptiveLimiter(initial=2, max_limit=64)
+        self._complete(limiter, 'cdn.com', 2)
+        assert limiter.limit('cdn.com') == 4
+        self._complete(limiter, 'cdn.com', 4)
+        assert limiter.limit('cdn.com') == 8
+
+        limiter.release('cdn.com', 0.1, _http_error(429))  # unmatched release is clamped at 0
+        assert limiter.limit('cdn.com') == 4
+        self._complete(limiter, 'cdn.com', 4)
+        assert limiter.limit('cdn.com') == 5
+
+    def test_throttling_halves_once_per_rtt(self):
+        """Test: Una ráfaga de 429 reduce el límite una sola vez"""
+        limiter = AdaptiveLimiter(initial=16)
+        self._complete(limiter, 'small.com', 5, latency=10, error=_http_error(429))
+        assert limiter.limit('small.com') == 8
+        assert limiter.stats()['small.com']['throttled'] == 5
+
+    def test_client_errors_are_not_congestion(self):
+        """Test: Un 404 no cambia el límite del host"""
+        limiter = AdaptiveLimiter(initial=4)
+        self._complete(limiter, 'a.com', 3, error=_http_error(404))
+        assert limiter.limit('a.com') == 4
+
+    def test_high_latency_holds_limit(self):
+        """Test: Con latencia muy por encima de la mínima el límite no sigue creciendo"""
+        limiter = AdaptiveLimiter(initial=2, latency_tolerance=2.0)
+        self._complete(limiter, 'slow.com', 1, latency=0.1)
+        self._complete(limiter, 'slow.com', 10, latency=2.0)
+        assert limiter.limit('slow.com') == 2
+
+    def test_try_acquire_respects_limit(self):
+        """Test: No se conceden más huecos que el límite actual"""
+        limiter = AdaptiveLimiter(initial=2)
+        assert limiter.try_acquire('a.com') and limiter.try_acquire('a.com')
+        assert not limiter.try_acquire('a.com')
+        limiter.release('a.com')
+        assert limiter.try_acquire('a.com')
+        assert limiter.stats()['a.com']['peak_in_flight'] == 2
+
+
+class TestFailureTracker:
+    """Pruebas de la caché negativa y el circuit breaker por host"""
+
+    def test_negative_cache_expires(self):
+        """Test: Una URL fallida se omite hasta que vence su TTL"""
+        tracker = FailureTracker(transient_ttl=60)
+        tracker.record_failure('http://a.com/x.jpg', requests.Timeout(), now=1000)
+        assert tracker.check('http://a.com/x.jpg', now=1030) == 'timeout'
+        assert tracker.check('http://a.com/x.jpg', now=1061) is None
+
+    def test_breaker_trips_and_half_opens(self):
+        """Test: El host se abre tras N timeouts y deja pasar una sola prueba tras el cooldown"""
+        tracker = FailureTracker(breaker_threshold=3, breaker_cooldown=100)
+        for i in range(3):
+            tracker.record_failure(f'http://slow.com/{i}.jpg', requests.ConnectionError(), now=1000)
+        assert tracker.check('http://slow.com/other.jpg', now=1010) == 'circuit_open'
+        assert tracker.open_hosts(now=1010) == ['slow.com']
+        assert tracker.check('http://fast.com/a.jpg', now=1010) is None
+
+        assert tracker.check('http://slow.com/trial.jpg', now=1101) is None  # trial request
+        assert tracker.check('http://slow.com/other.jpg', now=1101) == 'circuit_open'
+        tracker.record_success('http://slow.com/trial.jpg')
+        assert tracker.check('http://slow.com/other.jpg', now=1102) is None
+
+    @pytest.mark.parametrize('error', [
+        requests.HTTPError(response=type('R', (), {'status_code': 404})()),
+        ValueError("cannot identify image file"),
+        ImageTooLargeError("demasiado grande"),
+    ])
+    def test_trial_answered_closes_breaker(self, error):
+        """Test: Una prueba half-open que termina en 404 o imagen inválida cierra el circuito"""
+        tracker = FailureTracker(breaker_threshold=1, breaker_cooldown=100)
+        tracker.record_failure('http://slow.com/a.jpg', requests.Timeout(), now=1000)
+        assert tracker.check('http://slow.com/trial.jpg', now=1101) is None
+        assert tracker.open_hosts(now=1101) == ['slow.com']
+
+        tracker.record_failure('http://slow.com/trial.jpg', error, now=1102)
+        assert tracker.check('http://slow.com/other.jpg', now=1103) is None
+        assert tracker.open_hosts(now=1103) == []
+
+    def test_abandoned_trial_reopens_breaker(self):
+        """Test: Una prueba que acaba por deadline u omitida reabre el circuito con cooldown nuevo"""
+        tracker = FailureTracker(breaker_threshold=1, breaker_cooldown=100)
+        tracker.record_failure('http://slow.com/a.jpg', requests.Timeout(), now=1000)
+        assert tracker.check('http://slow.com/trial.jpg', now=1101) is None
+
+        tracker.record_abandoned('http://slow.com/other.jpg', now=1102) # Not the trial: ignored
+        assert tracker.check('http://slow.com/other.jpg', now=1102) == 'circuit_open'
+        tracker.record_abandoned('http://slow.com/trial.jpg', now=1105)
+        assert tracker.check('http://slow.com/other.jpg', now=1200) == 'circuit_open'
+        assert tracker.open_hosts(now=1200) == ['slow.com']
+        assert tracker.check('http://slow.com/other.jpg', now=1206) is None
+
+    def test_lost_trial_times_out(self):
+        """Test: Una prueba sin resultado registrado deja pasar otra tras trial_timeout"""
+        tracker = FailureTracker(breaker_threshold=1, breaker_cooldown=100, trial_timeout=30)
+        tracker.record_failure('http://slow.com/a.jpg', requests.Timeout(), now=1000)
+        assert tracker.check('http://slow.com/trial.jpg', now=1101) is None
+        assert tracker.check('http://slow.com/other.jpg', now=1120) == 'circuit_open'
+        assert tracker.check('http://slow.com/other.jpg', now=1132) is None
+        assert tracker.check('http://slow.com/third.jpg', now=1133) == 'circuit_open'
+
+    def test_not_found_does_not_trip_breaker(self):
+        """Test: Un 404 se cachea como negativo pero no cuenta contra el host"""
+        tracker = FailureTracker(breaker_threshold=1)
+        response = requests.Response()
+        response.status_code = 404
+        tracker.record_failure('http://a.com/x.jpg', requests.HTTPError(response=response))
+        assert tracker.check('http://a.com/x.jpg') == 'http_404'
+        assert tracker.open_hosts() == []
+
+    def test_persists_to_disk(self, tmp_path):
+        """Test: El estado sobrevive a un reinicio"""
+        path = str(tmp_path / 'failures.json')
+        tracker = FailureTracker(path, breaker_threshold=1)
+        tracker.record_failure('http://slow.com/a.jpg', requests.Timeout())
+        tracker.flush()
+
+        reloaded = FailureTracker(path)
+        assert reloaded.check('http://slow.com/a.jpg') == 'timeout'
+        assert reloaded.open_hosts() == ['slow.com']
+
+
+@pytest.mark.skipif(not HAS_AIOHTTP, reason="aiohttp no instalado")
+class TestAsyncFetch:
+    """Pruebas del modo asyncio con límites por host"""
+
+    def _collect(self, urls, **kwargs):
+        async def run():
+            return [item async for item in stream_images_async(urls, **kwargs)]
+        return asyncio.run(run())
+
+    def test_streams_all_results(self, image_server):
+        """Test: Entrega un resultado por URL, errores incluidos"""
+        urls = [f"{image_server}/img{i}.jpg" for i in range(20)] + [f"{image_server}/missing.jpg"]
+        results = self._collect(urls)
+
+        assert len(results) == len(urls)
+        errors = [url for url, content, error, validators in results if error is not None]
+        assert errors == [f"{image_server}/missing.jpg"]
+
+    def test_respects_per_host_limit(self, image_server):
+        """Test: Nunca hay más de per_host_limit peticiones en vuelo contra un host"""
+        _ImageHandler.delay = 0.05
+        _ImageHandler.max_in_flight = 0
+        try:
+            urls = [f"{image_server}/img{i}.jpg" for i in range(24)]
+            self._collect(urls, global_limit=50, per_host_limit=3)
+        finally:
+            _ImageHandler.delay = 0
+        assert 1 < _ImageHandler.max_in_flight <= 3
+
+    def test_max_bytes_reported_as_error(self, image_server):
+        """Test: Una imagen que supera max_bytes se entrega como error"""
+        results = self._collect([f"{image_server}/a.jpg"], max_bytes=100)
+        assert isinstance(results[0][2], ImageTooLargeError)
+
+    def test_skip_callback_fails_fast(self, image_server):
+        """Test: skip() omite la petición y entrega ImageSkippedError"""
+        results = self._collect([f"{image_server}/a.jpg"], skip=lambda url: 'circuit_open')
+        assert isinstance(results[0][2], ImageSkippedError)
+
+    def test_conditional_requests(self, image_server):
+        """Test: validators(url) hace la petición condicional; 304 llega como ImageNotModified"""
+        urls = [f"{image_server}/etag.jpg", f"{image_server}/plain.jpg"]
+        results = {url: (error, validators) for url, content, error, validators in
+                   self._collect(urls, validators=lambda url: {'etag': '"v1"'} if 'etag' in url else None)}
+        assert isinstance(results[urls[0]][0], ImageNotModified)
+        assert results[urls[1]][0] is None
+
+        url, content, error, validators = self._collect([urls[0]])[0]
+        assert content == _ImageHandler.body
+        assert validators['etag'] == '"v1"'
+
+    def test_adaptive_limiter_backs_off_on_429(self, image_server):
+        """Test: El modo asyncio respeta el límite adaptativo y lo reduce ante 429"""
+        _ImageHandler.delay = 0.02
+        _ImageHandler.max_in_flight = 0
+        limiter = AdaptiveLimiter(initial=4)
+        try:
+            self._collect([f"{image_server}/img{i}.jpg" for i in range(12)], per_host_limit=16, limiter=limiter)
+        finally:
+            _ImageHandler.delay = 0
+        host = image_server.split('//')[1]
+        assert _ImageHandler.max_in_flight <= 8  # 4 (initial) + slow start to 8 after the first window
+        grown = limiter.limit(host)
+        assert grown > 4
+
+        self._collect([f"{image_server}/throttle{i}.jpg" for i in range(4)], limiter=limiter, retries=0)
+        stats = limiter.stats()[host]
+        assert stats['throttled'] == 4
+        assert stats['limit'] < grown
+
+    def test_retries_and_deadline(self, image_server):
+        """Test: Reintenta 503 transitorios y entrega ImageDeadlineError al vencer el plazo"""
+        counters = {}
+        results = self._collect([f"{image_server}/flaky-async.jpg"], counters=counters)
+        assert results[0][2] is None
+        assert counters['retries'] == 2
+
+        _ImageHandler.delay = 1.0
+        started = time.monotonic()
+        try:
+            results = self._collect([f"{image_server}/slow{i}.jpg" for i in range(3)], deadline=time.monotonic() + 0.3)
+        finally:
+            _ImageHandler.delay = 0
+        assert all(isinstance(error, ImageDeadlineError) for _, _, error, _ in results)
+        assert time.monotonic() - started < 0.9
+
+    def test_group_urls_by_host(self):
+        """Test: Agrupación de URLs por host"""
+        groups = group_urls_by_host(['http://a.com/1', 'http://B.com/2', 'http://a.com/3'])
+        assert groups == {'a.com': ['http://a.com/1', 'http://a.com/3'], 'b.com': ['http://B.com/2']}
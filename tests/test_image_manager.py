@@ -0,0 +1,76 @@
+"""
+Pruebas de la precarga de imágenes del exportador (ImageManager) y de las imágenes pegadas en el .xlsx
+"""
+
+import io
+import sys
+import uuid
+from pathlib import Path
+
+import pandas as pd
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import main
+from main import ImageManager, EnhancedPDFExporter, DataHandler
+from image_bundle import BundleRegistry
+from test_image_bundle import make_workbook
+
+
+def _jpeg_bytes(size=(1200, 900)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (10, 200, 30)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+class TestPrefetchSize:
+    """Pruebas del tamaño decodificado en la precarga"""
+
+    def test_layout_reads_prefetched_size(self, tmp_path, monkeypatch):
+        """Test: Tras la precarga, la maquetación no decodifica ni deriva nada"""
+        monkeypatch.setattr(ImageManager, 'CACHE_DIR', str(tmp_path))
+        manager = ImageManager()
+        content = _jpeg_bytes()
+        monkeypatch.setattr(manager.fetcher, 'fetch', lambda url, **kwargs: (content, None))
+
+        calls = []
+        run_decode = main.run_decode
+
+        def counting_run_decode(fn, *args, **kwargs):
+            calls.append(fn.__name__)
+            return run_decode(fn, *args, **kwargs)
+
+        monkeypatch.setattr(main, 'run_decode', counting_run_decode)
+
+        urls = [f"https://img.example.com/{uuid.uuid4().hex}/{i}.jpg" for i in range(4)]
+        stats = manager.download_images_concurrently(urls, max_workers=2, max_size=EnhancedPDFExporter.PRO_IMAGE_PIXELS)
+        assert stats['ok'] == len(urls)
+        assert calls.count('decode_master_and_size') == len(urls)
+
+        calls.clear()
+        for url in urls:
+            _, _, status = manager.get_encoded_image(url, target='pdf', max_size=EnhancedPDFExporter.PRO_IMAGE_PIXELS)
+            assert status == 'cache'
+        assert calls == []
+
+
+class TestEmbeddedImagesPerUpload:
+    """Pruebas de las imágenes pegadas en el .xlsx a través de los reruns"""
+
+    def test_workbook_processed_once_per_upload(self, tmp_path):
+        """Test: El mismo archivo subido (file_id) no se vuelve a guardar ni parsear en cada rerun"""
+        registry = BundleRegistry(str(tmp_path))
+        added = []
+        add = registry.add
+        registry.add = lambda fileobj: added.append(1) or add(fileobj)
+
+        workbook = make_workbook({1: [('B2', 'red')], 2: [('B3', 'blue')]})
+        workbook.file_id = uuid.uuid4().hex
+        handler = DataHandler()
+        for _ in range(3):
+            df = pd.DataFrame({'Producto': ['p1', 'p2'], 'ImagenURL': [None, 'https://x.com/a.jpg']})
+            df = handler._attach_embedded_images(workbook, df, registry)
+            assert df['ImagenURL'][0].startswith('zip://')
+            assert df['ImagenURL'][1] == 'https://x.com/a.jpg'
+        assert len(added) == 1
@@ -0,0 +1,51 @@
+"""
+Pruebas del placeholder compartido por proceso (image_placeholder)
+"""
+
+import io
+import sys
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_placeholder import PlaceholderImage
+
+
+def encode_jpeg(image):
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG')
+    return buffered.getvalue()
+
+
+class TestPlaceholderImage:
+    """Pruebas del placeholder pre-codificado"""
+
+    def test_encodes_each_variant_once(self):
+        """Test: Cada (destino, tamaño) se codifica una sola vez y se reutilizan los mismos bytes"""
+        placeholder = PlaceholderImage()
+        calls = []
+
+        def encode(image):
+            calls.append(image.size)
+            return encode_jpeg(image)
+
+        first = placeholder.encoded('pdf', encode, (400, 400))
+        second = placeholder.encoded('pdf', encode, (300, 300))
+        assert first is second
+        assert first[1] == (300, 300)
+        assert calls == [(300, 300)]
+
+        small = placeholder.encoded('pdf', encode, (100, 100))
+        assert small[1] == (100, 100)
+        assert Image.open(io.BytesIO(small[0])).size == (100, 100)
+        assert calls == [(300, 300), (100, 100)]
+
+    def test_variant_fits_max_size(self):
+        """Test: La variante cabe en max_size y el original no se modifica"""
+        placeholder = PlaceholderImage()
+        assert placeholder.variant() is placeholder.image
+        assert placeholder.variant((150, 80)).size == (80, 80)
+        assert placeholder.variant((150, 80)) is placeholder.variant((150, 80))
+        assert placeholder.image.size == (300, 300)
@@ -0,0 +1,79 @@
+"""
+Pruebas de la etapa de decodificación en procesos (image_processing)
+"""
+
+import io
+import os
+import sys
+from pathlib import Path
+
+from PIL import Image, JpegImagePlugin
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import image_processing
+from image_processing import process_image_bytes, decode_master_and_size, derive_size, image_from_pixels, run_decode
+
+
+def _png_bytes(size=(1600, 1200)):
+    buf = io.BytesIO()
+    Image.new('RGBA', size, (0, 120, 200, 128)).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+def _jpeg_bytes(size=(4000, 3000)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, (10, 200, 30)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def _crash():
+    os._exit(1)
+
+
+class TestDecodeStage:
+    """Pruebas del worker de decodificación"""
+
+    def test_decode_master_and_size(self):
+        """Test: Genera maestro y tamaño derivado, ambos JPEG en RGB"""
+        master, derived, pixels = decode_master_and_size(_png_bytes(), (800, 800), 90, (300, 300))
+
+        image = image_from_pixels(pixels)
+        assert image.mode == 'RGB'
+        assert image.size == (300, 225)
+        assert Image.open(io.BytesIO(master)).size == (800, 600)
+        assert Image.open(io.BytesIO(derived)).size == (300, 225)
+
+    def test_large_jpeg_uses_reduced_scale_decode(self, monkeypatch):
+        """Test: Un JPEG grande se decodifica a escala reducida (draft) antes del LANCZOS"""
+        drafts = []
+        original_draft = JpegImagePlugin.JpegImageFile.draft
+
+        def spy(self, mode, size):
+            result = original_draft(self, mode, size)
+            drafts.append(self.size)
+            return result
+
+        monkeypatch.setattr(JpegImagePlugin.JpegImageFile, 'draft', spy)
+        image = process_image_bytes(_jpeg_bytes(), (800, 800))
+        assert image.size == (800, 600)
+        assert drafts[0] == (1000, 750)  # 1/4 scale, still covers 800px
+
+    def test_runs_in_process_pool(self):
+        """Test: El mismo resultado al ejecutarse en el pool de procesos"""
+        master = decode_master_and_size(_png_bytes(), (800, 800), 90, (300, 300))[0]
+        derived, pixels = run_decode(derive_size, master, (200, 200), max_workers=2)
+        assert image_from_pixels(pixels).size == (200, 150)
+
+    def test_broken_pool_falls_back_inline(self):
+        """Test: Si un worker muere, se decodifica en el hilo actual y el pool se recrea"""
+        broken = image_processing.get_decode_pool(2)
+        # A worker exiting mid-task breaks the whole pool
+        try:
+            broken.submit(_crash).result()
+        except Exception:
+            pass
+        master = decode_master_and_size(_png_bytes(), (800, 800), 90, (300, 300))[0]
+        _, pixels = run_decode(derive_size, master, (100, 100), max_workers=2)
+        assert image_from_pixels(pixels).size == (100, 75)
+        assert image_processing.get_decode_pool(2) is not broken
@@ -0,0 +1,159 @@
+"""
+Pruebas de la caché en disco empaquetada (image_store)
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_store import ImagePackStore
+
+
+class TestImagePackStore:
+    """Pruebas del pack append-only con índice SQLite"""
+
+    def test_put_get_and_reopen(self, tmp_path):
+        """Test: Las entradas sobreviven a cerrar y reabrir el almacén"""
+        store = ImagePackStore(str(tmp_path), max_bytes=1000)
+        assert store.is_new
+        store.put('a', b'alpha', variant='master')
+        store.put('b', b'beta')
+        assert store.get('a') == b'alpha'
+        store.close()
+
+        reopened = ImagePackStore(str(tmp_path), max_bytes=1000)
+        assert not reopened.is_new
+        assert reopened.get('a') == b'alpha'
+        assert reopened.get('b') == b'beta'
+        assert reopened.get('missing') is None
+
+    def test_lru_eviction_by_last_access(self, tmp_path):
+        """Test: Expulsa por último acceso (no por fecha de escritura) hasta cumplir el presupuesto"""
+        store = ImagePackStore(str(tmp_path), max_bytes=250)
+        store.put('a', b'x' * 100)
+        store.put('b', b'x' * 100)
+        store.get('a')
+        store.put('c', b'x' * 100)  # Over budget: eviction is deferred to maintenance
+        store.evict()
+
+        assert 'b' not in store
+        assert 'a' in store and 'c' in store
+        assert store.stats()['live_bytes'] == 200
+        assert store.stats()['dead_bytes'] == 100
+
+    def test_lfu_with_aging(self, tmp_path):
+        """Test: LFU conserva lo más leído; el aging reduce los contadores a la mitad"""
+        store = ImagePackStore(str(tmp_path), max_bytes=250, eviction='lfu')
+        store.put('popular', b'x' * 100)
+        store.put('rare', b'x' * 100)
+        for _ in range(4):
+            store.get('popular')
+        store.get('rare')
+        store.put('new', b'x' * 100)
+        store.get('new')
+        store.get('new')
+        store.evict()
+        assert 'rare' not in store
+        assert 'popular' in store and 'new' in store
+
+        store.age_hits()
+        assert store.stats()['hits'] == 2 + 1
+
+    def test_maintenance_thread_evicts_in_background(self, tmp_path):
+        """Test: Superar el presupuesto despierta al hilo de mantenimiento"""
+        store = ImagePackStore(str(tmp_path), max_bytes=250)
+        for key in 'abcd':
+            store.put(key, b'x' * 100)
+        deadline = time.time() + 5
+        while store.stats()['live_bytes'] > 250 and time.time() < deadline:
+            time.sleep(0.01)
+        assert store.stats()['live_bytes'] <= 250
+        assert store.stats()['evictions'] >= 2
+
+    def test_compaction_reclaims_dead_bytes(self, tmp_path):
+        """Test: La compactación reescribe solo las entradas vivas en un pack nuevo"""
+        store = ImagePackStore(str(tmp_path), max_bytes=10000, compact_min_bytes=10 ** 9)
+        for i in range(10):
+            store.put(f'k{i}', bytes([i]) * 100)
+        for i in range(8):
+            store.delete(f'k{i}')
+        old_pack = store.pack_path
+        store.compact()
+
+        stats = store.stats()
+        assert stats['pack_bytes'] == 200
+        assert stats['dead_bytes'] == 0
+        assert not Path(old_pack).exists()
+        assert store.get('k9') == bytes([9]) * 100
+        store.put('new', b'after')
+        store.close()
+        assert ImagePackStore(str(tmp_path), max_bytes=10000).get('new') == b'after'
+
+    def test_stale_pack_removed_on_start(self, tmp_path):
+        """Test: Un pack de una compactación interrumpida se borra al abrir"""
+        ImagePackStore(str(tmp_path), max_bytes=1000).close()
+        stray = tmp_path / 'images.7.pack'
+        stray.write_bytes(b'partial')
+        ImagePackStore(str(tmp_path), max_bytes=1000).close()
+        assert not stray.exists()
+
+    def test_host_stats(self, tmp_path):
+        """Test: Estadísticas por host de origen para el panel de administración"""
+        store = ImagePackStore(str(tmp_path), max_bytes=10000)
+        store.put('a', b'x' * 300, host='cdn.example.com')
+        store.put('b', b'x' * 100, host='cdn.example.com')
+        store.put('c', b'x' * 50, host='other.com')
+        store.get('a')
+
+        rows = store.host_stats()
+        assert rows[0]['host'] == 'cdn.example.com'
+        assert (rows[0]['entries'], rows[0]['bytes'], rows[0]['hits']) == (2, 400, 1)
+
+    def test_validators_and_freshness(self, tmp_path):
+        """Test: Validadores HTTP persistentes y ventana de frescura por entrada"""
+        store = ImagePackStore(str(tmp_path), max_bytes=1000)
+        store.put('m', b'master', source='http://a.com/x.jpg', validators={'etag': '"v1"'})
+        assert not store.is_stale('m', max_age=60)
+        assert store.is_stale('m', max_age=60, now=time.time() + 120)
+        assert not store.is_stale('missing', max_age=0)
+
+        store.mark_validated('m', {'last_modified': 'Wed, 01 Jan 2025 00:00:00 GMT'})
+        store.close()
+        reopened = ImagePackStore(str(tmp_path), max_bytes=1000)
+        assert reopened.get_validators('m') == {'etag': '"v1"', 'last_modified': 'Wed, 01 Jan 2025 00:00:00 GMT'}
+        assert reopened.get_validators('missing') == {}
+
+    def test_delete_source_drops_all_variants(self, tmp_path):
+        """Test: Una imagen cambiada en el origen invalida todas sus variantes"""
+        store = ImagePackStore(str(tmp_path), max_bytes=1000)
+        store.put('master', b'm', source='http://a.com/x.jpg')
+        store.put('small', b's', source='http://a.com/x.jpg')
+        store.put('other', b'o', source='http://a.com/y.jpg')
+        assert store.delete_source('http://a.com/x.jpg') == 2
+        assert 'master' not in store and 'small' not in store
+        assert store.get('other') == b'o'
+        assert store.stats()['live_bytes'] == 1
+
+    def test_migrates_text_index(self, tmp_path):
+        """Test: Migra el índice de texto de la versión anterior del pack"""
+        (tmp_path / 'images.pack').write_bytes(b'alphabeta')
+        (tmp_path / 'images.idx').write_text('+\ta\t0\t5\tmaster\t100\n+\tb\t5\t4\t\t200\n-\tb\n')
+
+        store = ImagePackStore(str(tmp_path), max_bytes=1000)
+        assert not store.is_new
+        assert store.get('a') == b'alpha'
+        assert 'b' not in store
+        assert not (tmp_path / 'images.idx').exists()
+
+    def test_imports_loose_legacy_files(self, tmp_path):
+        """Test: Migra los <md5>.jpg sueltos del caché anterior sin borrarlos"""
+        legacy = tmp_path / ('0' * 32 + '.jpg')
+        legacy.write_bytes(b'jpeg-bytes')
+        (tmp_path / 'notes.txt').write_text('ignored')
+
+        store = ImagePackStore(str(tmp_path), max_bytes=1000)
+        assert store.import_loose_files() == 1
+        assert store.get('0' * 32) == b'jpeg-bytes'
+        assert legacy.exists()
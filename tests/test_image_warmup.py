@@ -0,0 +1,102 @@
+"""
+Pruebas de la precarga de imágenes en segundo plano (image_warmup)
+"""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from image_warmup import WarmupJob
+
+
+class TestWarmupJob:
+    """Pruebas del job de precarga"""
+
+    def test_runs_in_background_and_reports_progress(self):
+        """Test: El job no bloquea y expone progreso y stats al terminar"""
+        release = threading.Event()
+        seen = []
+
+        def prefetch(urls, progress_callback=None):
+            progress_callback(1, len(urls))
+            seen.append(list(urls))
+            release.wait(5)
+            return {'ok': len(urls), 'valid_urls': len(urls)}
+
+        job = WarmupJob(['a', 'b'], prefetch).start()
+        assert not job.done
+        release.set()
+        assert job.wait(5)
+
+        assert seen == [['a', 'b']]
+        assert job.progress() == 1.0
+        assert job.completed == 2
+        assert job.stats == {'ok': 2, 'valid_urls': 2}
+        assert job.error is None
+
+    def test_error_is_captured(self):
+        """Test: Un fallo de la precarga queda en job.error (nunca rompe la app)"""
+        def prefetch(urls, progress_callback=None):
+            raise RuntimeError("sin red")
+
+        job = WarmupJob(['a'], prefetch).start()
+        job.wait(5)
+        assert isinstance(job.error, RuntimeError)
+        assert job.done
+
+    def test_cancel_stops_between_batches(self):
+        """Test: cancel() detiene el job tras el lote en curso y suma las stats de los lotes hechos"""
+        started, release = threading.Event(), threading.Event()
+        batches = []
+
+        def prefetch(urls, progress_callback=None):
+            batches.append(list(urls))
+            progress_callback(len(urls), len(urls))
+            started.set()
+            release.wait(5)
+            return {'ok': len(urls), 'valid_urls': len(urls), 'memory_cache': {'bytes': len(batches)}}
+
+        job = WarmupJob(['a', 'b', 'c', 'd', 'e'], prefetch, batch_size=2).start()
+        assert started.wait(5)
+        job.cancel()
+        release.set()
+        assert job.wait(5)
+
+        assert batches == [['a', 'b']]
+        assert job.stats == {'ok': 2, 'valid_urls': 2, 'memory_cache': {'bytes': 1}}
+        assert job.completed == 2 and job.error is None
+
+    def test_batches_merge_stats(self):
+        """Test: Sin cancelar se precargan todos los lotes y sus contadores se suman"""
+        def prefetch(urls, progress_callback=None):
+            return {'ok': len(urls), 'connections': {'requests': len(urls)}}
+
+        job = WarmupJob(['a', 'b', 'c'], prefetch, batch_size=2).start()
+        assert job.wait(5)
+        assert job.stats == {'ok': 3, 'connections': {'requests': 1}}
+        assert job.completed == 3
+
+    def test_replacement_waits_for_previous(self):
+        """Test: Un job con after= no empieza hasta que el anterior termina"""
+        release = threading.Event()
+        running = []
+
+        def slow(urls, progress_callback=None):
+            running.append('old')
+            release.wait(5)
+            running.remove('old')
+            return {}
+
+        def fast(urls, progress_callback=None):
+            assert running == []
+            return {'ok': len(urls)}
+
+        old = WarmupJob(['a'], slow).start()
+        old.cancel()
+        new = WarmupJob(['b'], fast, after=old).start()
+        assert not new.wait(0.2)
+        release.set()
+        assert new.wait(5)
+        assert new.error is None and new.stats == {'ok': 1}
@@ -0,0 +1,76 @@
+"""
+Pruebas del motor grid rápido (pdf_grid) frente al layout profesional con platypus
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import Paragraph, SimpleDocTemplate
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pdf_render import HAS_PYPDF, PRO_MARGINS, draw_footer, product_styles, product_story
+from pdf_grid import TEXT_WIDTH, _wrap_words
+
+WORDS = 'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore'.split()
+
+
+def make_catalog(n):
+    rows = []
+    for i in range(n):
+        rows.append({
+            'Línea': f'L{i % 3}', 'Familia': f'F{i % 4}', 'Grupo': f'G{i % 2}',
+            'Producto': ' '.join(WORDS[:(i * 7) % 13]),
+            'Descripción': ' '.join(WORDS[(i * 3) % 5:]) * (i % 3),
+            'Precio': None if i % 11 == 0 else 1.5 * i, 'Unidad': ['u', 'kg', 'caja x 12', ''][i % 4],
+            'ImagenURL': None
+        })
+    df = pd.DataFrame(rows)
+    df.loc[0, 'Producto'] = 'A & B <x>' # Markup: drawn by Paragraph
+    df.loc[1, 'Producto'] = 'Supercalifragilisticexpialidocious' * 3 # Word wider than the cell
+    return df
+
+
+def render(df, engine):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, **PRO_MARGINS)
+    footer = lambda canv, _doc: draw_footer(canv, 'Tel: 1')
+    doc.build(product_story(engine, df, 'S/', lambda url: None), onFirstPage=footer, onLaterPages=footer)
+    return buffer.getvalue()
+
+
+class TestWrapWords:
+    """Pruebas de los cortes de línea medidos una sola vez"""
+
+    def test_same_breaks_as_paragraph(self):
+        """Test: Los cortes coinciden con los de Paragraph, incluida la tolerancia de encogimiento"""
+        style = product_styles(None)['desc']
+        for n in range(1, 40):
+            text = ' '.join(WORDS[i % len(WORDS)] for i in range(n * 3, n * 4))
+            para = Paragraph(text, style)
+            para.wrap(TEXT_WIDTH, 1e6)
+            expected = [' '.join(line[1]) for line in para.blPara.lines]
+            assert [line for line, _ in _wrap_words(text, style.fontName, style.fontSize, TEXT_WIDTH)] == expected
+
+    def test_word_wider_than_cell(self):
+        """Test: Una palabra más ancha que la celda se deja a Paragraph"""
+        assert _wrap_words('x' * 200, 'Helvetica', 8, TEXT_WIDTH) is None
+
+
+@pytest.mark.skipif(not HAS_PYPDF, reason="pypdf no instalado")
+class TestGridMatchesPlatypus:
+    """Pruebas de equivalencia de ambos motores"""
+
+    def test_same_pages_and_text(self):
+        """Test: Mismo número de páginas y el mismo texto en cada página"""
+        from pypdf import PdfReader
+
+        df = make_catalog(150)
+        pages = [PdfReader(io.BytesIO(render(df, engine))).pages for engine in ('platypus', 'grid')]
+        assert len(pages[0]) == len(pages[1]) > 1
+        for expected, page in zip(*pages):
+            assert page.extract_text().split() == expected.extract_text().split()
@@ -0,0 +1,161 @@
+"""
+Pruebas de la maquetación por tramos (pdf_render)
+"""
+
+import io
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+from PIL import Image
+from reportlab.lib.pagesizes import A4
+from reportlab.platypus import SimpleDocTemplate
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pdf_render import HAS_PYPDF, PRO_MARGINS, NumberedCanvas, sort_catalog, build_product_story, pro_image, split_shards, shard_fingerprint, render_shard, merge_shards
+
+
+def make_catalog(lines, per_line):
+    rows = []
+    for line in range(lines):
+        for i in range(per_line):
+            rows.append({
+                'Línea': f'L{line}', 'Familia': f'F{i // 10}', 'Grupo': 'G',
+                'Producto': f'P{line}-{i}', 'Precio': 1.0, 'Unidad': 'u', 'ImagenURL': None
+            })
+    return pd.DataFrame(rows)
+
+
+class TestSplitShards:
+    """Pruebas del reparto del catálogo en tramos"""
+
+    def test_cuts_at_line_changes(self):
+        """Test: Los tramos son contiguos, cubren todo el catálogo y empiezan en una Línea nueva"""
+        df_sorted, group_cols = sort_catalog(make_catalog(lines=6, per_line=20))
+        shards = split_shards(df_sorted, group_cols, 40)
+
+        assert len(shards) == 3
+        assert pd.concat(shards).index.equals(df_sorted.index)
+        for previous, shard in zip(shards, shards[1:]):
+            assert shard['Línea'].iloc[0] != previous['Línea'].iloc[-1]
+
+    def test_large_line_is_cut_at_group_boundary(self):
+        """Test: Una Línea mucho mayor que el tramo objetivo se corta en un cambio de grupo"""
+        df_sorted, group_cols = sort_catalog(make_catalog(lines=1, per_line=60))
+        shards = split_shards(df_sorted, group_cols, 20)
+
+        assert len(shards) > 1
+        assert pd.concat(shards).index.equals(df_sorted.index)
+        for shard in shards[1:]:
+            assert len(shard) % 10 == 0
+
+    def test_single_shard(self):
+        """Test: Un catálogo menor que el objetivo queda en un solo tramo"""
+        df_sorted, group_cols = sort_catalog(make_catalog(lines=2, per_line=5))
+        assert len(split_shards(df_sorted, group_cols, 10)) == 1
+
+    def test_cuts_stable_when_values_change(self):
+        """Test: Cambiar precios no mueve los cortes"""
+        df = make_catalog(lines=6, per_line=20)
+        before = split_shards(*sort_catalog(df), 40)
+        df.loc[df['Línea'] == 'L0', 'Precio'] = 9.9
+        after = split_shards(*sort_catalog(df), 40)
+        assert [list(s.index) for s in before] == [list(s.index) for s in after]
+
+
+class TestShardFingerprint:
+    """Pruebas de la huella de cada tramo (caché de secciones)"""
+
+    def test_changes_only_with_content(self):
+        """Test: La huella solo cambia si cambian las filas, las imágenes, el branding o la moneda"""
+        shard = make_catalog(lines=1, per_line=4)
+        images = {'': (b'placeholder', (10, 10))}
+        base = shard_fingerprint(shard, 'S/', images)
+
+        assert shard_fingerprint(shard.copy(), 'S/', dict(images)) == base
+        assert shard_fingerprint(shard, 'USD', images) != base
+        assert shard_fingerprint(shard, 'S/', images, branding={'primary': '#000000'}) != base
+        assert shard_fingerprint(shard, 'S/', images, contact_info='Tel: 1') != base
+        assert shard_fingerprint(shard, 'S/', images, engine='grid') != base
+
+        tweaked = shard.copy()
+        tweaked.loc[0, 'Precio'] = 2.0
+        assert shard_fingerprint(tweaked, 'S/', images) != base
+
+    def test_image_bytes_are_part_of_fingerprint(self):
+        """Test: La misma URL con otra imagen cambia la huella"""
+        shard = make_catalog(lines=1, per_line=2)
+        shard.loc[0, 'ImagenURL'] = 'https://example.com/a.jpg'
+        first = shard_fingerprint(shard, 'S/', {'https://example.com/a.jpg': (b'old', (1, 1)), '': (b'p', (1, 1))})
+        second = shard_fingerprint(shard, 'S/', {'https://example.com/a.jpg': (b'new', (1, 1)), '': (b'p', (1, 1))})
+        assert first != second
+
+
+@pytest.mark.skipif(not HAS_PYPDF, reason="pypdf no instalado")
+class TestMergeShards:
+    """Pruebas de la unión de tramos con numeración global"""
+
+    def test_global_page_numbers(self):
+        """Test: Tras unir, cada página lleva su número global"""
+        from pypdf import PdfReader
+
+        df_sorted, group_cols = sort_catalog(make_catalog(lines=2, per_line=30))
+        parts = [render_shard(shard, 'S/', {}) for shard in split_shards(df_sorted, group_cols, 30)]
+        pdf, total = merge_shards(parts)
+
+        pages = PdfReader(io.BytesIO(pdf)).pages
+        assert total == len(pages) == sum(len(PdfReader(io.BytesIO(part)).pages) for part in parts)
+        for number, page in enumerate(pages, 1):
+            assert f"Página {number} de" in page.extract_text()
+
+
+@pytest.mark.skipif(not HAS_PYPDF, reason="pypdf no instalado")
+class TestDedupImage:
+    """Pruebas de la deduplicación de imágenes repetidas en el PDF"""
+
+    @pytest.mark.parametrize('with_key', [True, False])
+    def test_repeated_image_embedded_once(self, with_key):
+        """Test: 50 celdas con la misma imagen producen un único image XObject (JPEG sin recodificar)"""
+        from pypdf import PdfReader
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), (200, 10, 10)).save(buffer, 'JPEG')
+        jpeg = buffer.getvalue()
+        catalog = make_catalog(lines=1, per_line=50)
+        catalog['ImagenURL'] = 'https://example.com/same.jpg'
+        get_image = lambda url: pro_image(jpeg, (40, 30), key=url if with_key else None)
+
+        out = io.BytesIO()
+        SimpleDocTemplate(out, pagesize=A4, **PRO_MARGINS).build(build_product_story(catalog, 'S/', get_image))
+
+        reader = PdfReader(out)
+        assert len(reader.pages) > 1
+        images = []
+        for number in range(1, reader.trailer['/Size']):
+            obj = reader.get_object(number)
+            if hasattr(obj, 'get') and obj.get('/Subtype') == '/Image':
+                images.append(obj)
+        assert len(images) == 1
+        assert '/DCTDecode' in images[0].get('/Filter')
+
+
+@pytest.mark.skipif(not HAS_PYPDF, reason="pypdf no instalado")
+class TestNumberedCanvas:
+    """Pruebas de la numeración 'Página X de Y' sin tramos"""
+
+    def test_total_pages_on_first_and_last_page(self):
+        """Test: La primera y la última página muestran el total definitivo"""
+        from pypdf import PdfReader
+
+        out = io.BytesIO()
+        doc = SimpleDocTemplate(out, pagesize=A4, **PRO_MARGINS)
+        doc.build(build_product_story(make_catalog(lines=3, per_line=40), 'S/', lambda url: None), canvasmaker=NumberedCanvas)
+
+        # The total is drawn from a form XObject: the extractor puts it on its own line
+        texts = [' '.join(page.extract_text().split()) for page in PdfReader(out).pages]
+        total = len(texts)
+        assert total > 2
+        assert f"Página 1 de {total}" in texts[0]
+        assert f"Página {total} de {total}" in texts[-1]
@@ -0,0 +1,80 @@
+"""
+Pruebas del almacén de PDFs terminados (pdf_store)
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from pdf_store import PDFArtifactStore, catalog_fingerprint
+
+
+def make_df(price=1.0):
+    return pd.DataFrame({'Producto': ['A', 'B'], 'Precio': [price, 2.0], 'ImagenURL': [None, 'https://example.com/b.jpg']})
+
+
+class TestCatalogFingerprint:
+    """Pruebas de la huella de una exportación"""
+
+    def test_same_content_same_key(self):
+        """Test: El mismo catálogo con los mismos ajustes da la misma huella"""
+        branding = {'primary': '#2c3e50', 'accent': '#3498db'}
+        first = catalog_fingerprint(make_df(), True, branding, b'logo', 'Título')
+        second = catalog_fingerprint(make_df(), True, dict(reversed(list(branding.items()))), b'logo', 'Título')
+        assert first == second
+
+    def test_any_ingredient_changes_key(self):
+        """Test: Cambiar datos, layout, branding, logo o título cambia la huella"""
+        base = catalog_fingerprint(make_df(), True, {'primary': '#000000'}, b'logo', 'Título')
+        assert catalog_fingerprint(make_df(price=1.5), True, {'primary': '#000000'}, b'logo', 'Título') != base
+        assert catalog_fingerprint(make_df(), False, {'primary': '#000000'}, b'logo', 'Título') != base
+        assert catalog_fingerprint(make_df(), True, {'primary': '#ffffff'}, b'logo', 'Título') != base
+        assert catalog_fingerprint(make_df(), True, {'primary': '#000000'}, b'otro', 'Título') != base
+        assert catalog_fingerprint(make_df(), True, {'primary': '#000000'}, b'logo', 'Otro') != base
+
+
+class TestPDFArtifactStore:
+    """Pruebas del almacén en disco"""
+
+    def test_roundtrip(self, tmp_path):
+        """Test: Un PDF guardado se recupera con sus metadatos"""
+        store = PDFArtifactStore(str(tmp_path), max_bytes=1024)
+        key = catalog_fingerprint(make_df())
+        assert store.get(key) is None
+        assert store.put(key, b'%PDF-data', {'page_count': 3})
+
+        data, meta = store.get(key)
+        assert data == b'%PDF-data'
+        assert meta['page_count'] == 3
+        assert store.stats()['hits'] == 1
+        assert store.get('../../etc/passwd') is None
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        """Test: Por encima de max_bytes se expulsa el PDF usado hace más tiempo"""
+        store = PDFArtifactStore(str(tmp_path), max_bytes=250)
+        keys = [catalog_fingerprint(make_df(price=p)) for p in (1.0, 2.0, 3.0)]
+        store.put(keys[0], b'x' * 100)
+        store.put(keys[1], b'y' * 100)
+        old = time.time() - 60
+        os.utime(tmp_path / f"{keys[1]}.pdf", (old, old))
+        os.utime(tmp_path / f"{keys[0]}.pdf", (old + 30, old + 30))
+
+        store.put(keys[2], b'z' * 100)
+        assert store.get(keys[1]) is None
+        assert store.get(keys[0]) is not None
+        assert store.get(keys[2]) is not None
+        assert not store.put(catalog_fingerprint(make_df(price=9.0)), b'w' * 300)
+
+    def test_expired_entry_is_a_miss(self, tmp_path):
+        """Test: Pasado max_age el PDF se descarta"""
+        store = PDFArtifactStore(str(tmp_path), max_bytes=1024, max_age=0)
+        key = catalog_fingerprint(make_df())
+        store.put(key, b'%PDF-data')
+        time.sleep(0.01)
+        assert store.get(key) is None
+        assert not (tmp_path / f"{key}.pdf").exists()